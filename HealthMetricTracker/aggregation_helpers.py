@@ -1,91 +1,137 @@
 from datetime import date, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.orm import Session, aliased
 from models import DailyMetrics
-from typing import Dict, Any
+from changelog_helpers import get_latest_seq, record_changes
+from daily_series import DailySeries
+from typing import Dict, Any, Optional, Tuple
 
-def get_aggregated_stats(db: Session, selected_date: date) -> Dict[str, Any]:
+def get_aggregated_stats(db: Session, selected_date: date, series: Optional[DailySeries] = None) -> Dict[str, Any]:
     """
     Get aggregated statistics for weekly and monthly periods.
     
+    Args:
+        db: Database session
+        selected_date: Last day of both periods
+        series: Preloaded DailySeries covering the 30 days up to selected_date (loaded if omitted)
+    
     Returns:
         Dictionary with burn and deficit statistics for 7 and 30 day periods
     """
-    # Calculate date ranges
-    date_7_days_ago = selected_date - timedelta(days=6)  # Include selected_date
-    date_30_days_ago = selected_date - timedelta(days=29)  # Include selected_date
-    
-    # Get 7-day data
-    last_7_days = db.query(DailyMetrics).filter(
-        DailyMetrics.date >= date_7_days_ago,
-        DailyMetrics.date <= selected_date
-    ).all()
-    
-    # Get 30-day data
-    last_30_days = db.query(DailyMetrics).filter(
-        DailyMetrics.date >= date_30_days_ago,
-        DailyMetrics.date <= selected_date
-    ).all()
-    
-    # Calculate 7-day stats (include all days in averages, treating missing as 0)
-    burn_7 = sum(m.calories_burned_total or 0 for m in last_7_days)
-    eaten_7 = sum(m.calories_eaten or 0 for m in last_7_days)
-    # For deficits, only include days with burn data to avoid skewing
-    deficits_7 = [(m.calories_eaten or 0) - (m.calories_burned_total or 0) for m in last_7_days if m.calories_burned_total is not None]
-    weights_7 = [m.weight_kg for m in last_7_days if m.weight_kg is not None]
-    protein_7 = [m.protein_total_g for m in last_7_days if m.protein_total_g is not None]
-    
-    # Average over 7 days for burn/eaten, but only over days with data for weight/protein/deficit
-    avg_burn_7 = burn_7 / 7.0  # Always divide by 7 days
-    avg_eaten_7 = eaten_7 / 7.0  # Always divide by 7 days
-    avg_deficit_7 = sum(deficits_7) / len(deficits_7) if deficits_7 else 0
-    avg_weight_7 = sum(weights_7) / len(weights_7) if weights_7 else None
-    avg_protein_7 = sum(protein_7) / len(protein_7) if protein_7 else None
-    
-    # Calculate 30-day stats (include all days in averages, treating missing as 0)
-    burn_30 = sum(m.calories_burned_total or 0 for m in last_30_days)
-    eaten_30 = sum(m.calories_eaten or 0 for m in last_30_days)
-    # For deficits, only include days with burn data to avoid skewing
-    deficits_30 = [(m.calories_eaten or 0) - (m.calories_burned_total or 0) for m in last_30_days if m.calories_burned_total is not None]
-    weights_30 = [m.weight_kg for m in last_30_days if m.weight_kg is not None]
-    protein_30 = [m.protein_total_g for m in last_30_days if m.protein_total_g is not None]
+    if series is None:
+        series = DailySeries.load(db, selected_date - timedelta(days=29), selected_date)
     
-    # Average over 30 days for burn/eaten, but only over days with data for weight/protein/deficit
-    avg_burn_30 = burn_30 / 30.0  # Always divide by 30 days
-    avg_eaten_30 = eaten_30 / 30.0  # Always divide by 30 days
-    avg_deficit_30 = sum(deficits_30) / len(deficits_30) if deficits_30 else 0
-    avg_weight_30 = sum(weights_30) / len(weights_30) if weights_30 else None
-    avg_protein_30 = sum(protein_30) / len(protein_30) if protein_30 else None
+    stats = {}
+    for days in (7, 30):
+        # Totals include all days, treating missing as 0
+        burn = series.window_sum('calories_burned_total', selected_date, days)
+        eaten = series.window_sum('calories_eaten', selected_date, days)
+        # For deficits, only include days with burn data to avoid skewing
+        deficits = [(eaten_day if eaten_day == eaten_day else 0.0) - burn_day
+                    for eaten_day, burn_day in series.window_pairs('calories_eaten', 'calories_burned_total',
+                                                                   selected_date, days)
+                    if burn_day == burn_day]
+        
+        stats[days] = {
+            'burn': burn,
+            'eaten': eaten,
+            # Average over all days for burn/eaten, but only over days with data for weight/protein/deficit
+            'avg_burn': burn / float(days),
+            'avg_eaten': eaten / float(days),
+            'avg_deficit': sum(deficits) / len(deficits) if deficits else 0,
+            'avg_weight': series.window_mean('weight_kg', selected_date, days),
+            'avg_protein': series.window_mean('protein_total_g', selected_date, days),
+        }
     
     return {
         # 7-day totals
-        'burn_last_7_days': burn_7,
-        'eaten_last_7_days': eaten_7,
+        'burn_last_7_days': stats[7]['burn'],
+        'eaten_last_7_days': stats[7]['eaten'],
         
         # 7-day averages
-        'avg_calories_burned_last_7_days': avg_burn_7,
-        'avg_calories_eaten_last_7_days': avg_eaten_7,
-        'avg_daily_deficit_last_7_days': avg_deficit_7,
-        'avg_weight_last_7_days': avg_weight_7,
-        'avg_protein_last_7_days': avg_protein_7,
+        'avg_calories_burned_last_7_days': stats[7]['avg_burn'],
+        'avg_calories_eaten_last_7_days': stats[7]['avg_eaten'],
+        'avg_daily_deficit_last_7_days': stats[7]['avg_deficit'],
+        'avg_weight_last_7_days': stats[7]['avg_weight'],
+        'avg_protein_last_7_days': stats[7]['avg_protein'],
         
         # 30-day totals
-        'burn_last_30_days': burn_30,
-        'eaten_last_30_days': eaten_30,
+        'burn_last_30_days': stats[30]['burn'],
+        'eaten_last_30_days': stats[30]['eaten'],
         
         # 30-day averages
-        'avg_calories_burned_last_30_days': avg_burn_30,
-        'avg_calories_eaten_last_30_days': avg_eaten_30,
-        'avg_daily_deficit_last_30_days': avg_deficit_30,
-        'avg_weight_last_30_days': avg_weight_30,
-        'avg_protein_last_30_days': avg_protein_30,
+        'avg_calories_burned_last_30_days': stats[30]['avg_burn'],
+        'avg_calories_eaten_last_30_days': stats[30]['avg_eaten'],
+        'avg_daily_deficit_last_30_days': stats[30]['avg_deficit'],
+        'avg_weight_last_30_days': stats[30]['avg_weight'],
+        'avg_protein_last_30_days': stats[30]['avg_protein'],
     }
 
 def get_recent_weight(db: Session, before_date: date) -> float:
-    """Get the most recent weight before a given date."""
-    metric = db.query(DailyMetrics).filter(
-        DailyMetrics.date < before_date,
+    """
+    Get the most recent weight before a given date.
+    
+    Reads effective_weight_kg of the latest stored day before before_date, which
+    already carries the last recorded weight forward.
+    """
+    return db.query(DailyMetrics.effective_weight_kg).filter(
+        DailyMetrics.date < before_date
+    ).order_by(DailyMetrics.date.desc()).limit(1).scalar()
+
+def refresh_effective_weights(db: Session, start_date: date,
+                              end_date: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """
+    Recompute effective_weight_kg after weights changed between start_date and end_date.
+    
+    A weight carries forward to every later day until the next recorded weight, so one
+    UPDATE covers start_date up to the first weighed day after end_date (or the rest of
+    history). Each day's value is a correlated lookup on the weighed-days index, and
+    only rows whose value actually changes are written. The caller commits.
+    
+    Args:
+        db: Database session
+        start_date: First day whose weight (or row) changed
+        end_date: Last day whose weight changed (defaults to start_date)
+    
+    Returns:
+        (first, last) date of the rows updated, or None when none changed; callers
+        backfill protein targets over it, since the fallback reads effective_weight_kg
+    """
+    end_date = end_date or start_date
+    db.flush()  # the session doesn't autoflush, and pending weight edits must be visible
+    next_weighed = db.query(func.min(DailyMetrics.date)).filter(
+        DailyMetrics.date > end_date,
         DailyMetrics.weight_kg.isnot(None)
-    ).order_by(DailyMetrics.date.desc()).first()
+    ).scalar()
+    
+    weighed = aliased(DailyMetrics)
+    carried_weight = select(weighed.weight_kg).where(
+        weighed.date <= DailyMetrics.date,
+        weighed.weight_kg.isnot(None)
+    ).order_by(weighed.date.desc()).limit(1).scalar_subquery()
     
-    return metric.weight_kg if metric else None
+    stale = and_(
+        DailyMetrics.date >= start_date,
+        DailyMetrics.date < next_weighed if next_weighed is not None else True,
+        DailyMetrics.effective_weight_kg.is_distinct_from(carried_weight)
+    )
+    stale_dates = [d for (d,) in db.query(DailyMetrics.date).filter(stale)]
+    if not stale_dates:
+        return None
+    
+    db.execute(
+        update(DailyMetrics).where(stale).values(effective_weight_kg=carried_weight)
+        .execution_options(synchronize_session="fetch")
+    )
+    record_changes(db, DailyMetrics.__tablename__, stale_dates, ["effective_weight_kg"])
+    return min(stale_dates), max(stale_dates)
+
+def get_data_version(db: Session) -> int:
+    """
+    Get a cheap token that changes whenever DailyMetrics data changes.
+    
+    Used as part of cache keys for derived views (charts, projections). It is the latest
+    change-log sequence number for daily_metrics, a single index lookup however much
+    history is stored.
+    """
+    return get_latest_seq(db, [DailyMetrics.__tablename__])
@@ -0,0 +1,633 @@
+"""
+Headless JSON API over the helper layer, for phone shortcuts and watch automations.
+
+Runs as a separate process next to the Streamlit app and shares the same database, so a
+write costs one helper call instead of a full Streamlit rerun. Requests are validated
+against the schemas below, and helper calls run on a thread pool sized to the engine's
+connection pool, each with its own session from get_db.
+
+Usage:
+    python api.py [--host 127.0.0.1] [--port 8000]
+
+Set HEALTH_API_TOKEN to require an "Authorization: Bearer <token>" header on every request.
+Job parameters naming server files (import_directory, import_foods) are only accepted with a
+token set, and must resolve inside HEALTH_IMPORT_ROOT.
+
+Endpoints:
+    GET    /health
+    GET    /metrics                  Prometheus text format (see telemetry)
+    GET    /days?start=&end=         days with calorie_balance and is_over_target, filtered and
+           [&over_target=1]          ordered in SQL (order: date, surplus or deficit)
+           [&order=][&limit=]
+    GET    /days/{date}              stored DailyMetrics values
+    PUT    /days                     upsert_metrics for many days ({"days": [{"date": ..., ...}]}),
+                                     returning per-day 'created'/'changed' flags
+    PUT    /days/{date}              upsert_metrics for one day, returning the stored values
+    GET    /days/{date}/summary      get_daily_summary
+    GET    /days/{date}/entries      calorie entries for the day
+    GET    /days/{date}/similar      the most similar earlier days and the weight change after
+           [?k=][&features=a,b]      them (see similarity_helpers)
+    GET    /summaries?start=&end=    get_daily_summaries for a date range
+    POST   /entries                  add_calorie_entry
+    DELETE /entries/{id}[?date=]     delete_calorie_entry, only matching the id on date when given
+    GET    /foods?q=[&limit=]        search_foods over the imported nutrition database
+    POST   /samples                  ingest_samples ({"series": {"steps": [[epoch or ISO time, value], ...]}}),
+                                     rolling the affected days up into DailyMetrics
+    GET    /samples?series=&start=   one series' intraday samples over up to MAX_SAMPLE_DAYS days
+           [&end=]
+    GET    /settings                 user settings
+    PATCH  /settings                 update_settings; queues a target recalculation job when
+                                     a target-affecting field changes
+    GET    /jobs                     recent background jobs
+    POST   /jobs                     submit_job ({"kind": ..., "params": {...}})
+    GET    /jobs/{id}                one job's status and progress
+    POST   /jobs/{id}/cancel         cancel_job
+"""
+import argparse
+import hmac
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+from enum import Enum
+from functools import partial
+from typing import Any, Callable, Dict, List
+import tornado.ioloop
+import tornado.web
+from database import engine, get_db, init_db
+from models import DailyMetrics, WeightMode
+from calorie_helpers import (
+    get_calorie_entries,
+    add_calorie_entry,
+    delete_calorie_entry,
+    get_daily_summary,
+    get_daily_summaries,
+    upsert_metrics
+)
+from settings_helpers import get_or_create_settings, update_settings
+from history_helpers import BALANCE_ORDERS, get_balance_days
+from nutrition_helpers import SEARCH_LIMIT, search_foods
+from timeseries_helpers import SERIES as SAMPLE_SERIES, get_samples, ingest_samples
+from similarity_helpers import DEFAULT_NEIGHBOURS, FEATURES as SIMILARITY_FEATURES, SimilarDaysIndex
+from job_helpers import JOB_KINDS, ServerPath, submit_job, cancel_job, get_job, list_jobs, job_to_dict, recover_jobs
+from backup_helpers import start_backup_scheduler
+from changelog_helpers import process_consumer, start_prune_scheduler
+from telemetry import REQUEST_DURATION, render_metrics
+
+API_TOKEN = os.environ.get("HEALTH_API_TOKEN")
+# Directory that job parameters naming server files must resolve into; unless both it and
+# API_TOKEN are set, jobs that read server files can only be started from the app
+IMPORT_ROOT = os.environ.get("HEALTH_IMPORT_ROOT")
+
+# Field name -> (type, required). Unknown fields are rejected.
+METRIC_SCHEMA = {
+    "steps": (int, False),
+    "weight_kg": (float, False),
+    "calories_burned_total": (float, False),
+    "calories_burned_active": (float, False),
+    "calories_burned_basal": (float, False),
+    "daily_calorie_target": (float, False),
+    "protein_target_g": (float, False),
+    "mode": (WeightMode, False),
+}
+
+ENTRY_SCHEMA = {
+    "date": (date, True),
+    "time": (time, False),
+    "description": (str, False),
+    "calories": (float, True),
+    "protein_g": (float, False),
+    "place": (str, False),
+    "star_flag": (str, False),
+    "vl_flag": (str, False),
+    "planned_slot": (str, False),
+    "context_comments": (str, False),
+}
+
+SETTINGS_SCHEMA = {
+    "maintenance_calories": (float, False),
+    "current_mode": (WeightMode, False),
+    "deficit_gentle": (float, False),
+    "deficit_standard": (float, False),
+    "deficit_aggressive": (float, False),
+    "maintenance_window_days": (int, False),
+    "loss_gentle_percent": (float, False),
+    "loss_standard_percent": (float, False),
+    "loss_aggressive_percent": (float, False),
+}
+
+DAY_SCHEMA = {"date": (date, True), **METRIC_SCHEMA}
+
+DAYS_SCHEMA = {
+    "days": (list, True),
+}
+
+SAMPLES_SCHEMA = {
+    "series": (dict, True),
+}
+
+JOB_SCHEMA = {
+    "kind": (str, True),
+    "params": (dict, False),
+}
+
+# Settings whose change moves every stored calorie target
+TARGET_SETTINGS = {"maintenance_calories", "maintenance_window_days",
+                   "loss_gentle_percent", "loss_standard_percent", "loss_aggressive_percent"}
+
+MAX_SUMMARY_DAYS = 3660
+MAX_BATCH_DAYS = 3660
+MAX_FOOD_RESULTS = 50
+MAX_SAMPLES = 5_000_000
+MAX_SAMPLE_DAYS = 31
+MAX_NEIGHBOURS = 100
+
+PERCENT_FIELDS = {"loss_gentle_percent", "loss_standard_percent", "loss_aggressive_percent"}
+
+
+class ValidationError(Exception):
+    def __init__(self, errors: Dict[str, str]):
+        super().__init__("Invalid request")
+        self.errors = errors
+
+
+def _coerce(value: Any, field_type: type) -> Any:
+    if value is None:
+        return None
+    if field_type is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("must be a number")
+        if not math.isfinite(value):
+            raise ValueError("must be a finite number")
+        if value < 0:
+            raise ValueError("must not be negative")
+        return float(value)
+    if field_type is int:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("must be a whole number")
+        if not math.isfinite(value) or value != int(value):
+            raise ValueError("must be a whole number")
+        if value < 0:
+            raise ValueError("must not be negative")
+        return int(value)
+    if field_type is bool:
+        if not isinstance(value, bool):
+            raise ValueError("must be true or false")
+        return value
+    if field_type is ServerPath:
+        if not isinstance(value, str):
+            raise ValueError("must be a string")
+        if not (IMPORT_ROOT and API_TOKEN):
+            raise ValueError("server paths need HEALTH_IMPORT_ROOT and HEALTH_API_TOKEN set")
+        root = os.path.realpath(IMPORT_ROOT)
+        path = os.path.realpath(os.path.join(root, value))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError("must be inside HEALTH_IMPORT_ROOT")
+        return ServerPath(path)
+    if field_type is str:
+        if not isinstance(value, str):
+            raise ValueError("must be a string")
+        return value
+    if field_type is list:
+        if not isinstance(value, list):
+            raise ValueError("must be an array")
+        return value
+    if field_type is dict:
+        if not isinstance(value, dict):
+            raise ValueError("must be an object")
+        return value
+    if field_type is date:
+        return date.fromisoformat(value)
+    if field_type is time:
+        return time.fromisoformat(value)
+    if field_type is WeightMode:
+        return WeightMode(value)
+    raise ValueError(f"unsupported type {field_type}")
+
+
+def validate(payload: Any, schema: Dict[str, tuple]) -> Dict[str, Any]:
+    """Check a JSON body against a schema and return the coerced values."""
+    if not isinstance(payload, dict):
+        raise ValidationError({"body": "must be a JSON object"})
+
+    errors = {}
+    values = {}
+    for field in payload:
+        if field not in schema:
+            errors[field] = "unknown field"
+    for field, (field_type, required) in schema.items():
+        if field not in payload:
+            if required:
+                errors[field] = "is required"
+            continue
+        try:
+            values[field] = _coerce(payload[field], field_type)
+        except (ValueError, TypeError, OverflowError) as e:
+            errors[field] = str(e) or "invalid value"
+        if required and field in values and values[field] is None:
+            errors[field] = "is required"
+        if field in PERCENT_FIELDS and values.get(field) is not None and values[field] >= 1:
+            errors[field] = "must be a fraction below 1, e.g. 0.15"
+
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def to_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: to_json(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def row_to_dict(obj) -> Dict[str, Any]:
+    """Serialize an ORM object's columns (while its session is still open)."""
+    return {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+
+
+def call_with_session(fn: Callable, *args) -> Any:
+    """Run fn(db, *args) with a session from get_db, closing it afterwards."""
+    sessions = get_db()
+    db = next(sessions)
+    try:
+        return fn(db, *args)
+    finally:
+        sessions.close()
+
+
+# One worker per pooled connection so requests never queue on the pool inside a thread
+executor = ThreadPoolExecutor(max_workers=engine.pool.size() if hasattr(engine.pool, "size") else 5)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def prepare(self):
+        if API_TOKEN:
+            supplied = self.request.headers.get("Authorization", "")
+            if not hmac.compare_digest(supplied, f"Bearer {API_TOKEN}"):
+                self.send_json({"error": "unauthorized"}, status=401)
+                self.finish()
+
+    def on_finish(self):
+        REQUEST_DURATION.observe(self.request.request_time(), handler=type(self).__name__,
+                                 method=self.request.method, status=self.get_status())
+
+    def json_body(self) -> Any:
+        try:
+            return json.loads(self.request.body or b"null")
+        except json.JSONDecodeError:
+            raise ValidationError({"body": "must be valid JSON"})
+
+    def parse_date(self, value: str) -> date:
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({"date": "must be an ISO date (YYYY-MM-DD)"})
+
+    async def run(self, fn: Callable, *args) -> Any:
+        loop = tornado.ioloop.IOLoop.current()
+        return await loop.run_in_executor(executor, partial(call_with_session, fn, *args))
+
+    def send_json(self, payload: Any, status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(to_json(payload)))
+
+    def write_error(self, status_code: int, **kwargs):
+        error = kwargs.get("exc_info", (None, None))[1]
+        if isinstance(error, ValidationError):
+            self.send_json({"error": "validation failed", "fields": error.errors}, status=422)
+        else:
+            self.send_json({"error": self._reason}, status=status_code)
+
+    def log_exception(self, typ, value, tb):
+        if not isinstance(value, ValidationError):
+            super().log_exception(typ, value, tb)
+
+    def send_error(self, status_code: int = 500, **kwargs):
+        if isinstance(kwargs.get("exc_info", (None, None))[1], ValidationError):
+            status_code = 422
+        super().send_error(status_code, **kwargs)
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.send_json({"status": "ok"})
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render_metrics())
+
+
+def _get_day(db, day: date):
+    metric = db.query(DailyMetrics).filter(DailyMetrics.date == day).first()
+    return row_to_dict(metric) if metric else None
+
+
+def _upsert_day(db, day: date, values: Dict[str, Any]):
+    upsert_metrics(db, [{"date": day, **values}])
+    return _get_day(db, day)
+
+
+def validate_days(payload: Any) -> List[Dict[str, Any]]:
+    """Validate a PUT /days body: every day against DAY_SCHEMA, dates unique."""
+    days = validate(payload, DAYS_SCHEMA)["days"]
+    if not 0 < len(days) <= MAX_BATCH_DAYS:
+        raise ValidationError({"days": f"must hold 1 to {MAX_BATCH_DAYS} days"})
+
+    errors = {}
+    rows = []
+    seen = set()
+    for i, day in enumerate(days):
+        try:
+            row = validate(day, DAY_SCHEMA)
+        except ValidationError as e:
+            errors.update({f"days[{i}].{field}": message for field, message in e.errors.items()})
+            continue
+        if row["date"] in seen:
+            errors[f"days[{i}].date"] = "is repeated"
+        seen.add(row["date"])
+        rows.append(row)
+    if errors:
+        raise ValidationError(errors)
+    return rows
+
+
+def _list_days(db, start: date, end: date, order: str, over_target_only: bool, limit: int):
+    return [{**row._asdict(), "is_over_target": bool(row.is_over_target)}
+            for row in get_balance_days(db, start, end, order, over_target_only, limit)]
+
+
+class DaysHandler(BaseHandler):
+    async def get(self):
+        start = self.parse_date(self.get_query_argument("start", ""))
+        end = self.parse_date(self.get_query_argument("end", ""))
+        order = self.get_query_argument("order", "date")
+        over_target_only = self.get_query_argument("over_target", "0") in ("1", "true")
+        try:
+            limit = int(self.get_query_argument("limit", str(MAX_BATCH_DAYS)))
+        except ValueError:
+            raise ValidationError({"limit": "must be an integer"})
+        if end < start:
+            raise ValidationError({"end": "must be on or after start"})
+        if order not in BALANCE_ORDERS:
+            raise ValidationError({"order": f"must be one of {', '.join(BALANCE_ORDERS)}"})
+        if not 0 < limit <= MAX_BATCH_DAYS:
+            raise ValidationError({"limit": f"must be 1 to {MAX_BATCH_DAYS}"})
+        self.send_json(await self.run(_list_days, start, end, order, over_target_only, limit))
+
+    async def put(self):
+        rows = validate_days(self.json_body())
+        self.send_json({"results": await self.run(upsert_metrics, rows)})
+
+
+class DayHandler(BaseHandler):
+    async def get(self, day: str):
+        result = await self.run(_get_day, self.parse_date(day))
+        if result is None:
+            raise tornado.web.HTTPError(404, reason="no data for this date")
+        self.send_json(result)
+
+    async def put(self, day: str):
+        values = validate(self.json_body(), METRIC_SCHEMA)
+        self.send_json(await self.run(_upsert_day, self.parse_date(day), values))
+
+
+class SummaryHandler(BaseHandler):
+    async def get(self, day: str):
+        self.send_json(await self.run(get_daily_summary, self.parse_date(day)))
+
+
+class SummariesHandler(BaseHandler):
+    async def get(self):
+        start = self.parse_date(self.get_query_argument("start", ""))
+        end = self.parse_date(self.get_query_argument("end", ""))
+        if end < start or (end - start).days >= MAX_SUMMARY_DAYS:
+            raise ValidationError({"end": f"must be on or after start and within {MAX_SUMMARY_DAYS} days"})
+        self.send_json(await self.run(get_daily_summaries, start, end))
+
+
+def _get_entries(db, day: date):
+    return [row_to_dict(entry) for entry in get_calorie_entries(db, day)]
+
+
+def _add_entry(db, values: Dict[str, Any]):
+    entry = add_calorie_entry(
+        db, values.pop("date"), values.pop("time", None), values.pop("description", None),
+        values.pop("calories"), **values
+    )
+    return row_to_dict(entry)
+
+
+class DayEntriesHandler(BaseHandler):
+    async def get(self, day: str):
+        self.send_json(await self.run(_get_entries, self.parse_date(day)))
+
+
+# Kept for the life of the process so each query only reloads the days changed since the last one
+similar_days_index = SimilarDaysIndex(consumer=process_consumer("similar_days"))
+
+
+def _similar_days(db, day: date, k: int, features: List[str]):
+    similar_days_index.refresh(db)
+    return similar_days_index.query(day, k, features)
+
+
+class SimilarDaysHandler(BaseHandler):
+    async def get(self, day: str):
+        day = self.parse_date(day)
+        try:
+            k = int(self.get_query_argument("k", str(DEFAULT_NEIGHBOURS)))
+        except ValueError:
+            raise ValidationError({"k": "must be an integer"})
+        if not 0 < k <= MAX_NEIGHBOURS:
+            raise ValidationError({"k": f"must be 1 to {MAX_NEIGHBOURS}"})
+        features = [f for f in self.get_query_argument("features", "").split(",") if f] or list(SIMILARITY_FEATURES)
+        unknown = [f for f in features if f not in SIMILARITY_FEATURES]
+        if unknown:
+            raise ValidationError({"features": f"must be among {', '.join(SIMILARITY_FEATURES)}"})
+        result = await self.run(_similar_days, day, k, features)
+        if result is None:
+            raise tornado.web.HTTPError(404, reason="not enough data for this date")
+        self.send_json(result)
+
+
+class EntriesHandler(BaseHandler):
+    async def post(self):
+        values = validate(self.json_body(), ENTRY_SCHEMA)
+        self.send_json(await self.run(_add_entry, values), status=201)
+
+
+class EntryHandler(BaseHandler):
+    async def delete(self, entry_id: str):
+        day = self.get_query_argument("date", None)
+        entry_date = self.parse_date(day) if day else None
+        if not await self.run(delete_calorie_entry, int(entry_id), entry_date):
+            raise tornado.web.HTTPError(404, reason="entry not found")
+        self.set_status(204)
+
+
+def _get_settings(db):
+    return row_to_dict(get_or_create_settings(db))
+
+
+def _update_settings(db, values: Dict[str, Any]):
+    result = row_to_dict(update_settings(db, **values))
+    if TARGET_SETTINGS & values.keys():
+        # Recalculating every target can take a while, so it runs as a background job
+        result["recalculate_job_id"] = submit_job(db, "recalculate_targets").id
+    return result
+
+
+class FoodsHandler(BaseHandler):
+    async def get(self):
+        query = self.get_query_argument("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "is required"})
+        try:
+            limit = int(self.get_query_argument("limit", str(SEARCH_LIMIT)))
+        except ValueError:
+            raise ValidationError({"limit": "must be an integer"})
+        if not 0 < limit <= MAX_FOOD_RESULTS:
+            raise ValidationError({"limit": f"must be 1 to {MAX_FOOD_RESULTS}"})
+        self.send_json(await self.run(search_foods, query, limit))
+
+
+def validate_samples(payload: Any) -> Dict[str, list]:
+    """Check a POST /samples body's shape; timestamps and values are checked by ingest_samples."""
+    series = validate(payload, SAMPLES_SCHEMA)["series"]
+    errors = {}
+    for name, pairs in series.items():
+        if name not in SAMPLE_SERIES:
+            errors[f"series.{name}"] = f"must be one of {sorted(SAMPLE_SERIES)}"
+        elif not isinstance(pairs, list) or not all(isinstance(pair, list) and len(pair) == 2 for pair in pairs):
+            errors[f"series.{name}"] = "must be an array of [time, value] pairs"
+    if not errors and not 0 < sum(len(pairs) for pairs in series.values()) <= MAX_SAMPLES:
+        errors["series"] = f"must hold 1 to {MAX_SAMPLES} samples"
+    if errors:
+        raise ValidationError(errors)
+    return series
+
+
+def _ingest_samples(db, series: Dict[str, list]):
+    try:
+        return ingest_samples(db, series)
+    except ValueError as e:
+        raise ValidationError({"series": str(e)})
+
+
+class SamplesHandler(BaseHandler):
+    async def get(self):
+        series = self.get_query_argument("series", "")
+        if series not in SAMPLE_SERIES:
+            raise ValidationError({"series": f"must be one of {sorted(SAMPLE_SERIES)}"})
+        start = self.parse_date(self.get_query_argument("start", ""))
+        end = self.parse_date(self.get_query_argument("end", start.isoformat()))
+        if end < start or (end - start).days >= MAX_SAMPLE_DAYS:
+            raise ValidationError({"end": f"must be on or after start and within {MAX_SAMPLE_DAYS} days"})
+        self.send_json(await self.run(get_samples, series, start, end))
+
+    async def post(self):
+        series = validate_samples(self.json_body())
+        self.send_json(await self.run(_ingest_samples, series))
+
+
+class SettingsHandler(BaseHandler):
+    async def get(self):
+        self.send_json(await self.run(_get_settings))
+
+    async def patch(self):
+        values = validate(self.json_body(), SETTINGS_SCHEMA)
+        self.send_json(await self.run(_update_settings, values))
+
+
+def _list_jobs(db):
+    return [job_to_dict(job) for job in list_jobs(db, limit=50)]
+
+
+def _get_job(db, job_id: int):
+    job = get_job(db, job_id)
+    return job_to_dict(job) if job else None
+
+
+def _submit_job(db, values: Dict[str, Any]):
+    return job_to_dict(submit_job(db, values["kind"], values["params"]))
+
+
+class JobsHandler(BaseHandler):
+    async def get(self):
+        self.send_json(await self.run(_list_jobs))
+
+    async def post(self):
+        values = validate(self.json_body(), JOB_SCHEMA)
+        if values["kind"] not in JOB_KINDS:
+            raise ValidationError({"kind": f"must be one of {sorted(JOB_KINDS)}"})
+        try:
+            values["params"] = validate(values.get("params") or {}, JOB_KINDS[values["kind"]][2])
+        except ValidationError as e:
+            raise ValidationError({f"params.{field}": error for field, error in e.errors.items()})
+        self.send_json(await self.run(_submit_job, values), status=202)
+
+
+class JobHandler(BaseHandler):
+    async def get(self, job_id: str):
+        result = await self.run(_get_job, int(job_id))
+        if result is None:
+            raise tornado.web.HTTPError(404, reason="job not found")
+        self.send_json(result)
+
+
+class JobCancelHandler(BaseHandler):
+    async def post(self, job_id: str):
+        if not await self.run(cancel_job, int(job_id)):
+            raise tornado.web.HTTPError(409, reason="job is not queued or running")
+        self.send_json(await self.run(_get_job, int(job_id)))
+
+
+def make_app() -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/health", HealthHandler),
+        (r"/metrics", MetricsHandler),
+        (r"/days", DaysHandler),
+        (r"/days/([0-9-]+)", DayHandler),
+        (r"/days/([0-9-]+)/summary", SummaryHandler),
+        (r"/days/([0-9-]+)/entries", DayEntriesHandler),
+        (r"/days/([0-9-]+)/similar", SimilarDaysHandler),
+        (r"/summaries", SummariesHandler),
+        (r"/entries", EntriesHandler),
+        (r"/entries/([0-9]+)", EntryHandler),
+        (r"/foods", FoodsHandler),
+        (r"/samples", SamplesHandler),
+        (r"/settings", SettingsHandler),
+        (r"/jobs", JobsHandler),
+        (r"/jobs/([0-9]+)", JobHandler),
+        (r"/jobs/([0-9]+)/cancel", JobCancelHandler),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Health Metrics JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    init_db()
+    call_with_session(recover_jobs)
+    start_backup_scheduler()
+    start_prune_scheduler()
+    app = make_app()
+    app.listen(args.port, address=args.host)
+    print(f"Health Metrics API listening on http://{args.host}:{args.port}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,18 @@
+import json
+import os
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+from functools import wraps
+from time import perf_counter
 from datetime import datetime, date, timedelta, time as dt_time
 from sqlalchemy.orm import Session
-from database import SessionLocal, init_db
+from database import SessionLocal
 from models import DailyMetrics, CalorieEntry, WeightMode
 from calorie_helpers import (
     get_calorie_entries, 
     add_calorie_entry, 
     delete_calorie_entry,
     get_daily_summary,
+    get_daily_summaries,
     upsert_metric,
     clear_day_data
 )
@@ -18,10 +20,23 @@ from settings_helpers import (
     get_or_create_settings,
     update_settings,
     compute_target_from_settings,
-    get_mode_display_name
+    get_mode_display_name,
+    get_settings_version
 )
+from aggregation_helpers import get_data_version
+from history_helpers import get_metrics_page, get_balance_days, count_over_target
+from nutrition_helpers import search_foods, get_food_portions, scale_food, has_foods
+from entry_pattern_helpers import DIMENSION_LABELS, format_dimension_value, get_dimension_values, get_entry_patterns
+from export_helpers import EXPORT_FORMATS, MIME_TYPES
+from job_helpers import JOB_KINDS, ACTIVE_STATUSES, submit_job, cancel_job, list_jobs, has_active_jobs
+from telemetry import RERUN_DURATION, FRAGMENT_DURATION, CACHE_REQUESTS, CACHE_MISSES
+from warmup import warm_up
 
-init_db()
+rerun_started = perf_counter()
+
+# plotly and numpy are only needed by the History stage and are imported there,
+# keeping them off the cold-start path (see bench_import_time.py)
+st.cache_resource(show_spinner=False)(warm_up)()
 
 st.set_page_config(page_title="Health Metrics Tracker", layout="centered")
 
@@ -135,392 +150,780 @@ def render_progress_dots(current):
     st.markdown(dots_html, unsafe_allow_html=True)
 
 selected_date = st.session_state.get('selected_date', date.today())
-existing_data = db.query(DailyMetrics).filter(DailyMetrics.date == selected_date).first()
-summary = get_daily_summary(db, selected_date)
 
-def auto_save_metrics():
+# Widget keys of the metric inputs on stages 2 and 3
+METRIC_WIDGETS = {
+    'weight_kg': 'metrics_weight',
+    'steps': 'metrics_steps',
+    'calories_burned_total': 'metrics_burn'
+}
+
+def auto_save_metrics(day, field):
+    """on_change callback: save only the edited field, leaving the day's other values alone."""
     try:
-        data = {
-            'date': selected_date,
-            'steps': st.session_state.get('metrics_steps', 0) if st.session_state.get('metrics_steps', 0) > 0 else None,
-            'weight_kg': st.session_state.get('metrics_weight', 0.0) if st.session_state.get('metrics_weight', 0.0) > 0 else None,
-            'calories_burned_total': st.session_state.get('metrics_burn', 0.0) if st.session_state.get('metrics_burn', 0.0) > 0 else None,
-            'mode': st.session_state.get('goal_mode', settings.current_mode)
-        }
+        value = st.session_state.get(METRIC_WIDGETS[field], 0)
+        data = {'date': day, field: value if value > 0 else None}
         protein_override = st.session_state.get('metrics_protein_target', 0.0)
         if protein_override > 0:
             data['protein_target_g'] = protein_override
-        upsert_metric(db, data)
+        with SessionLocal() as save_db:
+            upsert_metric(save_db, data)
         st.session_state.last_save_time = datetime.now()
         st.session_state.save_error = None
     except Exception as e:
         st.session_state.save_error = str(e)
 
-current_stage = st.session_state.stage
+def load_day_values(day, *columns):
+    """The stored values of a few DailyMetrics columns for one day (None when there's no row)."""
+    with SessionLocal() as day_db:
+        row = day_db.query(*(getattr(DailyMetrics, column) for column in columns)).filter(
+            DailyMetrics.date == day
+        ).first()
+    return tuple(row) if row else (None,) * len(columns)
 
-# ============================================================================
-# STAGE 1: DATE & GOAL
-# ============================================================================
-if current_stage == 1:
-    st.markdown('<div class="stage-header"><div class="stage-title">Select Date & Goal</div><div class="stage-subtitle">Choose the day you want to track</div></div>', unsafe_allow_html=True)
-    render_progress_dots(1)
-    
-    new_date = st.date_input(
-        "Date",
-        value=selected_date,
-        max_value=date.today(),
-        key="date_picker"
-    )
-    if new_date != selected_date:
-        st.session_state.selected_date = new_date
-        st.rerun()
-    
-    st.write("")
-    st.markdown("**Goal Mode**")
-    
-    mode_options = {
-        WeightMode.MAINTENANCE: "Maintenance - Eat to match burn",
-        WeightMode.LOSS_GENTLE: "Gentle Loss - Small deficit",
-        WeightMode.LOSS_STANDARD: "Standard Loss - Moderate deficit",
-        WeightMode.LOSS_AGGRESSIVE: "Aggressive Loss - Larger deficit"
-    }
-    current_mode = existing_data.mode if existing_data and existing_data.mode else settings.current_mode
-    
-    new_mode = st.radio(
-        "Choose your goal",
-        options=list(mode_options.keys()),
-        index=list(mode_options.keys()).index(current_mode),
-        format_func=lambda x: mode_options[x],
-        key="goal_mode",
-        label_visibility="collapsed"
-    )
-    
-    if new_mode != current_mode:
-        upsert_metric(db, {'date': selected_date, 'mode': new_mode})
-        st.session_state.last_save_time = datetime.now()
-    
-    st.write("")
-    col1, col2 = st.columns(2)
-    with col2:
-        if st.button("Next →", type="primary", use_container_width=True):
-            go_next()
-            st.rerun()
+def timed_fragment(name):
+    """st.fragment that also records each run's latency, so partial reruns show up in the metrics."""
+    def decorate(fn):
+        @st.fragment
+        @wraps(fn)
+        def run(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                FRAGMENT_DURATION.observe(perf_counter() - started, fragment=name)
+        return run
+    return decorate
 
-# ============================================================================
-# STAGE 2: WEIGHT
-# ============================================================================
-elif current_stage == 2:
-    st.markdown('<div class="stage-header"><div class="stage-title">Your Weight</div><div class="stage-subtitle">Morning weight works best</div></div>', unsafe_allow_html=True)
-    render_progress_dots(2)
-    
-    current_weight = float(existing_data.weight_kg) if existing_data and existing_data.weight_kg else 0.0
-    
-    weight = st.number_input(
-        "Weight (kg)",
-        min_value=0.0,
-        max_value=300.0,
-        value=current_weight,
-        step=0.1,
-        format="%.1f",
-        key="metrics_weight",
-        on_change=auto_save_metrics
-    )
-    
-    if weight > 0:
-        protein_auto = weight * 2
-        st.caption(f"Protein target will auto-set to {protein_auto:.0f}g (2g per kg)")
-    
-    st.write("")
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("← Back", use_container_width=True):
-            go_back()
-            st.rerun()
-    with col2:
-        if st.button("Next →", type="primary", use_container_width=True):
-            go_next()
-            st.rerun()
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_history_figures(from_date, to_date, data_version):
+    """Figure JSON for the History charts, rebuilt only when the range or data changes."""
+    from chart_helpers import build_history_figures
+    CACHE_MISSES.inc(cache="history_figures")
+    chart_db = SessionLocal()
+    try:
+        return build_history_figures(chart_db, from_date, to_date)
+    finally:
+        chart_db.close()
 
-# ============================================================================
-# STAGE 3: ACTIVITY
-# ============================================================================
-elif current_stage == 3:
-    st.markdown('<div class="stage-header"><div class="stage-title">Activity</div><div class="stage-subtitle">Your movement and energy burned</div></div>', unsafe_allow_html=True)
-    render_progress_dots(3)
-    
-    current_steps = existing_data.steps if existing_data and existing_data.steps else 0
-    current_burn = float(existing_data.calories_burned_total) if existing_data and existing_data.calories_burned_total else 0.0
-    
-    steps = st.number_input(
-        "Steps",
-        min_value=0,
-        value=current_steps,
-        step=500,
-        key="metrics_steps",
-        on_change=auto_save_metrics,
-        help="From your phone or fitness tracker"
-    )
-    
-    st.write("")
-    
-    burned = st.number_input(
-        "Total Calories Burned (kcal)",
-        min_value=0.0,
-        value=current_burn,
-        step=50.0,
-        format="%.0f",
-        key="metrics_burn",
-        on_change=auto_save_metrics,
-        help="Your total daily energy expenditure from watch/tracker"
-    )
-    
-    st.write("")
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("← Back", use_container_width=True):
-            go_back()
-            st.rerun()
-    with col2:
-        if st.button("Next →", type="primary", use_container_width=True):
-            go_next()
-            st.rerun()
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_weight_projection(weeks, today, data_version, settings_version):
+    """Monte Carlo projection and its chart JSON, rerun only when data or settings change."""
+    from projection_helpers import project_weight
+    from chart_helpers import build_projection_figure
+    CACHE_MISSES.inc(cache="weight_projection")
+    projection_db = SessionLocal()
+    try:
+        projection = project_weight(projection_db, weeks, today=today)
+    finally:
+        projection_db.close()
+    if projection:
+        labels = {mode.value: get_mode_display_name(mode) for mode in WeightMode}
+        projection['figure'] = build_projection_figure(projection, labels)
+    return projection
 
-# ============================================================================
-# STAGE 4: FOOD JOURNAL
-# ============================================================================
-elif current_stage == 4:
-    st.markdown('<div class="stage-header"><div class="stage-title">Food Journal</div><div class="stage-subtitle">Log what you ate</div></div>', unsafe_allow_html=True)
-    render_progress_dots(4)
-    
-    entries = get_calorie_entries(db, selected_date)
-    total_eaten = sum(e.calories for e in entries)
-    total_protein = sum(e.protein_g or 0 for e in entries)
+@st.cache_resource(show_spinner=False)
+def load_similarity_index():
+    """The similar-days feature index, built once per process and refreshed from the change log on use."""
+    from similarity_helpers import SimilarDaysIndex
+    from changelog_helpers import process_consumer
+    CACHE_MISSES.inc(cache="similarity_index")
+    return SimilarDaysIndex(consumer=process_consumer("similar_days"))
+
+def format_hour(value):
+    """'07:30' for a fractional hour, '' for None."""
+    if value is None:
+        return ""
+    minutes = round(value * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+# Seconds between job status refreshes while a background job is queued or running
+JOB_POLL_SECONDS = 1.5
+
+def render_jobs_panel(poll: bool):
+    """Recent background jobs; the fragment polls only while one is still active."""
+    @st.fragment(run_every=JOB_POLL_SECONDS if poll else None)
+    def jobs_panel():
+        jobs_db = SessionLocal()
+        try:
+            jobs = list_jobs(jobs_db, limit=5)
+            for job in jobs:
+                description = JOB_KINDS[job.kind][1] if job.kind in JOB_KINDS else job.kind
+                if job.status in ACTIVE_STATUSES:
+                    j1, j2 = st.columns([4, 1])
+                    with j1:
+                        st.progress(job.progress or 0.0, text=f"{description} · {job.message or job.status}")
+                    with j2:
+                        if st.button("Cancel", key=f"cancel_job_{job.id}", use_container_width=True):
+                            cancel_job(jobs_db, job.id)
+                            st.rerun(scope="fragment")
+                elif job.status == "succeeded":
+                    result = json.loads(job.result) if job.result else {}
+                    summary = ", ".join(f"{key.replace('_', ' ')}: {value}" for key, value in result.items()
+                                        if key not in ("path", "file_name"))
+                    st.caption(f"✓ {description} · {summary}")
+                    if job.kind == "export" and os.path.exists(result.get("path", "")):
+                        with open(result["path"], "rb") as export_file:
+                            st.download_button(
+                                f"Download {result['file_name']}", data=export_file,
+                                file_name=result["file_name"],
+                                mime=MIME_TYPES[json.loads(job.params)["format"]],
+                                key=f"download_job_{job.id}", use_container_width=True
+                            )
+                else:
+                    st.caption(f"✗ {description} · {job.status}{': ' + job.error if job.error else ''}")
+            if not jobs:
+                st.caption("No background jobs yet.")
+            if poll and not any(job.status in ACTIVE_STATUSES for job in jobs):
+                # Everything finished: one full rerun redraws the panel without polling
+                st.rerun()
+        finally:
+            jobs_db.close()
+    
+    jobs_panel()
+
+current_stage = st.session_state.stage
+
+# The stage bodies end in st.rerun() when navigating, which raises; record the rerun
+# and close the session in finally so those reruns are measured too
+try:
+    # ============================================================================
+    # STAGE 1: DATE & GOAL
+    # ============================================================================
+    if current_stage == 1:
+        st.markdown('<div class="stage-header"><div class="stage-title">Select Date & Goal</div><div class="stage-subtitle">Choose the day you want to track</div></div>', unsafe_allow_html=True)
+        render_progress_dots(1)
+    
+        new_date = st.date_input(
+            "Date",
+            value=selected_date,
+            max_value=date.today(),
+            key="date_picker"
+        )
+        if new_date != selected_date:
+            st.session_state.selected_date = new_date
+            st.rerun()
     
-    st.markdown(f"**Today so far:** {total_eaten:,.0f} kcal · {total_protein:.0f}g protein")
+        st.write("")
+        st.markdown("**Goal Mode**")
     
-    st.divider()
+        mode_options = {
+            WeightMode.MAINTENANCE: "Maintenance - Eat to match burn",
+            WeightMode.LOSS_GENTLE: "Gentle Loss - Small deficit",
+            WeightMode.LOSS_STANDARD: "Standard Loss - Moderate deficit",
+            WeightMode.LOSS_AGGRESSIVE: "Aggressive Loss - Larger deficit"
+        }
+        (day_mode,) = load_day_values(selected_date, 'mode')
+        current_mode = day_mode or settings.current_mode
+    
+        new_mode = st.radio(
+            "Choose your goal",
+            options=list(mode_options.keys()),
+            index=list(mode_options.keys()).index(current_mode),
+            format_func=lambda x: mode_options[x],
+            key="goal_mode",
+            label_visibility="collapsed"
+        )
+    
+        if new_mode != current_mode:
+            upsert_metric(db, {'date': selected_date, 'mode': new_mode})
+            st.session_state.last_save_time = datetime.now()
+    
+        st.write("")
+        col1, col2 = st.columns(2)
+        with col2:
+            if st.button("Next →", type="primary", use_container_width=True):
+                go_next()
+                st.rerun()
+
+    # ============================================================================
+    # STAGE 2: WEIGHT
+    # ============================================================================
+    elif current_stage == 2:
+        st.markdown('<div class="stage-header"><div class="stage-title">Your Weight</div><div class="stage-subtitle">Morning weight works best</div></div>', unsafe_allow_html=True)
+        render_progress_dots(2)
+    
+        @timed_fragment("weight")
+        def weight_input(day):
+            # Editing the weight reruns only this fragment
+            (stored_weight,) = load_day_values(day, 'weight_kg')
+            weight = st.number_input(
+                "Weight (kg)",
+                min_value=0.0,
+                max_value=300.0,
+                value=float(stored_weight) if stored_weight else 0.0,
+                step=0.1,
+                format="%.1f",
+                key="metrics_weight",
+                on_change=auto_save_metrics,
+                args=(day, 'weight_kg')
+            )
+        
+            if weight > 0:
+                protein_auto = weight * 2
+                st.caption(f"Protein target will auto-set to {protein_auto:.0f}g (2g per kg)")
+    
+        weight_input(selected_date)
+    
+        st.write("")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("← Back", use_container_width=True):
+                go_back()
+                st.rerun()
+        with col2:
+            if st.button("Next →", type="primary", use_container_width=True):
+                go_next()
+                st.rerun()
+
+    # ============================================================================
+    # STAGE 3: ACTIVITY
+    # ============================================================================
+    elif current_stage == 3:
+        st.markdown('<div class="stage-header"><div class="stage-title">Activity</div><div class="stage-subtitle">Your movement and energy burned</div></div>', unsafe_allow_html=True)
+        render_progress_dots(3)
+    
+        @timed_fragment("activity")
+        def activity_inputs(day):
+            stored_steps, stored_burn = load_day_values(day, 'steps', 'calories_burned_total')
+        
+            st.number_input(
+                "Steps",
+                min_value=0,
+                value=stored_steps or 0,
+                step=500,
+                key="metrics_steps",
+                on_change=auto_save_metrics,
+                args=(day, 'steps'),
+                help="From your phone or fitness tracker"
+            )
+        
+            st.write("")
+        
+            st.number_input(
+                "Total Calories Burned (kcal)",
+                min_value=0.0,
+                value=float(stored_burn) if stored_burn else 0.0,
+                step=50.0,
+                format="%.0f",
+                key="metrics_burn",
+                on_change=auto_save_metrics,
+                args=(day, 'calories_burned_total'),
+                help="Your total daily energy expenditure from watch/tracker"
+            )
+    
+        activity_inputs(selected_date)
+    
+        st.write("")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("← Back", use_container_width=True):
+                go_back()
+                st.rerun()
+        with col2:
+            if st.button("Next →", type="primary", use_container_width=True):
+                go_next()
+                st.rerun()
+
+    # ============================================================================
+    # STAGE 4: FOOD JOURNAL
+    # ============================================================================
+    elif current_stage == 4:
+        st.markdown('<div class="stage-header"><div class="stage-title">Food Journal</div><div class="stage-subtitle">Log what you ate</div></div>', unsafe_allow_html=True)
+        render_progress_dots(4)
+    
+        def add_entry(day):
+            """Form callback: runs before the fragment reruns, so the list below already shows the entry."""
+            if st.session_state.entry_cal > 0:
+                with SessionLocal() as entry_db:
+                    add_calorie_entry(
+                        entry_db, day, st.session_state.entry_time, st.session_state.entry_desc,
+                        st.session_state.entry_cal,
+                        protein_g=st.session_state.entry_prot if st.session_state.entry_prot > 0 else None,
+                        place=st.session_state.entry_place or None,
+                        star_flag=st.session_state.entry_star or None,
+                        vl_flag=st.session_state.entry_vl or None,
+                        planned_slot=st.session_state.entry_slot,
+                        context_comments=st.session_state.entry_comments or None
+                    )
     
-    with st.expander("➕ Add food entry", expanded=len(entries) == 0):
-        with st.form("add_entry_form", clear_on_submit=True):
-            entry_desc = st.text_input("What did you eat?", placeholder="e.g. Scrambled eggs with toast")
-            
+        def remove_entry(entry_id, entry_date):
+            with SessionLocal() as entry_db:
+                delete_calorie_entry(entry_db, entry_id, entry_date)
+    
+        def add_food(day, food, grams, portion_label):
+            """Lookup callback: logs the picked food's scaled calories and protein as an entry."""
+            calories, protein = scale_food(food, grams)
+            description = food['description'] + (f" ({food['brand']})" if food['brand'] else "")
+            with SessionLocal() as entry_db:
+                add_calorie_entry(
+                    entry_db, day, st.session_state.food_time, f"{description} — {portion_label}",
+                    round(calories), protein_g=round(protein, 1) if protein is not None else None,
+                    planned_slot=st.session_state.food_slot
+                )
+            st.session_state.food_query = ""
+    
+        def food_lookup(day):
+            """Search the imported nutrition database and log a portion of a food in one step."""
+            query = st.text_input("Search foods", placeholder="e.g. greek yogurt", key="food_query")
+            if not query.strip():
+                return
+            with SessionLocal() as food_db:
+                foods = search_foods(food_db, query)
+                if not foods:
+                    st.caption("No matching foods.")
+                    return
+                food = st.selectbox(
+                    "Food", foods,
+                    format_func=lambda f: f"{f['description']}{' · ' + f['brand'] if f['brand'] else ''} "
+                                          f"— {f['calories_per_100g']:.0f} kcal/100 g"
+                )
+                portions = get_food_portions(food_db, food['fdc_id'])
+        
             c1, c2 = st.columns(2)
             with c1:
-                entry_cal = st.number_input("Calories", min_value=0.0, step=10.0, format="%.0f")
+                portion = st.selectbox("Portion", portions,
+                                       format_func=lambda p: p[0] if p[0] == "g" else f"{p[0]} ({p[1]:g} g)")
             with c2:
-                entry_prot = st.number_input("Protein (g)", min_value=0.0, step=1.0, format="%.0f")
-            
+                amount = st.number_input("Amount", min_value=0.0, value=1.0, step=0.5, key="food_amount")
+            grams = portion[1] * amount
+            calories, protein = scale_food(food, grams)
+            protein_str = f" · {protein:.0f}g protein" if protein is not None else ""
+            st.markdown(f"**{calories:,.0f} kcal**{protein_str} for {grams:g} g")
+        
             c3, c4 = st.columns(2)
             with c3:
-                entry_time = st.time_input("Time", value=datetime.now().time())
+                st.time_input("Time", value=datetime.now().time(), key="food_time")
             with c4:
-                entry_slot = st.selectbox("Meal", ["Breakfast", "Lunch", "Dinner", "Snack", "Other"])
-            
-            with st.expander("More details"):
-                entry_place = st.text_input("Place", placeholder="Home, Restaurant...")
-                entry_comments = st.text_area("Notes", placeholder="Any context...", height=60)
-                c5, c6 = st.columns(2)
-                with c5:
-                    entry_star = st.text_input("Star flag", max_chars=1, placeholder="*")
-                with c6:
-                    entry_vl = st.selectbox("V/L flag", ["", "V", "L"])
-            
-            if st.form_submit_button("Add Entry", type="primary", use_container_width=True):
-                if entry_cal > 0:
-                    add_calorie_entry(
-                        db, selected_date, entry_time, entry_desc, entry_cal,
-                        protein_g=entry_prot if entry_prot > 0 else None,
-                        place=entry_place if entry_place else None,
-                        star_flag=entry_star if entry_star else None,
-                        vl_flag=entry_vl if entry_vl else None,
-                        planned_slot=entry_slot,
-                        context_comments=entry_comments if entry_comments else None
-                    )
-                    st.rerun()
-    
-    if entries:
-        for entry in entries:
-            with st.container():
-                col_info, col_del = st.columns([5, 1])
-                with col_info:
-                    time_str = entry.time.strftime('%H:%M') if entry.time else ''
-                    prot_str = f" · {entry.protein_g:.0f}g" if entry.protein_g else ""
-                    st.markdown(f"**{time_str}** {entry.planned_slot or ''}")
-                    st.write(f"{entry.description or 'No description'} — **{entry.calories:.0f} kcal**{prot_str}")
-                    if entry.context_comments:
-                        st.caption(entry.context_comments)
-                with col_del:
-                    if st.button("🗑", key=f"del_{entry.id}"):
-                        delete_calorie_entry(db, entry.id)
-                        st.rerun()
-                st.divider()
-    else:
-        st.info("No entries yet. Add your first meal above.")
-    
-    st.write("")
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("← Back", use_container_width=True):
-            go_back()
-            st.rerun()
-    with col2:
-        if st.button("View Summary →", type="primary", use_container_width=True):
-            go_next()
-            st.rerun()
+                st.selectbox("Meal", ["Breakfast", "Lunch", "Dinner", "Snack", "Other"], key="food_slot")
+            portion_label = f"{amount:g} g" if portion[0] == "g" else f"{amount:g} × {portion[0]}"
+            st.button("Add to journal", type="primary", use_container_width=True, disabled=grams <= 0,
+                      on_click=add_food, args=(day, food, grams, portion_label))
+    
+        @timed_fragment("food_journal")
+        def food_journal(day):
+            # Adding or deleting an entry reruns only this fragment: the day's entries are
+            # the only query, and the summary waits until stage 5
+            with SessionLocal() as journal_db:
+                entries = get_calorie_entries(journal_db, day)
+                foods_imported = has_foods(journal_db)
+            total_eaten = sum(e.calories for e in entries)
+            total_protein = sum(e.protein_g or 0 for e in entries)
+        
+            st.markdown(f"**Today so far:** {total_eaten:,.0f} kcal · {total_protein:.0f}g protein")
+        
+            st.divider()
+        
+            if foods_imported:
+                with st.expander("🔎 Look up food"):
+                    food_lookup(day)
+        
+            with st.expander("➕ Add food entry", expanded=len(entries) == 0):
+                with st.form("add_entry_form", clear_on_submit=True):
+                    st.text_input("What did you eat?", placeholder="e.g. Scrambled eggs with toast", key="entry_desc")
+                
+                    c1, c2 = st.columns(2)
+                    with c1:
+                        st.number_input("Calories", min_value=0.0, step=10.0, format="%.0f", key="entry_cal")
+                    with c2:
+                        st.number_input("Protein (g)", min_value=0.0, step=1.0, format="%.0f", key="entry_prot")
+                
+                    c3, c4 = st.columns(2)
+                    with c3:
+                        st.time_input("Time", value=datetime.now().time(), key="entry_time")
+                    with c4:
+                        st.selectbox("Meal", ["Breakfast", "Lunch", "Dinner", "Snack", "Other"], key="entry_slot")
+                
+                    with st.expander("More details"):
+                        st.text_input("Place", placeholder="Home, Restaurant...", key="entry_place")
+                        st.text_area("Notes", placeholder="Any context...", height=60, key="entry_comments")
+                        c5, c6 = st.columns(2)
+                        with c5:
+                            st.text_input("Star flag", max_chars=1, placeholder="*", key="entry_star")
+                        with c6:
+                            st.selectbox("V/L flag", ["", "V", "L"], key="entry_vl")
+                
+                    st.form_submit_button("Add Entry", type="primary", use_container_width=True,
+                                          on_click=add_entry, args=(day,))
+        
+            if entries:
+                for entry in entries:
+                    with st.container():
+                        col_info, col_del = st.columns([5, 1])
+                        with col_info:
+                            time_str = entry.time.strftime('%H:%M') if entry.time else ''
+                            prot_str = f" · {entry.protein_g:.0f}g" if entry.protein_g else ""
+                            st.markdown(f"**{time_str}** {entry.planned_slot or ''}")
+                            st.write(f"{entry.description or 'No description'} — **{entry.calories:.0f} kcal**{prot_str}")
+                            if entry.context_comments:
+                                st.caption(entry.context_comments)
+                        with col_del:
+                            st.button("🗑", key=f"del_{entry.id}", on_click=remove_entry, args=(entry.id, entry.date))
+                        st.divider()
+            else:
+                st.info("No entries yet. Add your first meal above.")
+    
+        food_journal(selected_date)
+    
+        st.write("")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("← Back", use_container_width=True):
+                go_back()
+                st.rerun()
+        with col2:
+            if st.button("View Summary →", type="primary", use_container_width=True):
+                go_next()
+                st.rerun()
 
-# ============================================================================
-# STAGE 5: SUMMARY
-# ============================================================================
-elif current_stage == 5:
-    st.markdown('<div class="stage-header"><div class="stage-title">Daily Summary</div><div class="stage-subtitle">' + selected_date.strftime('%A, %B %d, %Y') + '</div></div>', unsafe_allow_html=True)
-    render_progress_dots(5)
-    
-    summary = get_daily_summary(db, selected_date)
-    
-    eaten = summary.get('calories_eaten', 0)
-    burned = summary.get('calories_burned_total', 0)
-    target = summary.get('daily_calorie_target', 0)
-    balance = summary.get('calorie_balance', 0)
-    protein_total = summary.get('protein_total_g', 0)
-    protein_target = summary.get('protein_target_g', 0)
-    weight = summary.get('weight_kg', 0)
-    steps = summary.get('steps', 0)
-    mode = summary.get('mode', settings.current_mode)
-    
-    st.markdown(f"**Goal:** {get_mode_display_name(mode)}")
-    
-    st.markdown("---")
-    
-    c1, c2, c3 = st.columns(3)
-    with c1:
-        st.metric("Eaten", f"{eaten:,.0f}", delta=None)
-        st.caption("kcal")
-    with c2:
-        st.metric("Burned", f"{burned:,.0f}", delta=None)
-        st.caption("kcal")
-    with c3:
-        delta_color = "inverse" if balance < 0 else "normal"
-        st.metric("Balance", f"{balance:+,.0f}", delta=None)
-        st.caption("kcal")
-    
-    st.markdown("---")
-    
-    if target > 0:
-        pct = min(eaten / target * 100, 100)
-        st.progress(pct / 100, text=f"Calorie target: {eaten:,.0f} / {target:,.0f} kcal ({pct:.0f}%)")
-    
-    if protein_target and protein_target > 0:
-        prot_pct = min(protein_total / protein_target * 100, 100)
-        st.progress(prot_pct / 100, text=f"Protein: {protein_total:.0f} / {protein_target:.0f}g ({prot_pct:.0f}%)")
-    
-    st.markdown("---")
-    
-    d1, d2 = st.columns(2)
-    with d1:
-        if weight:
-            st.write(f"**Weight:** {weight:.1f} kg")
-        else:
-            st.write("**Weight:** Not logged")
-    with d2:
-        if steps:
-            st.write(f"**Steps:** {steps:,}")
-        else:
-            st.write("**Steps:** Not logged")
+    # ============================================================================
+    # STAGE 5: SUMMARY
+    # ============================================================================
+    elif current_stage == 5:
+        st.markdown('<div class="stage-header"><div class="stage-title">Daily Summary</div><div class="stage-subtitle">' + selected_date.strftime('%A, %B %d, %Y') + '</div></div>', unsafe_allow_html=True)
+        render_progress_dots(5)
+    
+        summary = get_daily_summary(db, selected_date)
+    
+        eaten = summary.get('calories_eaten', 0)
+        burned = summary.get('calories_burned_total', 0)
+        target = summary.get('daily_calorie_target', 0)
+        balance = summary.get('calorie_balance', 0)
+        protein_total = summary.get('protein_total_g', 0)
+        protein_target = summary.get('protein_target_g', 0)
+        weight = summary.get('weight_kg', 0)
+        steps = summary.get('steps', 0)
+        mode = summary.get('mode', settings.current_mode)
+    
+        st.markdown(f"**Goal:** {get_mode_display_name(mode)}")
+    
+        st.markdown("---")
+    
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            st.metric("Eaten", f"{eaten:,.0f}", delta=None)
+            st.caption("kcal")
+        with c2:
+            st.metric("Burned", f"{burned:,.0f}", delta=None)
+            st.caption("kcal")
+        with c3:
+            delta_color = "inverse" if balance < 0 else "normal"
+            st.metric("Balance", f"{balance:+,.0f}", delta=None)
+            st.caption("kcal")
+    
+        st.markdown("---")
+    
+        if target > 0:
+            pct = min(eaten / target * 100, 100)
+            st.progress(pct / 100, text=f"Calorie target: {eaten:,.0f} / {target:,.0f} kcal ({pct:.0f}%)")
+    
+        if protein_target and protein_target > 0:
+            prot_pct = min(protein_total / protein_target * 100, 100)
+            st.progress(prot_pct / 100, text=f"Protein: {protein_total:.0f} / {protein_target:.0f}g ({prot_pct:.0f}%)")
+    
+        st.markdown("---")
+    
+        d1, d2 = st.columns(2)
+        with d1:
+            if weight:
+                st.write(f"**Weight:** {weight:.1f} kg")
+            else:
+                st.write("**Weight:** Not logged")
+        with d2:
+            if steps:
+                st.write(f"**Steps:** {steps:,}")
+            else:
+                st.write("**Steps:** Not logged")
+    
+        summary_text = summary.get('summary_text', '')
+        if summary_text:
+            st.info(summary_text)
+    
+        st.markdown("---")
+    
+        with st.expander("7-Day Trends"):
+            avg_burn = summary.get('avg_calories_burned_last_7_days', 0)
+            avg_deficit = summary.get('avg_daily_deficit_last_7_days', 0)
+            avg_protein = summary.get('avg_protein_last_7_days')
+            avg_weight = summary.get('avg_weight_last_7_days')
+        
+            st.write(f"Avg burn: **{avg_burn:,.0f}** kcal/day")
+            st.write(f"Avg deficit: **{avg_deficit:+,.0f}** kcal/day")
+            if avg_protein:
+                st.write(f"Avg protein: **{avg_protein:.0f}**g/day")
+            if avg_weight:
+                st.write(f"Avg weight: **{avg_weight:.1f}** kg")
+        
+            week = get_daily_summaries(db, selected_date - timedelta(days=6), selected_date)
+            st.dataframe(
+                [{
+                    'Day': day['date'].strftime('%a %d'),
+                    'Eaten': round(day['calories_eaten']),
+                    'Target': round(day['daily_calorie_target']),
+                    'Burned': round(day['calories_burned_total']),
+                    'Protein': round(day['protein_total_g'])
+                } for day in week],
+                hide_index=True,
+                use_container_width=True
+            )
+    
+        st.write("")
+    
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("← Edit", use_container_width=True):
+                go_back()
+                st.rerun()
+        with col2:
+            if st.button("New Day", use_container_width=True):
+                st.session_state.selected_date = date.today()
+                st.session_state.stage = 1
+                st.rerun()
+        with col3:
+            if st.button("History", use_container_width=True):
+                st.session_state.stage = 6
+                st.rerun()
+
+    # ============================================================================
+    # STAGE 6: HISTORY (Optional extra view)
+    # ============================================================================
+    elif current_stage == 6:
+        import plotly.io as pio
     
-    summary_text = summary.get('summary_text', '')
-    if summary_text:
-        st.info(summary_text)
+        st.markdown('<div class="stage-header"><div class="stage-title">History</div><div class="stage-subtitle">Your progress over time</div></div>', unsafe_allow_html=True)
     
-    st.markdown("---")
+        if 'history_range' not in st.session_state:
+            st.session_state.history_range = (date.today() - timedelta(days=89), date.today())
     
-    with st.expander("7-Day Trends"):
-        avg_burn = summary.get('avg_calories_burned_last_7_days', 0)
-        avg_deficit = summary.get('avg_daily_deficit_last_7_days', 0)
-        avg_protein = summary.get('avg_protein_last_7_days')
-        avg_weight = summary.get('avg_weight_last_7_days')
-        
-        st.write(f"Avg burn: **{avg_burn:,.0f}** kcal/day")
-        st.write(f"Avg deficit: **{avg_deficit:+,.0f}** kcal/day")
-        if avg_protein:
-            st.write(f"Avg protein: **{avg_protein:.0f}**g/day")
-        if avg_weight:
-            st.write(f"Avg weight: **{avg_weight:.1f}** kg")
-    
-    st.write("")
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        if st.button("← Edit", use_container_width=True):
-            go_back()
-            st.rerun()
-    with col2:
-        if st.button("New Day", use_container_width=True):
-            st.session_state.selected_date = date.today()
-            st.session_state.stage = 1
-            st.rerun()
-    with col3:
-        if st.button("History", use_container_width=True):
-            st.session_state.stage = 6
-            st.rerun()
-
-# ============================================================================
-# STAGE 6: HISTORY (Optional extra view)
-# ============================================================================
-elif current_stage == 6:
-    st.markdown('<div class="stage-header"><div class="stage-title">History</div><div class="stage-subtitle">Your progress over time</div></div>', unsafe_allow_html=True)
-    
-    from_date = date(2025, 9, 1)
-    to_date = date.today()
-    
-    metrics = db.query(DailyMetrics).filter(
-        DailyMetrics.date >= from_date,
-        DailyMetrics.date <= to_date
-    ).order_by(DailyMetrics.date.desc()).all()
-    
-    if metrics:
-        data_list = [{
-            'Date': m.date,
-            'Weight': m.weight_kg,
-            'Eaten': m.calories_eaten,
-            'Burned': m.calories_burned_total,
-            'Target': m.daily_calorie_target,
-            'Balance': m.calorie_balance,
-            'Protein': m.protein_total_g
-        } for m in metrics]
-        
-        df = pd.DataFrame(data_list)
+        picked_range = st.date_input("Date range", max_value=date.today(), key="history_range")
+        # While the user is mid-selection the widget returns only the start date
+        from_date, to_date = picked_range if len(picked_range) == 2 else (picked_range[0], picked_range[0])
+    
+        over_target_only = st.toggle("Only days over target", key="history_over_target")
+    
+        # Keyset cursors for the table pages visited so far; reset when the range or filter changes
+        if st.session_state.get('history_cursor_range') != (from_date, to_date, over_target_only):
+            st.session_state.history_cursor_range = (from_date, to_date, over_target_only)
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+    
+        page_rows, next_before = get_metrics_page(db, from_date, to_date, cursors[-1],
+                                                  over_target_only=over_target_only)
+    
+        if page_rows:
+            tab1, tab2 = st.tabs(["Charts", "Table"])
         
-        tab1, tab2 = st.tabs(["Charts", "Table"])
+            with tab1:
+                CACHE_REQUESTS.inc(cache="history_figures")
+                figures = load_history_figures(from_date, to_date, get_data_version(db))
+            
+                st.markdown("**Weight Trend**")
+                if figures['weight']:
+                    st.plotly_chart(pio.from_json(figures['weight']), use_container_width=True)
+            
+                st.markdown("**Calorie Balance (7-day avg)**")
+                if figures['balance']:
+                    st.plotly_chart(pio.from_json(figures['balance']), use_container_width=True)
         
-        with tab1:
-            df_sorted = df.sort_values('Date')
+            with tab2:
+                table = [{
+                    'Date': m.date,
+                    'Weight': m.weight_kg,
+                    'Eaten': m.calories_eaten,
+                    'Burned': m.calories_burned_total,
+                    'Target': m.daily_calorie_target,
+                    'Balance': m.calorie_balance,
+                    'Over': "●" if m.is_over_target else "",
+                    'Protein': m.protein_total_g
+                } for m in page_rows]
             
-            st.markdown("**Weight Trend**")
-            df_w = df_sorted[df_sorted['Weight'].notna()]
-            if not df_w.empty:
-                fig = px.line(df_w, x='Date', y='Weight', markers=True)
-                fig.update_layout(showlegend=False, margin=dict(l=0,r=0,t=10,b=0), height=200)
-                st.plotly_chart(fig, use_container_width=True)
+                selection = st.dataframe(
+                    table,
+                    hide_index=True,
+                    use_container_width=True,
+                    on_select="rerun",
+                    selection_mode="single-row",
+                    key=f"history_table_{len(cursors)}"
+                )
             
-            st.markdown("**Calorie Balance (7-day avg)**")
-            df_b = df_sorted[df_sorted['Balance'].notna()]
-            if not df_b.empty and len(df_b) >= 3:
-                df_b = df_b.copy()
-                df_b['Rolling'] = df_b['Balance'].rolling(7, min_periods=1).mean()
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=df_b['Date'], y=df_b['Rolling'], mode='lines', line=dict(color='#4ECDC4', width=2)))
-                fig.add_hline(y=0, line_dash="dash", line_color="gray")
-                fig.update_layout(showlegend=False, margin=dict(l=0,r=0,t=10,b=0), height=200)
-                st.plotly_chart(fig, use_container_width=True)
+                p1, p2, p3 = st.columns([1, 1, 1])
+                with p1:
+                    if st.button("← Newer", disabled=len(cursors) == 1, use_container_width=True):
+                        cursors.pop()
+                        st.rerun()
+                with p2:
+                    st.caption(f"Page {len(cursors)} · select a row to see its entries")
+                with p3:
+                    if st.button("Older →", disabled=next_before is None, use_container_width=True):
+                        cursors.append(next_before)
+                        st.rerun()
+            
+                # Entries are only loaded for the day the user drills into
+                if selection.selection.rows:
+                    day = page_rows[selection.selection.rows[0]].date
+                    with st.expander(f"Entries on {day.strftime('%a %d %b %Y')}", expanded=True):
+                        day_entries = get_calorie_entries(db, day)
+                        for entry in day_entries:
+                            time_str = entry.time.strftime('%H:%M') if entry.time else ''
+                            prot_str = f" · {entry.protein_g:.0f}g" if entry.protein_g else ""
+                            st.write(f"**{time_str}** {entry.description or 'No description'} — "
+                                     f"{entry.calories:.0f} kcal{prot_str}")
+                        if not day_entries:
+                            st.caption("No food entries for this day.")
+        else:
+            st.info("No data in this date range.")
+    
+        with st.expander("Largest surplus and deficit days"):
+            over_days, tracked_days = count_over_target(db, from_date, to_date)
+            if tracked_days:
+                st.caption(f"{over_days} of {tracked_days} tracked days over target in this range")
+            s1, s2 = st.columns(2)
+            for column, order, title in ((s1, "surplus", "Surplus"), (s2, "deficit", "Deficit")):
+                with column:
+                    st.markdown(f"**{title}**")
+                    extremes = get_balance_days(db, from_date, to_date, order, over_target_only, limit=5)
+                    for m in extremes:
+                        st.write(f"{m.date.strftime('%a %d %b %Y')} — {m.calorie_balance:+.0f} kcal")
+                    if not extremes:
+                        st.caption("No days with intake and burn logged.")
+    
+        with st.expander("Weight projection"):
+            weeks = st.slider("Weeks ahead", min_value=4, max_value=26, value=12, key="projection_weeks")
+            CACHE_REQUESTS.inc(cache="weight_projection")
+            projection = load_weight_projection(weeks, date.today(), get_data_version(db), get_settings_version(db))
+            if projection:
+                st.plotly_chart(pio.from_json(projection['figure']), use_container_width=True)
+                st.dataframe(
+                    [{
+                        'Mode': get_mode_display_name(WeightMode(mode)),
+                        'Target': round(band['median_target']),
+                        f'In {weeks} weeks': f"{band['final'][1]:.1f} kg",
+                        'Likely range': f"{band['final'][0]:.1f}–{band['final'][2]:.1f} kg"
+                    } for mode, band in projection['modes'].items()],
+                    hide_index=True,
+                    use_container_width=True
+                )
+                st.caption(f"{projection['paths']} simulated paths per mode from {projection['start_weight']:.1f} kg, "
+                           f"drawing daily burn and intake adherence from the last {projection['history_days']} "
+                           f"days of data. The range covers 80% of paths.")
+            else:
+                st.caption("Log a weight to see a projection.")
+    
+        with st.expander("Similar days"):
+            from similarity_helpers import FEATURES, FEATURE_LABELS
+            c1, c2 = st.columns([1, 2])
+            with c1:
+                similar_day = st.date_input("Day", value=to_date, max_value=date.today(), key="similar_day")
+            with c2:
+                match_on = st.multiselect("Match on", list(FEATURES), default=list(FEATURES),
+                                          format_func=FEATURE_LABELS.get, key="similar_features")
+            CACHE_REQUESTS.inc(cache="similarity_index")
+            similarity_index = load_similarity_index()
+            similarity_index.refresh(db)
+            similar = similarity_index.query(similar_day, features=match_on) if match_on else None
+            if similar and similar['neighbours']:
+                st.dataframe(
+                    [{
+                        'Date': n['date'],
+                        'Distance': round(n['distance'], 2),
+                        'Steps': n['values']['steps'],
+                        'Burned': n['values']['calories_burned_total'],
+                        'Eaten': n['values']['calories_eaten'],
+                        'Protein': n['values']['protein_total_g'],
+                        'Mode': get_mode_display_name(WeightMode(n['values']['mode'])) if n['values']['mode'] else "",
+                        'First meal': format_hour(n['values']['first_meal_hour']),
+                        'Last meal': format_hour(n['values']['last_meal_hour']),
+                        **{f'Weight +{days}d': None if change is None else round(change, 2)
+                           for days, change in n['weight_change'].items()}
+                    } for n in similar['neighbours']],
+                    hide_index=True,
+                    use_container_width=True
+                )
+                outcomes = [f"{change['median']:+.2f} kg over {days} days" for days, change in similar['weight_change'].items()
+                            if change['median'] is not None]
+                if outcomes:
+                    st.caption("Median weight change after these days: " + ", ".join(outcomes))
+                st.caption("Compared on " + ", ".join(FEATURE_LABELS[f].lower() for f in similar['matched_on'])
+                           + ", against every earlier day.")
+            else:
+                st.caption("Not enough data on this day to compare it with others.")
+    
+        with st.expander("Eating patterns"):
+            c1, c2 = st.columns(2)
+            with c1:
+                pattern_by = st.selectbox("Group by", list(DIMENSION_LABELS), format_func=DIMENSION_LABELS.get,
+                                          key="pattern_by")
+            with c2:
+                slot_choices = [slot for slot in get_dimension_values(db, "planned_slot") if slot]
+                pattern_slot = st.selectbox("Meal", ["All meals"] + slot_choices, key="pattern_slot",
+                                            disabled=pattern_by == "planned_slot")
+            # Read from the maintained cube, so this is a small lookup rather than a scan of all entries
+            filters = ({"planned_slot": pattern_slot}
+                       if pattern_slot != "All meals" and pattern_by != "planned_slot" else None)
+            patterns = get_entry_patterns(db, pattern_by, filters)
+            if patterns:
+                st.dataframe(
+                    [{
+                        DIMENSION_LABELS[pattern_by]: format_dimension_value(pattern_by, row['value']),
+                        'Entries': row['entries'],
+                        'Avg kcal': round(row['avg_calories']),
+                        'Total kcal': round(row['calories']),
+                        'Protein': round(row['protein_g']),
+                        'Share': row['share'] * 100
+                    } for row in patterns],
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={'Share': st.column_config.ProgressColumn(
+                        "Share of kcal", format="%.0f%%", min_value=0, max_value=100
+                    )}
+                )
+                st.caption("All logged food entries, including archived ones.")
+            else:
+                st.caption("Log food entries to see when and where you eat.")
+    
+        with st.expander("Export data"):
+            e1, e2 = st.columns(2)
+            with e1:
+                export_dataset = st.selectbox(
+                    "Data", ["metrics", "entries"],
+                    format_func=lambda x: "Daily metrics" if x == "metrics" else "Food entries"
+                )
+            with e2:
+                export_format = st.selectbox("Format", list(EXPORT_FORMATS), format_func=str.upper)
         
-        with tab2:
-            st.dataframe(df, height=400, use_container_width=True)
-    else:
-        st.info("No historical data yet.")
-    
-    st.write("")
-    if st.button("← Back to Summary", use_container_width=True):
-        st.session_state.stage = 5
-        st.rerun()
-
-db.close()
+            if st.button("Prepare export", use_container_width=True):
+                # Written by a background job; the download appears under Background jobs
+                submit_job(db, "export", {"dataset": export_dataset, "format": export_format,
+                                          "start_date": from_date.isoformat(), "end_date": to_date.isoformat()})
+    
+        with st.expander("Maintenance"):
+            m1, m2 = st.columns(2)
+            with m1:
+                if st.button("Recalculate targets", use_container_width=True):
+                    submit_job(db, "recalculate_targets")
+                if st.button("Archive old entries", use_container_width=True):
+                    submit_job(db, "archive_entries")
+            with m2:
+                if st.button("Verify & repair", use_container_width=True):
+                    submit_job(db, "verify_derived")
+                if st.button("Compact database", use_container_width=True):
+                    submit_job(db, "compact_database")
+            if st.button("Back up now", use_container_width=True):
+                submit_job(db, "backup")
+            import_dir = st.text_input("Import a directory of CSV/JSON exports", placeholder="/path/to/exports")
+            if st.button("Import directory", disabled=not import_dir, use_container_width=True):
+                submit_job(db, "import_directory", {"directory": import_dir})
+            foods_path = st.text_input("Import a FoodData Central CSV dump", placeholder="/path/to/FoodData_Central_csv.zip")
+            if st.button("Import food database", disabled=not foods_path, use_container_width=True):
+                submit_job(db, "import_foods", {"path": foods_path})
+    
+        st.markdown("**Background jobs**")
+        render_jobs_panel(poll=has_active_jobs(db))
+    
+        st.write("")
+        if st.button("← Back to Summary", use_container_width=True):
+            st.session_state.stage = 5
+            st.rerun()
+finally:
+    db.close()
+    RERUN_DURATION.observe(perf_counter() - rerun_started, stage=current_stage)
@@ -0,0 +1,43 @@
+"""
+CLI for archiving old calorie entries into compressed per-month archives.
+
+Usage:
+    python archive_entries.py [--older-than-days 365] [--dry-run] [--no-vacuum]
+
+Entries in whole months older than the cutoff are moved out of calorie_entries; they
+stay readable through get_calorie_entries and the entries export. The run finishes
+with an incremental VACUUM so the database file shrinks as well.
+"""
+import argparse
+from database import SessionLocal, init_db
+from archive_helpers import ARCHIVE_AFTER_DAYS, archive_calorie_entries, compact_database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old calorie entries")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be archived without writing")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip the final incremental VACUUM")
+    args = parser.parse_args(argv)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        report = archive_calorie_entries(db, args.older_than_days, dry_run=args.dry_run)
+        for month in report:
+            print(f"{month['month']:%Y-%m}: {month['entries']:6d} entries  "
+                  f"{month['raw_bytes'] / 1024:8.1f} KB -> {month['archived_bytes'] / 1024:7.1f} KB")
+
+        total = sum(month["entries"] for month in report)
+        action = "Would archive" if args.dry_run else "Archived"
+        print(f"{action} {total} entries from {len(report)} months")
+
+        if not args.dry_run and not args.no_vacuum:
+            pages = compact_database(db)
+            print(f"Released {pages} database pages")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Cold-data archival for calorie_entries.
+
+Entries older than a configurable age are moved, one calendar month at a time, into
+calorie_entry_archives as a single zlib-compressed JSON payload per month. DailyMetrics
+totals and the entry patterns cube are left as they are. get_calorie_entries,
+recompute_daily_totals, delete_calorie_entry, clear_day_data and the entries export
+read or update the archive transparently, so archived days behave like any other day.
+"""
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from models import CalorieEntry, CalorieEntryArchive
+from changelog_helpers import record_changes
+from entry_pattern_helpers import remove_entries
+
+# Entries older than this many days are archived by default (whole months only)
+ARCHIVE_AFTER_DAYS = 365
+
+ENTRY_FIELDS = [column.name for column in CalorieEntry.__table__.columns]
+
+DATE_FIELDS = {"date", "daily_metric_date"}
+TIME_FIELDS = {"time"}
+DATETIME_FIELDS = {"created_at", "updated_at"}
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _encode(rows: List[Dict[str, Any]]) -> bytes:
+    plain = [{key: value.isoformat() if hasattr(value, "isoformat") else value
+              for key, value in row.items()} for row in rows]
+    return zlib.compress(json.dumps(plain, separators=(",", ":")).encode(), 9)
+
+
+def _decode(payload: bytes) -> List[Dict[str, Any]]:
+    rows = json.loads(zlib.decompress(payload))
+    for row in rows:
+        for key, value in row.items():
+            if value is None:
+                continue
+            if key in DATE_FIELDS:
+                row[key] = date.fromisoformat(value)
+            elif key in TIME_FIELDS:
+                row[key] = time.fromisoformat(value)
+            elif key in DATETIME_FIELDS:
+                row[key] = datetime.fromisoformat(value)
+    return rows
+
+
+def _entry_sort_key(entry) -> tuple:
+    # Same order as ORDER BY time on SQLite: entries without a time come first
+    entry_time = entry["time"] if isinstance(entry, dict) else entry.time
+    return (entry_time is not None, entry_time or time.min)
+
+
+def _get_archive(db: Session, day: date) -> Optional[CalorieEntryArchive]:
+    return db.query(CalorieEntryArchive).filter(CalorieEntryArchive.month == month_start(day)).first()
+
+
+def _write_archive(db: Session, archive: CalorieEntryArchive, rows: List[Dict[str, Any]]) -> None:
+    """Replace an archive's rows, deleting the archive when none are left (caller commits)."""
+    if not rows:
+        db.delete(archive)
+        return
+    archive.payload = _encode(rows)
+    archive.entry_count = len(rows)
+    archive.min_entry_id = min(row["id"] for row in rows)
+    archive.max_entry_id = max(row["id"] for row in rows)
+
+
+def get_archived_rows(db: Session, start_date: date, end_date: date) -> Iterator[Dict[str, Any]]:
+    """
+    Archived entries in a date range as dicts, ordered by date, time and id.
+    
+    Yields one month at a time (each payload is one month), so only a single month is
+    decoded and held in memory however long the range is.
+    """
+    months = [month for (month,) in db.query(CalorieEntryArchive.month).filter(
+        CalorieEntryArchive.month >= month_start(start_date),
+        CalorieEntryArchive.month <= end_date
+    ).order_by(CalorieEntryArchive.month)]
+
+    for month in months:
+        payload = db.query(CalorieEntryArchive.payload).filter(CalorieEntryArchive.month == month).scalar()
+        if payload is None:
+            continue
+        rows = [row for row in _decode(payload) if start_date <= row["date"] <= end_date]
+        yield from sorted(rows, key=lambda row: (row["date"], *_entry_sort_key(row), row["id"]))
+
+
+def get_archived_entries(db: Session, selected_date: date) -> List[CalorieEntry]:
+    """
+    Get archived entries for a date as detached CalorieEntry objects.
+    
+    The objects are never added to the session, so changing them has no effect; use
+    delete_calorie_entry to remove one.
+    """
+    archive = _get_archive(db, selected_date)
+    if not archive:
+        return []
+    return [CalorieEntry(**row) for row in _decode(archive.payload) if row["date"] == selected_date]
+
+
+def get_archived_day_totals(db: Session, selected_date: date) -> Tuple[float, float]:
+    """Calories and protein of the archived entries for a date."""
+    entries = get_archived_entries(db, selected_date)
+    return sum(e.calories for e in entries), sum(e.protein_g or 0 for e in entries)
+
+
+def delete_archived_entry(db: Session, entry_id: int, entry_date: Optional[date] = None) -> Optional[date]:
+    """
+    Remove one entry from the archive.
+    
+    Args:
+        db: Database session
+        entry_id: Id of the archived entry
+        entry_date: Only match the id on this date (only this month's archive is read)
+    
+    Returns:
+        Date of the removed entry, or None if no archive holds it
+    """
+    archives = db.query(CalorieEntryArchive).filter(
+        CalorieEntryArchive.min_entry_id <= entry_id,
+        CalorieEntryArchive.max_entry_id >= entry_id
+    )
+    if entry_date is not None:
+        archives = archives.filter(CalorieEntryArchive.month == month_start(entry_date))
+
+    for archive in archives.all():
+        rows = _decode(archive.payload)
+        removed = [row for row in rows if row["id"] == entry_id
+                   and (entry_date is None or row["date"] == entry_date)]
+        if removed:
+            entry_date = removed[0]["date"]
+            _write_archive(db, archive, [row for row in rows if row is not removed[0]])
+            remove_entries(db, removed)
+            record_changes(db, CalorieEntry.__tablename__, [entry_date], operation="delete")
+            db.commit()
+            return entry_date
+    return None
+
+
+def delete_archived_day(db: Session, selected_date: date) -> int:
+    """Remove every archived entry for a date (caller commits). Returns the number removed."""
+    archive = _get_archive(db, selected_date)
+    if not archive:
+        return 0
+    rows = _decode(archive.payload)
+    removed = [row for row in rows if row["date"] == selected_date]
+    _write_archive(db, archive, [row for row in rows if row["date"] != selected_date])
+    remove_entries(db, removed)
+    return len(removed)
+
+
+def archive_calorie_entries(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                            today: Optional[date] = None, dry_run: bool = False,
+                            progress: Optional[Callable[[float, str], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Move calorie entries older than older_than_days into per-month compressed archives.
+    
+    Only whole months before the cutoff are archived. Each month is archived in its own
+    transaction: the archive row is written (merged with an existing archive for that
+    month), the hot rows are deleted and an 'archive' change is logged per date.
+    DailyMetrics rows are not touched.
+    
+    Args:
+        db: Database session
+        older_than_days: Minimum age of archived entries
+        today: Reference date (defaults to today)
+        dry_run: Report what would be archived without writing
+        progress: Called with (fraction done, message) after each month is committed
+    
+    Returns:
+        One dict per month with 'month', 'entries', 'raw_bytes' and 'archived_bytes'
+    """
+    cutoff = month_start((today or date.today()) - timedelta(days=older_than_days))
+    days = [d for (d,) in db.query(CalorieEntry.date).filter(
+        CalorieEntry.date < cutoff
+    ).distinct().order_by(CalorieEntry.date)]
+    months = sorted({month_start(d) for d in days})
+
+    report = []
+    for month in months:
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        entries = db.query(CalorieEntry).filter(
+            CalorieEntry.date >= month,
+            CalorieEntry.date < next_month
+        ).all()
+        rows = [{field: getattr(entry, field) for field in ENTRY_FIELDS} for entry in entries]
+
+        archive = db.query(CalorieEntryArchive).filter(CalorieEntryArchive.month == month).first()
+        if archive:
+            new_ids = {row["id"] for row in rows}
+            rows = [row for row in _decode(archive.payload) if row["id"] not in new_ids] + rows
+        rows.sort(key=lambda row: (row["date"], *_entry_sort_key(row), row["id"]))
+
+        payload = _encode(rows)
+        raw_bytes = sum(len(json.dumps(row, default=str)) for row in rows)
+        report.append({"month": month, "entries": len(entries), "raw_bytes": raw_bytes,
+                       "archived_bytes": len(payload)})
+        if dry_run:
+            continue
+
+        if not archive:
+            archive = CalorieEntryArchive(month=month)
+            db.add(archive)
+        _write_archive(db, archive, rows)
+
+        ids = [entry.id for entry in entries]
+        for entry in entries:
+            db.expunge(entry)
+        for i in range(0, len(ids), 500):
+            db.execute(CalorieEntry.__table__.delete().where(CalorieEntry.id.in_(ids[i:i + 500])))
+        record_changes(db, CalorieEntry.__tablename__, sorted({entry.date for entry in entries}),
+                       operation="archive")
+        db.commit()
+        if progress:
+            progress(len(report) / len(months), f"Archived {month.strftime('%B %Y')}")
+
+    return report
+
+
+def compact_database(db: Session, max_pages: Optional[int] = None) -> int:
+    """
+    Return free pages to the filesystem with an incremental VACUUM (SQLite only).
+    
+    Incremental vacuum needs auto_vacuum=INCREMENTAL, which an existing database file
+    only picks up through a blocking full VACUUM; migrate_incremental_vacuum.py does that
+    once. Until it has run, nothing is released.
+    
+    Returns:
+        Number of pages released
+    """
+    if db.bind.dialect.name != "sqlite":
+        return 0
+
+    db.commit()
+    with db.bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            return 0
+        before = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        # sqlite3's execute() steps the pragma once, freeing a single page;
+        # executescript() runs it to completion
+        pages = f"({int(max_pages)})" if max_pages else ""
+        conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum{pages};")
+        after = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    return before - after
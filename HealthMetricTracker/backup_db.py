@@ -0,0 +1,77 @@
+"""
+CLI for online database backups (see backup_helpers).
+
+Usage:
+    python backup_db.py backup [--label NAME] [--keep 14]
+    python backup_db.py list
+    python backup_db.py verify [PATH]
+    python backup_db.py restore [PATH | --at "2026-10-01 18:00"] [--no-safety-backup]
+
+Snapshots go to HEALTH_BACKUP_DIR (default ./backups). backup is safe while the app and
+API are running. restore picks the given snapshot, the newest one taken at or before
+--at (UTC), or the newest overall. verify exits with status 1 when a snapshot fails
+its integrity check.
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+from backup_helpers import BACKUP_KEEP, backup_database, find_backup, list_backups, restore_backup, verify_backup
+
+
+def _pick(path, at):
+    if path:
+        return path
+    backup = find_backup(datetime.fromisoformat(at).replace(tzinfo=timezone.utc) if at else None)
+    if not backup:
+        sys.exit("No matching snapshot found")
+    return backup["path"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back up, verify and restore the database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="Take a compressed online snapshot")
+    backup_parser.add_argument("--label", help="Tag added to the snapshot file name")
+    backup_parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="Number of snapshots to keep")
+
+    commands.add_parser("list", help="List snapshots, newest first")
+
+    verify_parser = commands.add_parser("verify", help="Integrity-check a snapshot (default: newest)")
+    verify_parser.add_argument("path", nargs="?")
+
+    restore_parser = commands.add_parser("restore", help="Restore a snapshot into the live database")
+    restore_parser.add_argument("path", nargs="?")
+    restore_parser.add_argument("--at", help="Restore the newest snapshot taken at or before this UTC time")
+    restore_parser.add_argument("--no-safety-backup", action="store_true",
+                                help="Don't snapshot the current data before restoring")
+    args = parser.parse_args(argv)
+
+    if args.command == "backup":
+        backup = backup_database(label=args.label, keep=args.keep)
+        print(f"Saved {backup['name']} ({backup['bytes'] / 1024:.1f} KB) in {backup['seconds']:.2f}s, "
+              f"removed {backup['rotated']} old snapshots")
+
+    elif args.command == "list":
+        for backup in list_backups():
+            print(f"{backup['taken_at']:%Y-%m-%d %H:%M:%S} UTC  {backup['bytes'] / 1024:10.1f} KB  {backup['name']}")
+
+    elif args.command == "verify":
+        path = _pick(args.path, None)
+        problems = verify_backup(path)
+        if problems:
+            print(f"{path}: FAILED")
+            for problem in problems[:20]:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"{path}: ok")
+
+    elif args.command == "restore":
+        result = restore_backup(_pick(args.path, args.at), safety_backup=not args.no_safety_backup)
+        print(f"Restored {result['restored']}")
+        if result["safety_backup"]:
+            print(f"Previous data saved as {result['safety_backup']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Online backups of the database into compressed, rotated point-in-time snapshots.
+
+SQLite databases are copied with the sqlite3 backup API in steps of BACKUP_STEP_PAGES
+pages. The source is only locked for the duration of each step, so writers in the app
+and API keep committing between steps (a step that sees a change from another
+connection restarts the copy, which just costs time). The copy is checked with
+PRAGMA integrity_check, gzip-compressed into BACKUP_DIR and older snapshots beyond
+BACKUP_KEEP are deleted. Nothing is written to the live database while a copy is in
+progress, since that would restart it.
+
+Postgres databases are dumped with pg_dump in its compressed custom format and
+checked with pg_restore --list.
+
+restore_backup copies a snapshot back with the same backup API (or pg_restore), after
+checking it and taking a pre-restore snapshot of the current data.
+"""
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy.engine import make_url
+from database import SQLALCHEMY_DATABASE_URL
+
+BACKUP_DIR = os.environ.get("HEALTH_BACKUP_DIR", "./backups")
+BACKUP_KEEP = int(os.environ.get("HEALTH_BACKUP_KEEP", "14"))
+
+# Hours between scheduled backups; unset or 0 disables the scheduler
+BACKUP_INTERVAL_HOURS = float(os.environ.get("HEALTH_BACKUP_INTERVAL_HOURS", "0"))
+
+# Pages copied per backup step and the pause between steps, which is when writers get in
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_SLEEP = 0.01
+
+TIMESTAMP_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# Labels become part of a file name, so anything else is replaced with '-'
+LABEL_UNSAFE = re.compile(r"[^A-Za-z0-9_-]+")
+MAX_LABEL_LENGTH = 40
+
+ProgressCallback = Callable[[float, str], None]
+
+
+def _database_url():
+    return make_url(SQLALCHEMY_DATABASE_URL)
+
+
+def _is_sqlite() -> bool:
+    return _database_url().get_backend_name() == "sqlite"
+
+
+def _sqlite_path() -> str:
+    return os.path.abspath(_database_url().database)
+
+
+def _snapshot_prefix() -> str:
+    url = _database_url()
+    name = os.path.basename(url.database or "database") if _is_sqlite() else (url.database or "postgres")
+    return os.path.splitext(name)[0] + "-"
+
+
+def _snapshot_suffix() -> str:
+    return ".db.gz" if _is_sqlite() else ".dump"
+
+
+def _pg_url() -> str:
+    """The database URL in the plain postgresql:// form pg_dump accepts."""
+    return _database_url().set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def list_backups(backup_dir: str = BACKUP_DIR) -> List[Dict[str, Any]]:
+    """
+    Snapshots of the current database, newest first.
+
+    Returns:
+        One dict per snapshot with 'path', 'name', 'taken_at' (UTC), 'label' and 'bytes'
+    """
+    if not os.path.isdir(backup_dir):
+        return []
+
+    prefix, suffix = _snapshot_prefix(), _snapshot_suffix()
+    backups = []
+    for name in os.listdir(backup_dir):
+        if not (name.startswith(prefix) and name.endswith(suffix)):
+            continue
+        stamp, _, label = name[len(prefix):-len(suffix)].partition("-")
+        try:
+            taken_at = datetime.strptime(stamp, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        path = os.path.join(backup_dir, name)
+        backups.append({"path": path, "name": name, "taken_at": taken_at, "label": label or None,
+                        "bytes": os.path.getsize(path)})
+    backups.sort(key=lambda backup: backup["taken_at"], reverse=True)
+    return backups
+
+
+def find_backup(at: Optional[datetime] = None, backup_dir: str = BACKUP_DIR) -> Optional[Dict[str, Any]]:
+    """The newest snapshot taken at or before at (the newest overall when at is None)."""
+    for backup in list_backups(backup_dir):
+        if at is None or backup["taken_at"] <= at:
+            return backup
+    return None
+
+
+def _integrity_check(path: str) -> List[str]:
+    """PRAGMA integrity_check problems for a SQLite file (empty when it is sound)."""
+    conn = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if problems == ["ok"] else problems
+
+
+def _copy_sqlite(source_path: str, target_path: str) -> None:
+    """Copy a SQLite database page by page with the backup API."""
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        target.close()
+        source.close()
+
+
+def rotate_backups(keep: int = BACKUP_KEEP, backup_dir: str = BACKUP_DIR) -> int:
+    """Delete all but the newest keep snapshots; returns the number deleted."""
+    stale = list_backups(backup_dir)[keep:]
+    for backup in stale:
+        os.remove(backup["path"])
+    return len(stale)
+
+
+def clean_label(label: Optional[str]) -> Optional[str]:
+    """A snapshot label safe to put in a file name ('Before import!' -> 'Before-import'), or None."""
+    if not label:
+        return None
+    return LABEL_UNSAFE.sub("-", str(label)).strip("-")[:MAX_LABEL_LENGTH] or None
+
+
+def backup_database(label: Optional[str] = None, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                    progress: Optional[ProgressCallback] = None, rotate: bool = True) -> Dict[str, Any]:
+    """
+    Take a compressed snapshot of the live database and rotate old ones.
+
+    Args:
+        label: Optional tag added to the file name (e.g. 'pre-restore'), see clean_label
+        backup_dir: Directory holding the snapshots
+        keep: Number of snapshots to keep
+        progress: Called with (fraction done, message) between phases
+        rotate: Delete snapshots beyond keep afterwards
+
+    Returns:
+        The new snapshot's entry from list_backups, plus 'seconds' and 'rotated'
+    """
+    report = progress or (lambda fraction, message: None)
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.monotonic()
+    stamp = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+    label = clean_label(label)
+    name = f"{_snapshot_prefix()}{stamp}{'-' + label if label else ''}{_snapshot_suffix()}"
+    path = os.path.join(backup_dir, name)
+    partial_path = path + ".partial"
+
+    if _is_sqlite():
+        fd, copy_path = tempfile.mkstemp(suffix=".db", dir=backup_dir)
+        os.close(fd)
+        try:
+            report(0.0, "Copying database pages")
+            _copy_sqlite(_sqlite_path(), copy_path)
+
+            report(0.6, "Checking the copy")
+            problems = _integrity_check(copy_path)
+            if problems:
+                raise RuntimeError(f"Backup copy failed the integrity check: {problems[:3]}")
+
+            report(0.7, "Compressing")
+            with open(copy_path, "rb") as src, gzip.open(partial_path, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        finally:
+            os.remove(copy_path)
+    else:
+        report(0.0, "Running pg_dump")
+        subprocess.run(["pg_dump", "--format=custom", f"--file={partial_path}", _pg_url()],
+                       check=True, capture_output=True)
+        report(0.7, "Checking the dump")
+        subprocess.run(["pg_restore", "--list", partial_path], check=True, capture_output=True)
+
+    # Only complete snapshots get their final name, so a crash never leaves a truncated one
+    os.replace(partial_path, path)
+    rotated = rotate_backups(keep, backup_dir) if rotate else 0
+    report(1.0, f"Saved {name}")
+
+    backup = next(backup for backup in list_backups(backup_dir) if backup["path"] == path)
+    return {**backup, "seconds": round(time.monotonic() - started, 2), "rotated": rotated}
+
+
+def verify_backup(path: str) -> List[str]:
+    """
+    Check a snapshot without touching the live database.
+
+    Returns:
+        Problems found (empty when the snapshot is sound)
+    """
+    if path.endswith(".dump"):
+        result = subprocess.run(["pg_restore", "--list", path], capture_output=True, text=True)
+        return [] if result.returncode == 0 else [result.stderr.strip()]
+
+    fd, copy_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        with gzip.open(path, "rb") as src, open(copy_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        return _integrity_check(copy_path)
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        return [f"{type(e).__name__}: {e}"]
+    finally:
+        os.remove(copy_path)
+
+
+def restore_backup(path: str, safety_backup: bool = True) -> Dict[str, Any]:
+    """
+    Replace the live database's contents with a snapshot.
+
+    The snapshot is verified first, and unless safety_backup is False the current data
+    is saved as a 'pre-restore' snapshot. That snapshot doesn't rotate old ones: with a
+    full store, rotation would delete the oldest snapshot, which is often the one being
+    restored; the next regular backup rotates. SQLite data is copied in with the backup
+    API, so open connections see the restored data afterwards. The restore is then logged
+    as a change to every tracked table (see changelog_helpers.record_restore), with
+    sequence numbers above any from before it.
+
+    Returns:
+        Dictionary with 'restored' (the snapshot path) and 'safety_backup' (its path or None)
+    """
+    problems = verify_backup(path)
+    if problems:
+        raise RuntimeError(f"Refusing to restore {path}: {problems[:3]}")
+
+    saved = backup_database(label="pre-restore", rotate=False)["path"] if safety_backup else None
+
+    from database import SessionLocal
+    from changelog_helpers import get_latest_seq, record_restore
+    with SessionLocal() as db:
+        latest_seq = get_latest_seq(db)
+
+    if path.endswith(".dump"):
+        subprocess.run(["pg_restore", "--clean", "--if-exists", "--single-transaction",
+                        f"--dbname={_pg_url()}", path], check=True, capture_output=True)
+    else:
+        live_path = _sqlite_path()
+        fd, copy_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(live_path))
+        os.close(fd)
+        try:
+            with gzip.open(path, "rb") as src, open(copy_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            source = sqlite3.connect(copy_path)
+            target = sqlite3.connect(live_path, timeout=30)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+        finally:
+            os.remove(copy_path)
+
+    with SessionLocal() as db:
+        record_restore(db, latest_seq)
+
+    return {"restored": path, "safety_backup": saved}
+
+
+def start_backup_scheduler(interval_hours: float = BACKUP_INTERVAL_HOURS,
+                           check_every: float = 300.0) -> Optional[threading.Thread]:
+    """
+    Queue a 'backup' background job whenever the newest snapshot is older than interval_hours.
+
+    Runs on a daemon thread (no-op when interval_hours is 0). The app and the API can
+    both run it: a backup job that is already queued or running is never duplicated.
+    """
+    if not interval_hours:
+        return None
+
+    def run():
+        from database import SessionLocal
+        from models import Job
+        from job_helpers import ACTIVE_STATUSES, submit_job
+
+        while True:
+            try:
+                newest = find_backup()
+                age_hours = ((datetime.now(timezone.utc) - newest["taken_at"]).total_seconds() / 3600
+                             if newest else None)
+                if age_hours is None or age_hours >= interval_hours:
+                    with SessionLocal() as db:
+                        pending = db.query(Job.id).filter(
+                            Job.kind == "backup", Job.status.in_(ACTIVE_STATUSES)
+                        ).first()
+                        if not pending:
+                            submit_job(db, "backup")
+            except Exception:
+                pass  # Try again at the next check
+            time.sleep(check_every)
+
+    thread = threading.Thread(target=run, name="backup-scheduler", daemon=True)
+    thread.start()
+    return thread
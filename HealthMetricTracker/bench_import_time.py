@@ -0,0 +1,103 @@
+"""
+Start-up import cost benchmark for app.py, using python -X importtime.
+
+Imports the modules app.py imports at top level in a fresh interpreter and compares the
+cost on top of importing streamlit alone against a budget. It also fails if any module
+that must stay lazy (pandas, plotly, ...) is pulled in at start-up.
+
+Usage:
+    python bench_import_time.py [--budget-ms 500] [--runs 5]
+
+Exits with status 1 when the budget is exceeded or a deferred module is imported.
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+
+# App import cost allowed on top of `import streamlit`, in milliseconds
+IMPORT_BUDGET_MS = 500
+
+# Modules that must not be imported before the stage that needs them
+FORBIDDEN_AT_STARTUP = ("pandas", "plotly", "pyarrow", "numpy")
+
+
+def get_top_level_imports(path: str = APP_PATH):
+    """Module names imported at the top level of a script (not inside functions or branches)."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure(modules):
+    """
+    Import modules in a fresh interpreter with -X importtime.
+
+    Returns:
+        (total milliseconds, set of every imported module name)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total_us = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        imported.add(name.strip())
+    return total_us / 1000.0, imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check app.py start-up import cost against a budget")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5, help="Best of N runs is reported")
+    args = parser.parse_args(argv)
+
+    modules = get_top_level_imports()
+    baseline_runs = [measure(["streamlit"]) for _ in range(args.runs)]
+    baseline = min(ms for ms, _ in baseline_runs)
+    runs = [measure(modules) for _ in range(args.runs)]
+    app_ms = min(ms for ms, _ in runs)
+    # Streamlit itself imports a few of these (e.g. the plotly root package); only flag what the app adds
+    added = runs[0][1] - baseline_runs[0][1]
+
+    extra_ms = app_ms - baseline
+    print(f"Top-level imports: {', '.join(modules)}")
+    print(f"streamlit alone:   {baseline:7.1f} ms")
+    print(f"app imports:       {app_ms:7.1f} ms")
+    print(f"app cost:          {extra_ms:7.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    leaked = sorted(name for name in added if name.split(".")[0] in FORBIDDEN_AT_STARTUP)
+    if leaked:
+        print(f"FAIL: deferred modules imported at start-up: {', '.join(leaked)}")
+        failed = True
+    if extra_ms > args.budget_ms:
+        print(f"FAIL: start-up import cost {extra_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,43 @@
-from datetime import date, datetime, time
+import math
+from datetime import date, datetime, time, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Any, Optional
 from models import CalorieEntry, DailyMetrics, WeightMode
 from settings_helpers import get_or_create_settings, compute_target_from_settings, get_mode_display_name
-from aggregation_helpers import get_aggregated_stats, get_recent_weight
+from aggregation_helpers import get_aggregated_stats, get_recent_weight, refresh_effective_weights
+from daily_series import DailySeries
+from changelog_helpers import record_changes
+from entry_pattern_helpers import remove_entries  # importing also registers the cube's flush listener
+from telemetry import timed
+from archive_helpers import (
+    get_archived_entries,
+    get_archived_day_totals,
+    delete_archived_entry,
+    delete_archived_day
+)
 from rolling_average_helpers import (
     get_rolling_burn_average,
     compute_dynamic_target_from_rolling_avg,
+    effective_window_days,
     recalculate_target_for_date,
+    recalculate_targets_in_range,
     get_deficit_percent_for_mode
 )
 
 def get_calorie_entries(db: Session, selected_date: date):
-    """Get all calorie entries for a specific date, ordered by time."""
-    return db.query(CalorieEntry).filter(
+    """Get all calorie entries for a specific date, ordered by time, including archived ones."""
+    entries = db.query(CalorieEntry).filter(
         CalorieEntry.date == selected_date
     ).order_by(CalorieEntry.time).all()
+    
+    archived = get_archived_entries(db, selected_date)
+    if archived:
+        entries = sorted(entries + archived, key=lambda e: (e.time is not None, e.time or time.min))
+    return entries
 
+@timed("add_calorie_entry")
 def add_calorie_entry(db: Session, entry_date: date, entry_time: time, description: str, calories: float, 
                       protein_g: float = None, place: str = None, star_flag: str = None, 
                       vl_flag: str = None, planned_slot: str = None, context_comments: str = None):
@@ -28,11 +49,15 @@ def add_calorie_entry(db: Session, entry_date: date, entry_time: time, descripti
         daily_metric = DailyMetrics(
             date=entry_date,
             mode=settings.current_mode,
-            daily_calorie_target=compute_target_from_settings(settings)
+            daily_calorie_target=compute_target_from_settings(settings),
+            effective_weight_kg=get_recent_weight(db, entry_date)
         )
         db.add(daily_metric)
-        db.commit()
-        db.refresh(daily_metric)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another session created this date's row first
+            db.rollback()
     
     new_entry = CalorieEntry(
         date=entry_date,
@@ -55,9 +80,17 @@ def add_calorie_entry(db: Session, entry_date: date, entry_time: time, descripti
     
     return new_entry
 
-def delete_calorie_entry(db: Session, entry_id: int):
-    """Delete a calorie entry and update daily metrics."""
-    entry = db.query(CalorieEntry).filter(CalorieEntry.id == entry_id).first()
+def delete_calorie_entry(db: Session, entry_id: int, entry_date: Optional[date] = None):
+    """
+    Delete a calorie entry and update daily metrics.
+    
+    Pass the entry's date when it's known, so the id is only matched on that day (ids
+    of entries archived before calorie_entries used AUTOINCREMENT may have been reused).
+    """
+    query = db.query(CalorieEntry).filter(CalorieEntry.id == entry_id)
+    if entry_date is not None:
+        query = query.filter(CalorieEntry.date == entry_date)
+    entry = query.first()
     if entry:
         entry_date = entry.date
         db.delete(entry)
@@ -65,6 +98,11 @@ def delete_calorie_entry(db: Session, entry_id: int):
         
         recompute_daily_totals(db, entry_date)
         return True
+    
+    entry_date = delete_archived_entry(db, entry_id, entry_date)
+    if entry_date:
+        recompute_daily_totals(db, entry_date)
+        return True
     return False
 
 def recompute_daily_totals(db: Session, selected_date: date):
@@ -77,6 +115,12 @@ def recompute_daily_totals(db: Session, selected_date: date):
         CalorieEntry.date == selected_date
     ).scalar()
     
+    archived_calories, archived_protein = get_archived_day_totals(db, selected_date)
+    if archived_calories:
+        calories_total = (calories_total or 0) + archived_calories
+    if archived_protein:
+        protein_total = (protein_total or 0) + archived_protein
+    
     daily_metric = db.query(DailyMetrics).filter(
         DailyMetrics.date == selected_date
     ).first()
@@ -91,14 +135,10 @@ def recompute_daily_totals(db: Session, selected_date: date):
         # Recalculate dynamic target using rolling average
         recalculate_target_for_date(db, selected_date)
         
-        # Auto-calculate protein target if not manually set (treat 0 as needing target)
-        if daily_metric.weight_kg is not None and daily_metric.protein_target_g in (None, 0):
-            daily_metric.protein_target_g = round(daily_metric.weight_kg * 2.0)
-        elif daily_metric.weight_kg is None and daily_metric.protein_target_g in (None, 0):
-            # Try to get recent weight
-            recent_weight = get_recent_weight(db, selected_date)
-            if recent_weight:
-                daily_metric.protein_target_g = round(recent_weight * 2.0)
+        # Auto-calculate protein target if not manually set (treat 0 as needing target);
+        # the effective weight is the day's weight or the most recent earlier one
+        if daily_metric.effective_weight_kg and daily_metric.protein_target_g in (None, 0):
+            daily_metric.protein_target_g = round(daily_metric.effective_weight_kg * 2.0)
         
         daily_metric.updated_at = datetime.now()
     elif calories_total or protein_total:
@@ -107,7 +147,8 @@ def recompute_daily_totals(db: Session, selected_date: date):
             calories_eaten=calories_total,
             protein_total_g=protein_total,
             mode=settings.current_mode,
-            daily_calorie_target=compute_target_from_settings(settings)
+            daily_calorie_target=compute_target_from_settings(settings),
+            effective_weight_kg=get_recent_weight(db, selected_date)
         )
         db.add(daily_metric)
     
@@ -125,85 +166,213 @@ def recompute_daily_calories(db: Session, selected_date: date):
     """Backward compatibility wrapper for recompute_daily_totals."""
     recompute_daily_totals(db, selected_date)
 
-def upsert_metric(db: Session, data: dict):
-    """Insert or update daily metrics with dynamic target calculation and protein auto-calc."""
-    existing = db.query(DailyMetrics).filter(DailyMetrics.date == data['date']).first()
+# DailyMetrics columns callers may write; effective_weight_kg and timestamps are derived
+METRIC_COLUMNS = (
+    'steps', 'weight_kg', 'calories_burned_total', 'calories_burned_active', 'calories_burned_basal',
+    'calories_eaten', 'daily_calorie_target', 'mode', 'protein_total_g', 'protein_target_g'
+)
+
+def _validate_metric_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Check a batch for upsert_metrics and return normalized copies (mode as WeightMode)."""
+    errors = []
+    seen = set()
+    normalized = []
+    for i, row in enumerate(rows):
+        day = row.get('date')
+        if not isinstance(day, date) or isinstance(day, datetime):
+            errors.append(f"row {i}: 'date' must be a date")
+        elif day in seen:
+            errors.append(f"row {i}: duplicate date {day.isoformat()}")
+        seen.add(day)
+        
+        values = {'date': day}
+        for key, value in row.items():
+            if key == 'date':
+                continue
+            if key not in METRIC_COLUMNS:
+                errors.append(f"row {i}: unknown column '{key}'")
+            elif key == 'mode':
+                try:
+                    values[key] = WeightMode(value) if value is not None else None
+                except ValueError:
+                    errors.append(f"row {i}: invalid mode {value!r}")
+            elif value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                errors.append(f"row {i}: '{key}' must be a number")
+            elif isinstance(value, float) and not math.isfinite(value):
+                errors.append(f"row {i}: '{key}' must be a finite number")
+            elif value is not None and value < 0:
+                errors.append(f"row {i}: '{key}' must not be negative")
+            else:
+                values[key] = value
+        normalized.append(values)
+    
+    if errors:
+        raise ValueError("Invalid metric rows: " + "; ".join(errors[:10]))
+    return normalized
+
+@timed("upsert_metrics")
+def upsert_metrics(db: Session, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Insert or update DailyMetrics for many dates with one native upsert and one recompute pass.
+    
+    Each row has a 'date' and any of METRIC_COLUMNS; columns a row leaves out keep their
+    stored values. Rows are compared with what is stored first, and only rows that
+    change something are written. Then, once for the whole batch:
+    - new rows get the current mode when the row doesn't set one
+    - a changed weight resets the day's auto protein target (unless the row sets one)
+      and carries forward through effective_weight_kg
+    - unset protein targets are filled from the effective weight
+    - calorie targets are recalculated from the first new or changed burn/mode day
+      through maintenance_window_days - 1 days past the last one
+    
+    Args:
+        db: Database session
+        rows: One dict per date
+    
+    Returns:
+        One dict per input row, in order: 'date', 'created' (the row was inserted) and
+        'changed' (columns whose stored value changed, empty when the row was a no-op)
+    
+    Raises:
+        ValueError: If a row has no valid date, repeats a date or has an invalid column
+    """
+    rows = _validate_metric_rows(rows)
+    if not rows:
+        return []
+    
     settings = get_or_create_settings(db)
+    dates = [row['date'] for row in rows]
+    stored = {}
+    for i in range(0, len(dates), 500):
+        stored.update(
+            (row.date, row) for row in db.query(DailyMetrics.date, *(getattr(DailyMetrics, c) for c in METRIC_COLUMNS))
+            .filter(DailyMetrics.date.in_(dates[i:i + 500]))
+        )
     
-    if existing:
-        # Store original values to detect changes
-        mode_before = existing.mode or settings.current_mode
-        burn_before = existing.calories_burned_total
-        weight_before = existing.weight_kg
-        protein_target_before = existing.protein_target_g
-        
-        # Update fields from data
-        for key, value in data.items():
-            if key != 'date':
-                setattr(existing, key, value)
-        
-        # Get new values after update
-        mode_after = existing.mode or settings.current_mode
-        burn_after = existing.calories_burned_total
-        weight_after = existing.weight_kg
-        protein_target_after = existing.protein_target_g
+    results = []
+    writes = []
+    weight_dates = []
+    target_dates = []
+    for row in rows:
+        existing = stored.get(row['date'])
+        if existing is None:
+            if row.get('mode') is None:
+                row['mode'] = settings.current_mode
+            weight = row.get('weight_kg')
+            if weight and row.get('protein_target_g') in (None, 0):
+                row['protein_target_g'] = round(weight * 2.0)
+            changed = [key for key in row if key != 'date']
+            weight_dates.append(row['date'])
+            target_dates.append(row['date'])
+        else:
+            changed = [key for key, value in row.items() if key != 'date' and getattr(existing, key) != value]
+            if 'weight_kg' in changed:
+                weight_dates.append(row['date'])
+                # A new weight resets the auto target unless the row overrides it too
+                if row['weight_kg'] is not None and 'protein_target_g' not in changed:
+                    row['protein_target_g'] = round(row['weight_kg'] * 2.0)
+                    if row['protein_target_g'] != existing.protein_target_g:
+                        changed.append('protein_target_g')
+            if 'calories_burned_total' in changed or 'mode' in changed:
+                target_dates.append(row['date'])
         
-        # Recalculate dynamic target using rolling average if burn or mode changed
-        if burn_after != burn_before or mode_after != mode_before:
-            recalculate_target_for_date(db, data['date'])
-        
-        # Auto-calculate protein target if:
-        # 1. Weight changed and target wasn't manually overridden, OR
-        # 2. Weight exists but target is 0/None (legacy data backfill)
-        if weight_after is not None:
-            # Check if target should be auto-calculated
-            if weight_after != weight_before and protein_target_after == protein_target_before:
-                # Weight changed, no manual override
-                existing.protein_target_g = round(weight_after * 2.0)
-            elif protein_target_after in (None, 0):
-                # Legacy data: has weight but no target
-                existing.protein_target_g = round(weight_after * 2.0)
-        elif weight_after is None and existing.protein_target_g in (None, 0):
-            # Try to get recent weight
-            recent_weight = get_recent_weight(db, data['date'])
-            if recent_weight:
-                existing.protein_target_g = round(recent_weight * 2.0)
-        
-        existing.updated_at = datetime.now()
-        db.commit()
-        return existing
+        results.append({'date': row['date'], 'created': existing is None, 'changed': changed})
+        if changed:
+            writes.append(row)
+    
+    if not writes:
+        return results
+    
+    bulk_upsert_daily_values(db, writes)
+    
+    written = [row['date'] for row in writes]
+    backfill_start, backfill_end = min(written), max(written)
+    if weight_dates:
+        # Later days that now carry a new weight need their unset protein targets filled too
+        refreshed = refresh_effective_weights(db, min(weight_dates), max(weight_dates))
+        if refreshed:
+            backfill_start, backfill_end = min(backfill_start, refreshed[0]), max(backfill_end, refreshed[1])
+    backfill_protein_targets(db, backfill_start, backfill_end)
+    
+    if target_dates:
+        span_end = max(target_dates) + timedelta(days=settings.maintenance_window_days - 1)
+        recalculate_targets_in_range(db, min(target_dates), span_end)
+    
+    return results
+
+@timed("upsert_metric")
+def upsert_metric(db: Session, data: dict):
+    """Insert or update one day's metrics through upsert_metrics and return the stored row."""
+    upsert_metrics(db, [data])
+    return db.query(DailyMetrics).filter(DailyMetrics.date == data['date']).populate_existing().one()
+
+def bulk_upsert_daily_values(db: Session, rows: List[Dict[str, Any]], batch_size: int = 500) -> int:
+    """
+    Insert or update raw DailyMetrics columns for many dates with native upserts.
+    
+    Each row must contain 'date'; only the other keys present in a row are written on
+    conflict, so existing columns the row doesn't mention are left alone. Targets are
+    not recomputed here - callers refresh derived columns for the affected dates.
+    
+    Returns:
+        Number of rows written
+    """
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
     else:
-        # New record
-        if 'mode' not in data or data['mode'] is None:
-            data['mode'] = settings.current_mode
-        
-        mode = data.get('mode') or settings.current_mode
-        burn = data.get('calories_burned_total')
-        weight = data.get('weight_kg')
-        
-        # Set initial target - will be recalculated after insert
-        if 'daily_calorie_target' not in data or data['daily_calorie_target'] is None:
-            data['daily_calorie_target'] = compute_target_from_settings(settings, mode)
-        
-        # Auto-calculate protein target (including 0 as needing a target)
-        if weight is not None and ('protein_target_g' not in data or data.get('protein_target_g') in (None, 0)):
-            data['protein_target_g'] = round(weight * 2.0)
-        elif weight is None and ('protein_target_g' not in data or data.get('protein_target_g') in (None, 0)):
-            recent_weight = get_recent_weight(db, data['date'])
-            if recent_weight:
-                data['protein_target_g'] = round(recent_weight * 2.0)
-        
-        new_metric = DailyMetrics(**data)
-        db.add(new_metric)
-        db.commit()
-        db.refresh(new_metric)
-        
-        # Recalculate target using rolling average after creating the record
-        recalculate_target_for_date(db, data['date'])
-        db.refresh(new_metric)
-        
-        return new_metric
+        from sqlalchemy.dialects.sqlite import insert
+    
+    # Rows are grouped by their key set so each group is one executemany statement
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+    
+    now = datetime.now()
+    for keys, group in groups.items():
+        stmt = insert(DailyMetrics)
+        update_columns = {key: stmt.excluded[key] for key in keys if key != 'date'}
+        update_columns['updated_at'] = now
+        stmt = stmt.on_conflict_do_update(index_elements=[DailyMetrics.date], set_=update_columns)
+        for i in range(0, len(group), batch_size):
+            db.execute(stmt, group[i:i + batch_size])
+        record_changes(db, DailyMetrics.__tablename__, [row['date'] for row in group],
+                       [key for key in keys if key != 'date'], "upsert")
+    
+    db.commit()
+    return len(rows)
+
+def backfill_protein_targets(db: Session, start_date: date = None, end_date: date = None) -> int:
+    """
+    Fill unset (None or 0) protein targets from effective_weight_kg in one UPDATE.
+    
+    Covers start_date..end_date, or the whole history when they are omitted. Manual
+    targets are never touched.
+    
+    Returns:
+        Number of days whose target was filled
+    """
+    needs_target = and_(
+        DailyMetrics.effective_weight_kg.isnot(None),
+        DailyMetrics.effective_weight_kg > 0,
+        or_(DailyMetrics.protein_target_g.is_(None), DailyMetrics.protein_target_g == 0)
+    )
+    if start_date is not None:
+        needs_target = and_(needs_target, DailyMetrics.date >= start_date)
+    if end_date is not None:
+        needs_target = and_(needs_target, DailyMetrics.date <= end_date)
+    
+    filled_dates = [d for (d,) in db.query(DailyMetrics.date).filter(needs_target)]
+    if filled_dates:
+        db.execute(
+            DailyMetrics.__table__.update().where(needs_target).values(
+                protein_target_g=func.round(DailyMetrics.effective_weight_kg * 2.0)
+            )
+        )
+        record_changes(db, DailyMetrics.__tablename__, filled_dates, ["protein_target_g"])
+    db.commit()
+    return len(filled_dates)
 
+@timed("get_daily_summary")
 def get_daily_summary(db: Session, selected_date: date, default_target: float = 3000.0):
     """Generate a summary of daily status with aggregated statistics."""
     daily_metric = db.query(DailyMetrics).filter(
@@ -211,8 +380,27 @@ def get_daily_summary(db: Session, selected_date: date, default_target: float =
     ).first()
     
     settings = get_or_create_settings(db)
-    aggregated = get_aggregated_stats(db, selected_date)
+    # One projection query covers both the 7/30-day stats and the rolling burn window
+    lookback = max(effective_window_days(settings.maintenance_window_days), 30) - 1
+    series = DailySeries.load(db, selected_date - timedelta(days=lookback), selected_date)
+    aggregated = get_aggregated_stats(db, selected_date, series)
+    
+    rolling_burn_avg = None
+    if daily_metric:
+        rolling_burn_avg = get_rolling_burn_average(db, selected_date, settings.maintenance_window_days,
+                                                    series=series)
     
+    return _build_day_summary(selected_date, daily_metric, settings, rolling_burn_avg, aggregated, default_target)
+
+
+def _build_day_summary(selected_date: date, daily_metric, settings, rolling_burn_avg: float,
+                       aggregated: Dict[str, Any], default_target: float = 3000.0) -> Dict[str, Any]:
+    """
+    Build the summary dict for one day from already-loaded values.
+    
+    daily_metric may be a DailyMetrics object or any row with the same attribute names,
+    or None when the day has no data (rolling_burn_avg is unused in that case).
+    """
     if not daily_metric:
         computed_target = compute_target_from_settings(settings)
         result = {
@@ -234,7 +422,7 @@ def get_daily_summary(db: Session, selected_date: date, default_target: float =
     calories_eaten = daily_metric.calories_eaten or 0
     calories_burned = daily_metric.calories_burned_total or 0
     target = daily_metric.daily_calorie_target or default_target
-    calorie_balance = daily_metric.calorie_balance or (calories_eaten - calories_burned)
+    calorie_balance = calories_eaten - calories_burned
     mode = daily_metric.mode or settings.current_mode
     weight = daily_metric.weight_kg
     
@@ -245,8 +433,6 @@ def get_daily_summary(db: Session, selected_date: date, default_target: float =
     percentage_of_target = (calories_eaten / target * 100) if target > 0 else 0
     remaining_to_target = target - calories_eaten
     
-    # Get rolling burn average and deficit percent for summary
-    rolling_burn_avg = get_rolling_burn_average(db, selected_date, settings.maintenance_window_days)
     deficit_percent = get_deficit_percent_for_mode(mode, settings)
     
     # Build plain English summary explaining rolling average and target
@@ -290,6 +476,121 @@ def get_daily_summary(db: Session, selected_date: date, default_target: float =
     return result
 
 
+def get_daily_summaries(db: Session, start_date: date, end_date: date,
+                        default_target: float = 3000.0) -> List[Dict[str, Any]]:
+    """
+    Generate get_daily_summary results for every day from start_date to end_date.
+    
+    The range plus its look-back window is loaded in one query, and the rolling burn
+    average and 7/30-day stats are computed for all days at once with NumPy window
+    sums, instead of running get_daily_summary's queries once per day.
+    
+    Returns:
+        List of summary dicts, one per day in date order
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    
+    if end_date < start_date:
+        return []
+    
+    settings = get_or_create_settings(db)
+    
+    window_days, min_days = effective_window_days(settings.maintenance_window_days), 7
+    
+    lookback = max(window_days, 30) - 1
+    load_start = start_date - timedelta(days=lookback)
+    
+    rows = db.query(
+        DailyMetrics.date,
+        DailyMetrics.weight_kg,
+        DailyMetrics.calories_burned_total,
+        DailyMetrics.calories_eaten,
+        DailyMetrics.daily_calorie_target,
+        DailyMetrics.mode,
+        DailyMetrics.protein_total_g,
+        DailyMetrics.protein_target_g
+    ).filter(
+        DailyMetrics.date >= load_start,
+        DailyMetrics.date <= end_date
+    ).all()
+    
+    # Dense day-indexed columns with NaN for missing days or values
+    n = (end_date - load_start).days + 1
+    columns = {name: np.full(n, np.nan) for name in ('burn', 'eaten', 'weight', 'protein')}
+    by_offset = {}
+    for row in rows:
+        offset = (row.date - load_start).days
+        by_offset[offset] = row
+        for name, value in (('burn', row.calories_burned_total), ('eaten', row.calories_eaten),
+                            ('weight', row.weight_kg), ('protein', row.protein_total_g)):
+            if value is not None:
+                columns[name][offset] = value
+    
+    burn, eaten = columns['burn'], columns['eaten']
+    has_burn = ~np.isnan(burn)
+    burn_zero = np.nan_to_num(burn)
+    eaten_zero = np.nan_to_num(eaten)
+    deficit = np.where(has_burn, eaten_zero - burn_zero, 0.0)
+    
+    def window(values, size):
+        """Trailing window sums ending on each day of the requested range."""
+        return sliding_window_view(values, size).sum(axis=1)[lookback - size + 1:]
+    
+    def nan_window(values, size):
+        present = ~np.isnan(values)
+        return window(np.where(present, values, 0.0), size), window(present.astype(float), size)
+    
+    def mean_or(total, count, fallback):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / np.maximum(count, 1), fallback)
+    
+    stats = {}
+    for days in (7, 30):
+        burn_sum = window(burn_zero, days)
+        eaten_sum = window(eaten_zero, days)
+        deficit_sum, deficit_count = window(deficit, days), window(has_burn.astype(float), days)
+        weight_sum, weight_count = nan_window(columns['weight'], days)
+        protein_sum, protein_count = nan_window(columns['protein'], days)
+        stats[days] = {
+            'burn': burn_sum,
+            'eaten': eaten_sum,
+            'avg_burn': burn_sum / days,
+            'avg_eaten': eaten_sum / days,
+            'avg_deficit': mean_or(deficit_sum, deficit_count, 0.0),
+            'avg_weight': mean_or(weight_sum, weight_count, np.nan),
+            'avg_protein': mean_or(protein_sum, protein_count, np.nan),
+        }
+    
+    rolling_sum, rolling_count = nan_window(burn, window_days)
+    rolling_avg = np.where(rolling_count >= min_days, rolling_sum / np.maximum(rolling_count, 1),
+                           settings.maintenance_calories)
+    
+    def optional(value):
+        return None if np.isnan(value) else float(value)
+    
+    summaries = []
+    for i in range(n - lookback):
+        day = start_date + timedelta(days=i)
+        aggregated = {}
+        for days in (7, 30):
+            period = stats[days]
+            aggregated.update({
+                f'burn_last_{days}_days': float(period['burn'][i]),
+                f'eaten_last_{days}_days': float(period['eaten'][i]),
+                f'avg_calories_burned_last_{days}_days': float(period['avg_burn'][i]),
+                f'avg_calories_eaten_last_{days}_days': float(period['avg_eaten'][i]),
+                f'avg_daily_deficit_last_{days}_days': float(period['avg_deficit'][i]),
+                f'avg_weight_last_{days}_days': optional(period['avg_weight'][i]),
+                f'avg_protein_last_{days}_days': optional(period['avg_protein'][i]),
+            })
+        summaries.append(_build_day_summary(
+            day, by_offset.get(lookback + i), settings, float(rolling_avg[i]), aggregated, default_target
+        ))
+    
+    return summaries
+
+
 def clear_day_data(db: Session, selected_date: date) -> dict:
     """
     Delete all metrics and calorie entries for a specific date.
@@ -297,12 +598,26 @@ def clear_day_data(db: Session, selected_date: date) -> dict:
     Returns:
         Dictionary with counts of deleted rows
     """
-    # Delete calorie entries first
+    # Delete calorie entries first; the bulk delete skips the flush listener, so the
+    # entries are taken out of the patterns cube here
+    remove_entries(db, db.query(CalorieEntry).filter(CalorieEntry.date == selected_date).all())
     entries_deleted = db.query(CalorieEntry).filter(CalorieEntry.date == selected_date).delete()
+    entries_deleted += delete_archived_day(db, selected_date)
     
     # Delete daily metrics
     metrics_deleted = db.query(DailyMetrics).filter(DailyMetrics.date == selected_date).delete()
     
+    # Bulk deletes skip the flush, so log them explicitly
+    if entries_deleted:
+        record_changes(db, CalorieEntry.__tablename__, [selected_date], operation="delete")
+    if metrics_deleted:
+        record_changes(db, DailyMetrics.__tablename__, [selected_date], operation="delete")
+        # Following days may have carried this day's weight, and their protein target
+        # fallback reads it
+        refreshed = refresh_effective_weights(db, selected_date)
+        if refreshed:
+            backfill_protein_targets(db, *refreshed)
+    
     db.commit()
     
     return {
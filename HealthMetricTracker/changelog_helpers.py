@@ -0,0 +1,317 @@
+"""
+Change-data-capture outbox for DailyMetrics, CalorieEntry and UserSettings.
+
+Every ORM flush that touches a tracked table appends one ChangeLog row per changed
+object on the same connection, so the log commits or rolls back together with the
+write. Core statements that bypass the ORM (bulk upserts, raw UPDATEs, bulk deletes)
+call record_changes() explicitly. Importing this module registers the flush listener;
+settings_helpers and calorie_helpers import it, so every write helper is covered.
+
+Sequence numbers must follow commit order, or a consumer could move its checkpoint past
+a seq whose transaction commits later and miss that change for good. SQLite allows one
+writer at a time, so that holds there. On PostgreSQL seq is drawn at insert time, so
+each log insert first takes a transaction-scoped advisory lock: writers that log
+changes are serialized from that point until they commit, and no later seq can become
+visible before an earlier one.
+
+Consumers keep a named checkpoint and pull changes after it, so derived data (caches,
+rollups, exports, search indexes) can update incrementally instead of rescanning:
+
+    process_changes(db, "my-rollup", lambda changes: refresh(changed_dates(changes)))
+
+The similar-days index is one, with a checkpoint per process (see process_consumer).
+prune_changes deletes what every consumer has processed; start_prune_scheduler queues
+it as a background job every HEALTH_PRUNE_INTERVAL_HOURS. Consumers that stop moving
+(a process that exited) are dropped after CONSUMER_TIMEOUT so they don't keep the log
+growing.
+"""
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable, List, Optional, Sequence
+from sqlalchemy import event, func, or_, text
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+from models import CalorieEntry, ChangeCheckpoint, ChangeLog, DailyMetrics, UserSettings
+
+TRACKED_TABLES = {
+    model.__tablename__: model for model in (DailyMetrics, CalorieEntry, UserSettings)
+}
+
+# Bookkeeping columns that don't count as a change on their own
+IGNORED_COLUMNS = {"id", "created_at", "updated_at"}
+
+# pg_advisory_xact_lock key that serializes change-log writers on PostgreSQL
+LOG_LOCK_KEY = 7236911
+
+# A consumer whose checkpoint hasn't moved for this long is considered gone; prune_changes
+# drops its checkpoint rather than keeping the log for it (it rebuilds if it comes back)
+CONSUMER_TIMEOUT = timedelta(days=7)
+
+# Hours between the prune_changes jobs start_prune_scheduler queues (0 turns it off)
+PRUNE_INTERVAL_HOURS = float(os.environ.get("HEALTH_PRUNE_INTERVAL_HOURS", "24"))
+
+# Log rows deleted per transaction by prune_changes
+PRUNE_BATCH_ROWS = 5000
+
+# Operation of the rows record_restore appends; their date is None, as the whole table changed
+RESTORE_OPERATION = "restore"
+
+
+def _lock_log(connection) -> None:
+    """Hold the log's advisory lock until the transaction ends, so seqs commit in order (PostgreSQL)."""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOG_LOCK_KEY})
+
+
+def _changed_columns(obj, operation: str) -> List[str]:
+    state = sa_inspect(obj)
+    columns = []
+    for attr in state.mapper.column_attrs:
+        if attr.key in IGNORED_COLUMNS:
+            continue
+        if operation == "insert":
+            if getattr(obj, attr.key) is not None:
+                columns.append(attr.key)
+        elif state.attrs[attr.key].history.has_changes():
+            columns.append(attr.key)
+    return columns
+
+
+def _log_row(obj, operation: str, columns: Sequence[str]) -> dict:
+    return {
+        "table_name": obj.__tablename__,
+        "row_id": getattr(obj, "id", None),
+        "date": getattr(obj, "date", None),
+        "operation": operation,
+        "changed_columns": ",".join(columns) if columns else None,
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flush_changes(session: Session, flush_context) -> None:
+    # Runs after the flush's SQL but before attribute history is reset, so new objects
+    # already have their ids and dirty objects still know which columns changed
+    rows = []
+    for operation, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if getattr(obj, "__tablename__", None) not in TRACKED_TABLES:
+                continue
+            columns = [] if operation == "delete" else _changed_columns(obj, operation)
+            if operation == "update" and not columns:
+                continue
+            rows.append(_log_row(obj, operation, columns))
+
+    if rows:
+        connection = session.connection()
+        _lock_log(connection)
+        connection.execute(ChangeLog.__table__.insert(), rows)
+
+
+def record_changes(db: Session, table_name: str, dates: Iterable[date], columns: Sequence[str] = (),
+                   operation: str = "update") -> int:
+    """
+    Append change-log rows for a Core write the flush listener can't see.
+    
+    Call it before the commit that makes the write visible, so both land together.
+    
+    Args:
+        db: Database session
+        table_name: Tracked table that was written
+        dates: Dates of the affected rows (one log row each)
+        columns: Columns the statement wrote
+        operation: 'insert', 'update', 'upsert' or 'delete'
+    
+    Returns:
+        Number of log rows written
+    """
+    changed = ",".join(column for column in columns if column not in IGNORED_COLUMNS) or None
+    rows = [{"table_name": table_name, "row_id": None, "date": day,
+             "operation": operation, "changed_columns": changed} for day in dates]
+    if rows:
+        _lock_log(db.connection())
+        db.execute(ChangeLog.__table__.insert(), rows)
+    return len(rows)
+
+
+def record_restore(db: Session, after_seq: int) -> None:
+    """
+    Log a restore of the whole database as a change to every tracked table, and commit.
+
+    A restore rolls the log (and its id sequence) back with everything else, so without
+    this the next write would reuse a seq that already stood for a different state, and
+    cache versions and consumers would treat stale results as current. The sequence is
+    first moved past after_seq, the latest seq from before the restore.
+    """
+    name = ChangeLog.__tablename__
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        current = db.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": name}).scalar()
+        db.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": name})
+        db.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                   {"name": name, "seq": max(after_seq, current or 0)})
+    elif dialect == "postgresql":
+        db.execute(text("SELECT setval(pg_get_serial_sequence(:name, 'seq'), :seq)"),
+                   {"name": name, "seq": max(after_seq, get_latest_seq(db), 1)})
+    _lock_log(db.connection())
+    db.execute(ChangeLog.__table__.insert(), [
+        {"table_name": table_name, "row_id": None, "date": None,
+         "operation": RESTORE_OPERATION, "changed_columns": None}
+        for table_name in TRACKED_TABLES
+    ])
+    db.commit()
+
+
+def get_latest_seq(db: Session, tables: Optional[Sequence[str]] = None) -> int:
+    """Highest sequence number in the log (optionally for some tables only), 0 when empty."""
+    query = db.query(func.max(ChangeLog.seq))
+    if tables:
+        query = query.filter(ChangeLog.table_name.in_(tables))
+    return query.scalar() or 0
+
+
+def get_changes(db: Session, after_seq: int = 0, limit: int = 1000,
+                tables: Optional[Sequence[str]] = None) -> List[ChangeLog]:
+    """Changes with seq greater than after_seq, oldest first."""
+    query = db.query(ChangeLog).filter(ChangeLog.seq > after_seq)
+    if tables:
+        query = query.filter(ChangeLog.table_name.in_(tables))
+    return query.order_by(ChangeLog.seq).limit(limit).all()
+
+
+def changed_dates(changes: Iterable[ChangeLog], table_name: Optional[str] = None) -> List[date]:
+    """Distinct dates touched by a batch of changes, sorted."""
+    return sorted({
+        change.date for change in changes
+        if change.date is not None and (table_name is None or change.table_name == table_name)
+    })
+
+
+def process_consumer(name: str) -> str:
+    """A consumer name unique to this process, for in-memory derived data such as SimilarDaysIndex."""
+    return f"{name}@{socket.gethostname()}:{os.getpid()}"
+
+
+def get_checkpoint(db: Session, consumer: str) -> int:
+    """Last sequence number processed by a consumer (0 if it has never run)."""
+    checkpoint = db.query(ChangeCheckpoint).filter(ChangeCheckpoint.consumer == consumer).first()
+    return checkpoint.seq if checkpoint else 0
+
+
+def set_checkpoint(db: Session, consumer: str, seq: int) -> None:
+    """Store a consumer's checkpoint and commit."""
+    checkpoint = db.query(ChangeCheckpoint).filter(ChangeCheckpoint.consumer == consumer).first()
+    if checkpoint:
+        checkpoint.seq = seq
+        # Also set when seq is unchanged, so an active consumer never times out
+        checkpoint.updated_at = datetime.now(timezone.utc)
+    else:
+        db.add(ChangeCheckpoint(consumer=consumer, seq=seq))
+    db.commit()
+
+
+def process_changes(db: Session, consumer: str, handler: Callable[[List[ChangeLog]], None],
+                    tables: Optional[Sequence[str]] = None, batch_size: int = 500) -> int:
+    """
+    Feed every change after a consumer's checkpoint to handler, in batches.
+    
+    The checkpoint advances after each batch the handler returns from, so a batch whose
+    handler raises is delivered again on the next run (at-least-once); handlers should
+    be idempotent, which recomputing derived values for the changed dates naturally is.
+    
+    Args:
+        db: Database session
+        consumer: Unique consumer name
+        handler: Called with each batch of ChangeLog rows, oldest first
+        tables: Only deliver changes to these tables (the checkpoint still advances)
+        batch_size: Maximum changes per handler call
+    
+    Returns:
+        Number of changes delivered
+    """
+    seq = get_checkpoint(db, consumer)
+    delivered = 0
+
+    while True:
+        changes = get_changes(db, seq, batch_size)
+        if not changes:
+            break
+        batch = [change for change in changes if not tables or change.table_name in tables]
+        if batch:
+            handler(batch)
+            delivered += len(batch)
+        seq = changes[-1].seq
+        set_checkpoint(db, consumer, seq)
+
+    return delivered
+
+
+def prune_changes(db: Session) -> int:
+    """
+    Delete log rows every registered consumer has already processed, in batches.
+    
+    Checkpoints that haven't moved for CONSUMER_TIMEOUT are dropped first. The newest
+    row of each table is always kept, so get_latest_seq() never goes backwards and can
+    keep serving as a cache version.
+    
+    Returns:
+        Number of rows deleted (0 when no consumer has a checkpoint)
+    """
+    db.query(ChangeCheckpoint).filter(
+        ChangeCheckpoint.updated_at < datetime.now(timezone.utc) - CONSUMER_TIMEOUT
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    oldest = db.query(func.min(ChangeCheckpoint.seq)).scalar()
+    if not oldest:
+        return 0
+    newest_per_table = [seq for (seq,) in db.query(func.max(ChangeLog.seq)).group_by(ChangeLog.table_name)]
+    prunable = db.query(ChangeLog.seq).filter(ChangeLog.seq <= oldest, ChangeLog.seq.notin_(newest_per_table))
+    deleted = 0
+    while True:
+        # Up to the PRUNE_BATCH_ROWS-th prunable row, or all of them when fewer are left
+        batch_end = prunable.order_by(ChangeLog.seq).offset(PRUNE_BATCH_ROWS - 1).limit(1).scalar() or oldest
+        count = db.query(ChangeLog).filter(
+            ChangeLog.seq <= batch_end, ChangeLog.seq.notin_(newest_per_table)
+        ).delete(synchronize_session=False)
+        db.commit()
+        deleted += count
+        if batch_end >= oldest or not count:
+            return deleted
+
+
+def start_prune_scheduler(interval_hours: float = PRUNE_INTERVAL_HOURS,
+                          check_every: float = 3600.0) -> Optional[threading.Thread]:
+    """
+    Queue a 'prune_changes' background job every interval_hours.
+
+    Runs on a daemon thread (no-op when interval_hours is 0). The app and the API can
+    both run it: no job is queued while another is active or one was queued within
+    the interval.
+    """
+    if not interval_hours:
+        return None
+
+    def run():
+        from database import SessionLocal
+        from models import Job
+        from job_helpers import ACTIVE_STATUSES, submit_job
+
+        while True:
+            try:
+                with SessionLocal() as db:
+                    recent = db.query(Job.id).filter(Job.kind == "prune_changes", or_(
+                        Job.status.in_(ACTIVE_STATUSES),
+                        Job.created_at >= datetime.now(timezone.utc) - timedelta(hours=interval_hours)
+                    )).first()
+                    if not recent:
+                        submit_job(db, "prune_changes")
+            except Exception:
+                pass  # Try again at the next check
+            time.sleep(check_every)
+
+    thread = threading.Thread(target=run, name="prune-scheduler", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,180 @@
+"""
+History chart building: LTTB downsampling and compact Plotly figure payloads.
+
+Figures are returned as Plotly JSON strings so callers can cache them (keyed on the date
+range and data version) and skip both the query and the figure build on reruns.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from models import DailyMetrics
+
+# Target number of points sent to the browser per series (the page is ~600px wide)
+DEFAULT_MAX_POINTS = 300
+
+# Series longer than this are drawn with WebGL (Scattergl) instead of SVG
+WEBGL_THRESHOLD = 365
+
+CHART_LAYOUT = dict(showlegend=False, margin=dict(l=0, r=0, t=10, b=0), height=200)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, for each of threshold - 2 buckets in between,
+    the point forming the largest triangle with the previously kept point and the
+    average of the next bucket. This preserves peaks and troughs far better than
+    taking every n-th point.
+
+    Returns:
+        Sorted indices of the points to keep
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    a = 0
+
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+
+    kept[-1] = n - 1
+    return kept
+
+
+def downsample(dates: List[date], values: np.ndarray, max_points: int):
+    """Downsample a date series with LTTB, returning (dates, values)."""
+    if len(dates) <= max_points:
+        return dates, values
+    x = np.array([d.toordinal() for d in dates], dtype=float)
+    kept = lttb(x, values, max_points)
+    return [dates[i] for i in kept], values[kept]
+
+
+def trailing_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Rolling mean over the previous window values (fewer at the start, like min_periods=1)."""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    idx = np.arange(1, len(values) + 1)
+    starts = np.maximum(idx - window, 0)
+    return (sums[idx] - sums[starts]) / (idx - starts)
+
+
+def _line_figure(dates: List[date], values: np.ndarray, total_points: int, max_points: int,
+                 markers: bool = False, color: Optional[str] = None, zero_line: bool = False) -> str:
+    import plotly.graph_objects as go
+
+    dates, values = downsample(dates, values, max_points)
+    trace = go.Scattergl if total_points > WEBGL_THRESHOLD else go.Scatter
+    line = dict(color=color, width=2) if color else None
+
+    fig = go.Figure()
+    fig.add_trace(trace(
+        x=[d.isoformat() for d in dates],
+        y=values.astype(np.float32),
+        mode='lines+markers' if markers and total_points <= WEBGL_THRESHOLD else 'lines',
+        line=line
+    ))
+    if zero_line:
+        fig.add_hline(y=0, line_dash="dash", line_color="gray")
+    fig.update_layout(**CHART_LAYOUT)
+    return fig.to_json()
+
+
+def build_history_figures(db: Session, from_date: date, to_date: date,
+                          max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Optional[str]]:
+    """
+    Build the History charts for a date range.
+
+    Returns:
+        Dictionary with 'weight' and 'balance' Plotly JSON strings (None when there is
+        too little data) and 'points' with the raw point count of each series
+    """
+    rows = db.query(
+        DailyMetrics.date,
+        DailyMetrics.weight_kg,
+        DailyMetrics.calorie_balance.label("calorie_balance")
+    ).filter(
+        DailyMetrics.date >= from_date,
+        DailyMetrics.date <= to_date
+    ).order_by(DailyMetrics.date).all()
+
+    weight_rows = [(r.date, r.weight_kg) for r in rows if r.weight_kg is not None]
+    balance_rows = [(r.date, r.calorie_balance) for r in rows if r.calorie_balance is not None]
+
+    result = {'weight': None, 'balance': None,
+              'points': {'weight': len(weight_rows), 'balance': len(balance_rows)}}
+
+    if weight_rows:
+        dates, values = zip(*weight_rows)
+        result['weight'] = _line_figure(list(dates), np.array(values, dtype=float), len(weight_rows),
+                                        max_points, markers=True)
+
+    if len(balance_rows) >= 3:
+        dates, values = zip(*balance_rows)
+        rolling = trailing_mean(np.array(values, dtype=float), 7)
+        result['balance'] = _line_figure(list(dates), rolling, len(balance_rows), max_points,
+                                         color='#4ECDC4', zero_line=True)
+
+    return result
+
+
+# One color per WeightMode value, used by the projection chart
+MODE_COLORS = {
+    'maintenance': '#4ECDC4',
+    'loss_gentle': '#FFD166',
+    'loss_standard': '#F78C6B',
+    'loss_aggressive': '#EF476F',
+}
+
+
+def _translucent(color: Optional[str], alpha: float) -> Optional[str]:
+    """'#RRGGBB' as an rgba() string with the given alpha."""
+    if not color:
+        return None
+    r, g, b = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({r},{g},{b},{alpha})"
+
+
+def build_projection_figure(projection: Dict, labels: Dict[str, str]) -> str:
+    """
+    Build the weight projection chart: a median line and a 10th-90th percentile band per mode.
+
+    Args:
+        projection: Result of projection_helpers.project_weight
+        labels: Display name per mode value
+
+    Returns:
+        Plotly JSON string
+    """
+    import plotly.graph_objects as go
+
+    start = projection['start_date']
+    x = [(start + timedelta(days=i)).isoformat() for i in range(projection['days'])]
+
+    fig = go.Figure()
+    for mode, band in projection['modes'].items():
+        color = MODE_COLORS.get(mode)
+        fig.add_trace(go.Scatter(x=x, y=band['p90'], mode='lines', line=dict(width=0),
+                                 hoverinfo='skip', showlegend=False, legendgroup=mode))
+        fig.add_trace(go.Scatter(x=x, y=band['p10'], mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor=_translucent(color, 0.2), hoverinfo='skip', showlegend=False,
+                                 legendgroup=mode))
+        fig.add_trace(go.Scatter(x=x, y=band['p50'], mode='lines', line=dict(color=color, width=2),
+                                 name=labels.get(mode, mode), legendgroup=mode))
+    fig.update_layout(**{**CHART_LAYOUT, 'showlegend': True, 'height': 280},
+                      legend=dict(orientation='h', y=-0.15))
+    return fig.to_json()
@@ -0,0 +1,198 @@
+"""
+Set-based verification and repair of the denormalized DailyMetrics columns.
+
+calories_eaten, protein_total_g, daily_calorie_target, protein_target_g and
+effective_weight_kg are recomputed for the whole history at once: entry totals with one grouped query (plus
+the archived months), calorie targets with a vectorized rolling burn window and
+protein targets with a forward-filled weight series. The result is diffed against
+the stored values, and repair_derived_columns writes every fix in one transaction.
+
+The rules mirror recompute_daily_totals and recalculate_target_for_date:
+    calories_eaten / protein_total_g  sum of the day's entries; only checked for days
+                                      that have entries, since imported history
+                                      carries totals without entries
+    daily_calorie_target              rolling burn average over maintenance_window_days
+                                      (maintenance_calories with fewer than 7 burn
+                                      days), minus the day's mode deficit, floor 1500
+    protein_target_g                  2 g/kg of the day's weight, or of the most recent
+                                      earlier weight; only checked where unset, since
+                                      manual overrides are kept
+    effective_weight_kg               the day's weight, or the most recent earlier one
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import bindparam, func
+from sqlalchemy.orm import Session
+from models import CalorieEntry, DailyMetrics
+from settings_helpers import get_or_create_settings
+from rolling_average_helpers import MIN_CALORIE_TARGET, effective_window_days, get_deficit_percent_for_mode
+from archive_helpers import get_archived_rows
+from changelog_helpers import record_changes
+
+DERIVED_COLUMNS = ("calories_eaten", "protein_total_g", "daily_calorie_target", "protein_target_g",
+                   "effective_weight_kg")
+
+# Stored values within this many kcal/grams of the expected value count as equal
+DEFAULT_TOLERANCE = 0.01
+
+# Same floor and minimum sample size as the rolling target helpers
+MIN_TARGET = MIN_CALORIE_TARGET
+MIN_BURN_DAYS = 7
+
+
+def _entry_totals(db: Session) -> Dict[date, List[float]]:
+    """Calories and protein per day over hot and archived entries."""
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for day, calories, protein in db.query(
+        CalorieEntry.date,
+        func.sum(CalorieEntry.calories),
+        func.coalesce(func.sum(CalorieEntry.protein_g), 0.0)
+    ).group_by(CalorieEntry.date):
+        totals[day][0] += calories or 0.0
+        totals[day][1] += protein
+
+    for row in get_archived_rows(db, date.min, date.max):
+        totals[row["date"]][0] += row["calories"] or 0.0
+        totals[row["date"]][1] += row["protein_g"] or 0.0
+    return totals
+
+
+def verify_derived_columns(db: Session, tolerance: float = DEFAULT_TOLERANCE) -> List[Dict[str, Any]]:
+    """
+    Recompute every derived DailyMetrics value and diff it against the stored one.
+    
+    Returns:
+        One dict per mismatch with 'date', 'column', 'stored' and 'expected'. Days
+        that have entries but no DailyMetrics row are reported with column 'row' and
+        'expected' holding the values of the row to create.
+    """
+    settings = get_or_create_settings(db)
+    rows = db.query(
+        DailyMetrics.date,
+        DailyMetrics.weight_kg,
+        DailyMetrics.calories_burned_total,
+        DailyMetrics.calories_eaten,
+        DailyMetrics.protein_total_g,
+        DailyMetrics.daily_calorie_target,
+        DailyMetrics.protein_target_g,
+        DailyMetrics.effective_weight_kg,
+        DailyMetrics.mode
+    ).order_by(DailyMetrics.date).all()
+    totals = _entry_totals(db)
+
+    days = sorted({row.date for row in rows} | set(totals))
+    if not days:
+        return []
+
+    window_days = effective_window_days(settings.maintenance_window_days, MIN_BURN_DAYS)
+
+    # Dense day-indexed series, padded with one window of empty days before the first
+    start = days[0] - timedelta(days=window_days - 1)
+    n = (days[-1] - start).days + 1
+    burn = np.full(n, np.nan)
+    weight = np.full(n, np.nan)
+    deficit = np.full(n, get_deficit_percent_for_mode(settings.current_mode, settings))
+    for row in rows:
+        offset = (row.date - start).days
+        if row.calories_burned_total is not None:
+            burn[offset] = row.calories_burned_total
+        if row.weight_kg is not None:
+            weight[offset] = row.weight_kg
+        if row.mode is not None:
+            deficit[offset] = get_deficit_percent_for_mode(row.mode, settings)
+
+    # Rolling burn average over the window ending on each day (the first padded days have no full window)
+    has_burn = ~np.isnan(burn)
+    burn_sum = np.concatenate((np.zeros(window_days - 1), sliding_window_view(np.where(has_burn, burn, 0.0), window_days).sum(axis=1)))
+    burn_count = np.concatenate((np.zeros(window_days - 1), sliding_window_view(has_burn.astype(float), window_days).sum(axis=1)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rolling = np.where(burn_count >= MIN_BURN_DAYS, burn_sum / np.maximum(burn_count, 1), settings.maintenance_calories)
+    target = np.maximum(rolling * (1.0 - deficit), MIN_TARGET)
+
+    # Most recent weight strictly before each day, for the protein target fallback
+    last_index = np.where(~np.isnan(weight), np.arange(n), -1)
+    last_index = np.maximum.accumulate(last_index)
+    previous_index = np.concatenate(([-1], last_index[:-1]))
+    previous_weight = np.where(previous_index >= 0, weight[np.maximum(previous_index, 0)], np.nan)
+    effective_weight = np.where(np.isnan(weight), previous_weight, weight)
+
+    def optional(value: float):
+        return None if np.isnan(value) else float(value)
+
+    def differs(stored, expected) -> bool:
+        if stored is None or expected is None:
+            return stored is not expected
+        return abs(stored - expected) > tolerance
+
+    mismatches = []
+    stored_days = set()
+    for row in rows:
+        offset = (row.date - start).days
+        stored_days.add(row.date)
+        expected = {"daily_calorie_target": float(target[offset]),
+                    "effective_weight_kg": optional(effective_weight[offset])}
+        if row.date in totals:
+            expected["calories_eaten"], expected["protein_total_g"] = totals[row.date]
+        if row.protein_target_g in (None, 0) and expected["effective_weight_kg"]:
+            expected["protein_target_g"] = float(round(expected["effective_weight_kg"] * 2.0))
+
+        for column in DERIVED_COLUMNS:
+            if column in expected and differs(getattr(row, column), expected[column]):
+                mismatches.append({"date": row.date, "column": column,
+                                   "stored": getattr(row, column), "expected": expected[column]})
+
+    for day in sorted(set(totals) - stored_days):
+        offset = (day - start).days
+        calories, protein = totals[day]
+        expected = {
+            "calories_eaten": calories,
+            "protein_total_g": protein,
+            "daily_calorie_target": float(target[offset]),
+            "protein_target_g": None,
+            "effective_weight_kg": optional(previous_weight[offset]),
+            "mode": settings.current_mode,
+        }
+        if expected["effective_weight_kg"]:
+            expected["protein_target_g"] = float(round(expected["effective_weight_kg"] * 2.0))
+        mismatches.append({"date": day, "column": "row", "stored": None, "expected": expected})
+
+    mismatches.sort(key=lambda m: (m["date"], m["column"]))
+    return mismatches
+
+
+def repair_derived_columns(db: Session, mismatches: List[Dict[str, Any]]) -> int:
+    """
+    Write the expected values from verify_derived_columns in a single transaction.
+    
+    Returns:
+        Number of values written (a created row counts once)
+    """
+    by_column = defaultdict(list)
+    new_rows = []
+    for mismatch in mismatches:
+        if mismatch["column"] == "row":
+            new_rows.append({"date": mismatch["date"], **mismatch["expected"]})
+        else:
+            by_column[mismatch["column"]].append({"day": mismatch["date"], "value": mismatch["expected"]})
+
+    table = DailyMetrics.__table__
+    try:
+        for column, params in by_column.items():
+            stmt = table.update().where(table.c.date == bindparam("day")).values(
+                {column: bindparam("value"), "updated_at": func.now()}
+            )
+            db.execute(stmt, params)
+            record_changes(db, DailyMetrics.__tablename__, [p["day"] for p in params], [column])
+        if new_rows:
+            db.execute(table.insert(), new_rows)
+            record_changes(db, DailyMetrics.__tablename__, [r["date"] for r in new_rows],
+                           list(new_rows[0].keys()), "insert")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return sum(len(params) for params in by_column.values()) + len(new_rows)
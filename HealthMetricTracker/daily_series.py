@@ -0,0 +1,94 @@
+"""
+Compact in-memory daily time series for window math.
+
+A DailySeries is a start date plus one contiguous array('d') per column, with NaN for
+days that have no row or no value. It is loaded with a projection-only Core query, so
+no ORM objects are built, and a date maps to its offset with one subtraction. The
+window methods replace the lists of DailyMetrics objects and generator sums the
+aggregation and rolling-average helpers used to build for every summary.
+"""
+from array import array
+from datetime import date, timedelta
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import DailyMetrics
+
+NAN = float("nan")
+
+DEFAULT_COLUMNS = ("calories_burned_total", "calories_eaten", "weight_kg", "protein_total_g")
+
+
+class DailySeries:
+    __slots__ = ("start", "days", "columns")
+
+    def __init__(self, start: date, days: int, column_names: Sequence[str]):
+        self.start = start
+        self.days = days
+        self.columns: Dict[str, array] = {name: array("d", [NAN]) * days for name in column_names}
+
+    @classmethod
+    def load(cls, db: Session, start: date, end: date,
+             columns: Sequence[str] = DEFAULT_COLUMNS) -> "DailySeries":
+        """Load columns of DailyMetrics for start..end (inclusive) in one projection query."""
+        series = cls(start, max((end - start).days + 1, 0), columns)
+        stmt = select(DailyMetrics.date, *[getattr(DailyMetrics, name) for name in columns]).where(
+            DailyMetrics.date >= start,
+            DailyMetrics.date <= end
+        )
+        arrays = [series.columns[name] for name in columns]
+        for row in db.execute(stmt):
+            offset = (row[0] - start).days
+            for values, value in zip(arrays, row[1:]):
+                if value is not None:
+                    values[offset] = value
+        return series
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.days - 1)
+
+    def __len__(self) -> int:
+        return self.days
+
+    def offset(self, day: date) -> int:
+        return (day - self.start).days
+
+    def get(self, column: str, day: date) -> Optional[float]:
+        """Value on a day, or None when the day is missing or outside the series."""
+        offset = self.offset(day)
+        if not 0 <= offset < self.days:
+            return None
+        value = self.columns[column][offset]
+        return None if value != value else value
+
+    def _bounds(self, end: date, days: int) -> Tuple[int, int]:
+        stop = min(self.offset(end) + 1, self.days)
+        return max(stop - days, 0), max(stop, 0)
+
+    def window(self, column: str, end: date, days: int) -> Iterator[float]:
+        """Present (non-NaN) values in the days-long window ending on end."""
+        first, stop = self._bounds(end, days)
+        return (value for value in self.columns[column][first:stop] if value == value)
+
+    def window_sum(self, column: str, end: date, days: int) -> float:
+        """Sum of present values in the window (missing days count as 0)."""
+        return sum(self.window(column, end, days))
+
+    def window_count(self, column: str, end: date, days: int) -> int:
+        """Number of days with a value in the window."""
+        return sum(1 for _ in self.window(column, end, days))
+
+    def window_mean(self, column: str, end: date, days: int) -> Optional[float]:
+        """Mean over the days that have a value, or None when none do."""
+        total, count = 0.0, 0
+        for value in self.window(column, end, days):
+            total += value
+            count += 1
+        return total / count if count else None
+
+    def window_pairs(self, first_column: str, second_column: str, end: date,
+                     days: int) -> Iterator[Tuple[float, float]]:
+        """(first, second) pairs for each day in the window; missing values are NaN."""
+        first, stop = self._bounds(end, days)
+        return zip(self.columns[first_column][first:stop], self.columns[second_column][first:stop])
@@ -0,0 +1,262 @@
+"""
+Entry analytics cube: calorie entries aggregated by hour of day, weekday, planned slot,
+place and flags.
+
+entry_patterns holds one row per combination of those dimensions that has entries,
+with the entry count and the calorie and protein sums, over hot and archived entries.
+Its size depends on how varied the entries are, not on how many there are, so slicing
+the eating-patterns view by any dimension sums a few hundred cells instead of
+grouping every entry on each rerun.
+
+The cube is maintained incrementally. An after_flush listener turns CalorieEntry
+inserts, deletes and edits into deltas (the source columns keep active history, so an
+edit to an expired entry still knows its old cell) and applies them with one native
+upsert on the flush's connection, so they commit or roll back together with the write.
+Core deletes that bypass the ORM (clear_day_data, archived entry deletes) call
+remove_entries explicitly. Archiving moves entries without changing the cube.
+rebuild_entry_patterns recomputes it from scratch, for the migration and for repairs.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event, func
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+from models import CalorieEntry, EntryPattern
+
+PATTERN_DIMENSIONS = ("hour", "weekday", "planned_slot", "place", "star_flag", "vl_flag")
+MEASURES = ("entry_count", "calories", "protein_g")
+
+# Entry columns the cell and measures are computed from
+SOURCE_FIELDS = ("date", "time", "planned_slot", "place", "star_flag", "vl_flag", "calories", "protein_g")
+
+# hour value for entries logged without a time
+NO_HOUR = -1
+
+DIMENSION_LABELS = {
+    "hour": "Hour", "weekday": "Weekday", "planned_slot": "Meal",
+    "place": "Place", "star_flag": "Star flag", "vl_flag": "V/L flag",
+}
+
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# Cells whose sums differ by more than this count as mismatched in verify_entry_patterns
+TOLERANCE = 0.01
+
+Cell = Tuple[int, int, str, str, str, str]
+
+
+def entry_cell(values: Dict[str, Any]) -> Cell:
+    """The cube cell of an entry, from a dict of its SOURCE_FIELDS."""
+    entry_time = values["time"]
+    return (
+        entry_time.hour if entry_time is not None else NO_HOUR,
+        values["date"].weekday(),
+        (values["planned_slot"] or "").strip(),
+        (values["place"] or "").strip(),
+        (values["star_flag"] or "").strip(),
+        (values["vl_flag"] or "").strip(),
+    )
+
+
+def format_dimension_value(dimension: str, value: Any) -> str:
+    """Display text for a cell value ('07:00', 'Tue', 'None' for blanks)."""
+    if dimension == "hour":
+        return "No time" if value == NO_HOUR else f"{value:02d}:00"
+    if dimension == "weekday":
+        return WEEKDAY_NAMES[value]
+    return value or "None"
+
+
+def _entry_values(entry, previous: bool = False) -> Dict[str, Any]:
+    """SOURCE_FIELDS of an entry object or archived row; previous gives the values before unflushed edits."""
+    if isinstance(entry, dict):
+        return {field: entry.get(field) for field in SOURCE_FIELDS}
+    values = {field: getattr(entry, field) for field in SOURCE_FIELDS}
+    if previous:
+        state = sa_inspect(entry)
+        for field in SOURCE_FIELDS:
+            deleted = state.attrs[field].history.deleted
+            if deleted:
+                values[field] = deleted[0]
+    return values
+
+
+def _add_delta(deltas: Dict[Cell, List[float]], values: Dict[str, Any], sign: int) -> None:
+    delta = deltas[entry_cell(values)]
+    delta[0] += sign
+    delta[1] += sign * (values["calories"] or 0.0)
+    delta[2] += sign * (values["protein_g"] or 0.0)
+
+
+def _insert(connection):
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(EntryPattern)
+
+
+def apply_deltas(connection, deltas: Dict[Cell, List[float]]) -> int:
+    """
+    Add (count, calories, protein) deltas to their cells with one upsert; emptied cells are deleted.
+
+    Returns:
+        Number of cells touched
+    """
+    rows = [
+        {**dict(zip(PATTERN_DIMENSIONS, cell)), **dict(zip(MEASURES, delta))}
+        for cell, delta in deltas.items() if any(delta)
+    ]
+    if not rows:
+        return 0
+
+    stmt = _insert(connection)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(PATTERN_DIMENSIONS),
+        set_={measure: getattr(EntryPattern, measure) + stmt.excluded[measure] for measure in MEASURES}
+    )
+    connection.execute(stmt, rows)
+    if any(row["entry_count"] < 0 for row in rows):
+        connection.execute(EntryPattern.__table__.delete().where(EntryPattern.entry_count <= 0))
+    return len(rows)
+
+
+def _on_source_set(target, value, oldvalue, initiator) -> None:
+    """No-op; registered with active_history so setting an expired attribute loads the old value."""
+
+
+# Edits to expired entries (any entry after a commit) would otherwise have no old value
+# in their history, and the flush couldn't take the entry out of its previous cell
+for _field in SOURCE_FIELDS:
+    event.listen(getattr(CalorieEntry, _field), "set", _on_source_set, active_history=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_flush_deltas(session: Session, flush_context) -> None:
+    deltas: Dict[Cell, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    for obj in session.new:
+        if isinstance(obj, CalorieEntry):
+            _add_delta(deltas, _entry_values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, CalorieEntry):
+            _add_delta(deltas, _entry_values(obj, previous=True), -1)
+    for obj in session.dirty:
+        if isinstance(obj, CalorieEntry):
+            before, after = _entry_values(obj, previous=True), _entry_values(obj)
+            if before != after:
+                _add_delta(deltas, before, -1)
+                _add_delta(deltas, after, 1)
+
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def remove_entries(db: Session, entries: Iterable[Any]) -> int:
+    """
+    Take entries deleted by a Core statement out of the cube (caller commits).
+
+    Args:
+        db: Database session
+        entries: CalorieEntry objects or archived entry dicts, read before the delete
+
+    Returns:
+        Number of cells touched
+    """
+    deltas: Dict[Cell, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    for entry in entries:
+        _add_delta(deltas, _entry_values(entry), -1)
+    return apply_deltas(db.connection(), deltas)
+
+
+def _expected_cells(db: Session) -> Dict[Cell, List[float]]:
+    """The cube recomputed from every hot and archived entry."""
+    from archive_helpers import get_archived_rows
+
+    cells: Dict[Cell, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    columns = [getattr(CalorieEntry, field) for field in SOURCE_FIELDS]
+    for row in db.query(*columns).yield_per(5000):
+        _add_delta(cells, dict(zip(SOURCE_FIELDS, row)), 1)
+    for row in get_archived_rows(db, date.min, date.max):
+        _add_delta(cells, _entry_values(row), 1)
+    return cells
+
+
+def rebuild_entry_patterns(db: Session) -> int:
+    """
+    Replace the cube with one recomputed from every hot and archived entry, and commit.
+
+    Returns:
+        Number of cells written
+    """
+    cells = _expected_cells(db)
+    db.execute(EntryPattern.__table__.delete())
+    if cells:
+        db.execute(EntryPattern.__table__.insert(), [
+            {**dict(zip(PATTERN_DIMENSIONS, cell)), **dict(zip(MEASURES, totals))}
+            for cell, totals in cells.items()
+        ])
+    db.commit()
+    return len(cells)
+
+
+def verify_entry_patterns(db: Session) -> int:
+    """Number of cube cells that are missing, extra or off compared with a full recomputation."""
+    expected = _expected_cells(db)
+    stored = {
+        tuple(row[:len(PATTERN_DIMENSIONS)]): list(row[len(PATTERN_DIMENSIONS):])
+        for row in db.query(*(getattr(EntryPattern, c) for c in PATTERN_DIMENSIONS + MEASURES))
+    }
+    mismatched = 0
+    for cell in expected.keys() | stored.keys():
+        want, have = expected.get(cell, [0, 0.0, 0.0]), stored.get(cell, [0, 0.0, 0.0])
+        if any(abs(a - b) > TOLERANCE for a, b in zip(want, have)):
+            mismatched += 1
+    return mismatched
+
+
+def get_entry_patterns(db: Session, by: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Entry totals per value of one dimension, read from the cube.
+
+    Args:
+        db: Database session
+        by: One of PATTERN_DIMENSIONS
+        filters: Only count cells with these dimension values (e.g. {'planned_slot': 'Lunch'})
+
+    Returns:
+        One dict per value, in value order, with 'value', 'entries', 'calories',
+        'protein_g', 'avg_calories' and 'share' (of all matching calories)
+    """
+    for dimension in [by, *(filters or {})]:
+        if dimension not in PATTERN_DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dimension}', expected one of {PATTERN_DIMENSIONS}")
+
+    column = getattr(EntryPattern, by)
+    query = db.query(
+        column,
+        func.sum(EntryPattern.entry_count),
+        func.sum(EntryPattern.calories),
+        func.sum(EntryPattern.protein_g)
+    ).group_by(column).order_by(column)
+    for dimension, value in (filters or {}).items():
+        query = query.filter(getattr(EntryPattern, dimension) == value)
+
+    rows = query.all()
+    total_calories = sum(calories for _, _, calories, _ in rows) or 1.0
+    return [{
+        'value': value,
+        'entries': count,
+        'calories': calories,
+        'protein_g': protein,
+        'avg_calories': calories / count if count else 0.0,
+        'share': calories / total_calories,
+    } for value, count, calories, protein in rows if count]
+
+
+def get_dimension_values(db: Session, dimension: str) -> List[Any]:
+    """Distinct values of a dimension present in the cube, for filter choices."""
+    if dimension not in PATTERN_DIMENSIONS:
+        raise ValueError(f"Unknown dimension '{dimension}', expected one of {PATTERN_DIMENSIONS}")
+    column = getattr(EntryPattern, dimension)
+    return [value for (value,) in db.query(column).distinct().order_by(column)]
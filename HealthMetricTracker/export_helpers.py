@@ -0,0 +1,220 @@
+"""
+Streaming export of DailyMetrics and CalorieEntry rows to CSV, JSON Lines and Parquet.
+
+Rows are read with server-side iteration (yield_per) and written incrementally, so
+memory stays flat no matter how long the history is.
+"""
+import csv
+import heapq
+import io
+import json
+from datetime import date, time
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import DailyMetrics, CalorieEntry
+from archive_helpers import get_archived_rows
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_DATASETS = ("metrics", "entries")
+
+# (export column, model column). Metric headers match import_initial_csv so an
+# exported metrics CSV can be imported again without changes.
+METRICS_COLUMNS: List[Tuple[str, Any]] = [
+    ("DATE", DailyMetrics.date),
+    ("steps", DailyMetrics.steps),
+    ("weight_kg", DailyMetrics.weight_kg),
+    ("total_burned_kcal", DailyMetrics.calories_burned_total),
+    ("active_kcal", DailyMetrics.calories_burned_active),
+    ("basal_kcal", DailyMetrics.calories_burned_basal),
+    ("calories_eaten", DailyMetrics.calories_eaten),
+    ("daily_calorie_target", DailyMetrics.daily_calorie_target),
+    ("mode", DailyMetrics.mode),
+    ("protein_total_g", DailyMetrics.protein_total_g),
+    ("protein_target_g", DailyMetrics.protein_target_g),
+]
+
+ENTRIES_COLUMNS: List[Tuple[str, Any]] = [
+    ("id", CalorieEntry.id),
+    ("date", CalorieEntry.date),
+    ("time", CalorieEntry.time),
+    ("description", CalorieEntry.description),
+    ("calories", CalorieEntry.calories),
+    ("protein_g", CalorieEntry.protein_g),
+    ("place", CalorieEntry.place),
+    ("star_flag", CalorieEntry.star_flag),
+    ("vl_flag", CalorieEntry.vl_flag),
+    ("planned_slot", CalorieEntry.planned_slot),
+    ("context_comments", CalorieEntry.context_comments),
+]
+
+# Arrow type names per export column, used to build the Parquet schema
+PARQUET_TYPES = {
+    "DATE": "date32", "date": "date32", "time": "string",
+    "steps": "int64", "id": "int64",
+    "mode": "string", "description": "string", "place": "string", "star_flag": "string",
+    "vl_flag": "string", "planned_slot": "string", "context_comments": "string",
+}
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def get_export_columns(dataset: str) -> List[Tuple[str, Any]]:
+    """Get the (name, column) list for 'metrics' or 'entries'."""
+    if dataset == "metrics":
+        return METRICS_COLUMNS
+    if dataset == "entries":
+        return ENTRIES_COLUMNS
+    raise ValueError(f"Unknown dataset '{dataset}', expected one of {EXPORT_DATASETS}")
+
+
+def iter_export_rows(db: Session, dataset: str, start_date: date, end_date: date,
+                     batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Yield export rows as plain dicts, ordered by date.
+
+    Only the exported columns are selected and results are fetched in batches of
+    batch_size, so no ORM objects are built and the full range is never held in memory.
+    Archived calorie entries (see archive_helpers) are merged into the entries stream.
+    """
+    columns = get_export_columns(dataset)
+    date_column = columns[0][1] if dataset == "metrics" else CalorieEntry.date
+    # Entries without a time first, on every dialect, to match the merge key below
+    order = [date_column] if dataset == "metrics" else [
+        CalorieEntry.date, CalorieEntry.time.asc().nullsfirst(), CalorieEntry.id
+    ]
+
+    stmt = select(*[col for _, col in columns]).where(
+        date_column >= start_date,
+        date_column <= end_date
+    ).order_by(*order).execution_options(yield_per=batch_size)
+
+    names = [name for name, _ in columns]
+    rows = ({name: (value.value if isinstance(value, Enum) else value) for name, value in zip(names, row)}
+            for row in db.execute(stmt))
+
+    if dataset == "entries":
+        # Archived entries stream in order one month at a time; merge them into the stream
+        archived = ({name: row[name] for name in names} for row in get_archived_rows(db, start_date, end_date))
+        rows = heapq.merge(rows, archived, key=lambda row: (
+            row["date"], row["time"] is not None, row["time"] or time.min, row["id"]
+        ))
+
+    yield from rows
+
+
+def _plain(value):
+    """Convert dates and times to ISO strings for text formats."""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(rows: Iterator[Dict[str, Any]], names: List[str], chunk_rows: int = 500) -> Iterator[str]:
+    """Yield CSV text in chunks of chunk_rows rows, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    pending = 0
+
+    for row in rows:
+        writer.writerow(["" if row[name] is None else _plain(row[name]) for name in names])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+def stream_jsonl(rows: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """Yield one JSON document per line."""
+    for row in rows:
+        yield json.dumps({key: _plain(value) for key, value in row.items()}) + "\n"
+
+
+def write_parquet(rows: Iterator[Dict[str, Any]], names: List[str], sink, row_group_size: int = 10000) -> int:
+    """
+    Write rows to a Parquet file one row group at a time.
+
+    Args:
+        rows: Row dicts from iter_export_rows
+        names: Export column names
+        sink: Path or binary file object
+        row_group_size: Rows buffered before each row group is flushed
+
+    Returns:
+        Number of rows written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, getattr(pa, PARQUET_TYPES.get(name, "float64"))()) for name in names])
+    count = 0
+    batch = {name: [] for name in names}
+
+    with pq.ParquetWriter(sink, schema) as writer:
+        for row in rows:
+            for name in names:
+                value = row[name]
+                batch[name].append(value.isoformat() if name == "time" and value is not None else value)
+            count += 1
+            if count % row_group_size == 0:
+                writer.write_table(pa.table(batch, schema=schema))
+                batch = {name: [] for name in names}
+
+        if batch[names[0]] or count == 0:
+            writer.write_table(pa.table(batch, schema=schema))
+
+    return count
+
+
+def export_data(db: Session, dataset: str, fmt: str, start_date: date, end_date: date, fileobj) -> int:
+    """
+    Export a dataset over a date range into an open file object.
+
+    Args:
+        db: Database session
+        dataset: 'metrics' (DailyMetrics) or 'entries' (CalorieEntry)
+        fmt: 'csv', 'jsonl' or 'parquet'
+        start_date: First date included
+        end_date: Last date included
+        fileobj: Binary file object to write to
+
+    Returns:
+        Number of rows exported
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {EXPORT_FORMATS}")
+
+    names = [name for name, _ in get_export_columns(dataset)]
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    rows = counted(iter_export_rows(db, dataset, start_date, end_date))
+
+    if fmt == "parquet":
+        return write_parquet(rows, names, fileobj)
+
+    chunks = stream_csv(rows, names) if fmt == "csv" else stream_jsonl(rows)
+    for chunk in chunks:
+        fileobj.write(chunk.encode("utf-8"))
+
+    return count
+
+
+def get_export_filename(dataset: str, fmt: str, start_date: date, end_date: date) -> str:
+    """Build a descriptive file name such as metrics_2025-09-01_2025-12-31.csv."""
+    return f"{dataset}_{start_date.isoformat()}_{end_date.isoformat()}.{fmt}"
@@ -0,0 +1,41 @@
+"""
+CLI for exporting DailyMetrics or CalorieEntry history over a date range.
+
+Usage:
+    python export_history.py metrics csv --from 2025-09-01 --to 2025-12-31 -o metrics.csv
+    python export_history.py entries parquet -o entries.parquet
+"""
+import argparse
+import sys
+from datetime import date
+from database import SessionLocal, init_db
+from export_helpers import EXPORT_DATASETS, EXPORT_FORMATS, export_data, get_export_filename
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export health history to CSV, JSON Lines or Parquet")
+    parser.add_argument("dataset", choices=EXPORT_DATASETS)
+    parser.add_argument("format", choices=EXPORT_FORMATS)
+    parser.add_argument("--from", dest="from_date", type=date.fromisoformat, default=date(2025, 9, 1))
+    parser.add_argument("--to", dest="to_date", type=date.fromisoformat, default=date.today())
+    parser.add_argument("-o", "--output", help="Output file ('-' for stdout, default: generated name)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    output = args.output or get_export_filename(args.dataset, args.format, args.from_date, args.to_date)
+
+    db = SessionLocal()
+    try:
+        if output == "-":
+            count = export_data(db, args.dataset, args.format, args.from_date, args.to_date, sys.stdout.buffer)
+        else:
+            with open(output, "wb") as f:
+                count = export_data(db, args.dataset, args.format, args.from_date, args.to_date, f)
+    finally:
+        db.close()
+
+    print(f"Exported {count} {args.dataset} rows to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
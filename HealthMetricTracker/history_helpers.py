@@ -0,0 +1,122 @@
+"""
+Helpers for the History view: keyset pagination over DailyMetrics by date, and
+balance-ordered and over-target queries.
+
+calorie_balance and is_over_target are hybrid properties whose SQL expressions match
+the expression index and the partial index on daily_metrics, so filtering and sorting
+by them happens in the database instead of over every row in Python.
+"""
+from datetime import date
+from typing import List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import DailyMetrics
+
+HISTORY_PAGE_SIZE = 30
+
+# get_balance_days orderings -> ORDER BY clauses
+BALANCE_ORDERS = {
+    "date": (DailyMetrics.date.desc(),),
+    "surplus": (DailyMetrics.calorie_balance.desc(), DailyMetrics.date.desc()),
+    "deficit": (DailyMetrics.calorie_balance.asc(), DailyMetrics.date.desc()),
+}
+
+_PAGE_COLUMNS = (
+    DailyMetrics.date,
+    DailyMetrics.weight_kg,
+    DailyMetrics.calories_eaten,
+    DailyMetrics.calories_burned_total,
+    DailyMetrics.daily_calorie_target,
+    DailyMetrics.protein_total_g,
+    DailyMetrics.calorie_balance.label("calorie_balance"),
+    DailyMetrics.is_over_target.label("is_over_target"),
+)
+
+
+def get_metrics_page(db: Session, from_date: date, to_date: date, before: Optional[date] = None,
+                     limit: int = HISTORY_PAGE_SIZE, over_target_only: bool = False) -> Tuple[List, Optional[date]]:
+    """
+    Get one page of daily metrics in the range, newest first.
+
+    Uses keyset pagination on the indexed date column (date < before) rather than
+    OFFSET, so every page costs the same however deep it is and however much history
+    the database holds.
+
+    Args:
+        db: Database session
+        from_date: First date of the range
+        to_date: Last date of the range
+        before: Exclusive upper bound from the previous page (None for the first page)
+        limit: Page size
+        over_target_only: Only days eaten past their calorie target
+
+    Returns:
+        (rows with calorie_balance and is_over_target, cursor for the next older page or None when this is the last page)
+    """
+    query = db.query(*_PAGE_COLUMNS).filter(
+        DailyMetrics.date >= from_date,
+        DailyMetrics.date <= to_date
+    )
+    if before is not None:
+        query = query.filter(DailyMetrics.date < before)
+    if over_target_only:
+        query = query.filter(DailyMetrics.is_over_target)
+
+    rows = query.order_by(DailyMetrics.date.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].date
+    return rows, None
+
+
+def get_balance_days(db: Session, from_date: date, to_date: date, order: str = "surplus",
+                     over_target_only: bool = False, limit: Optional[int] = None) -> List:
+    """
+    Get days in the range with a calorie balance, ordered in SQL.
+
+    Args:
+        db: Database session
+        from_date: First date of the range
+        to_date: Last date of the range
+        order: One of BALANCE_ORDERS ('surplus' puts the largest surplus first,
+            'deficit' the largest deficit, 'date' the newest day)
+        over_target_only: Only days eaten past their calorie target
+        limit: Maximum number of days (None for all)
+
+    Returns:
+        Rows with the same columns as get_metrics_page
+    """
+    if order not in BALANCE_ORDERS:
+        raise ValueError(f"Unknown order '{order}', expected one of {tuple(BALANCE_ORDERS)}")
+
+    query = db.query(*_PAGE_COLUMNS).filter(
+        DailyMetrics.date >= from_date,
+        DailyMetrics.date <= to_date,
+        DailyMetrics.calorie_balance.isnot(None)
+    )
+    if over_target_only:
+        query = query.filter(DailyMetrics.is_over_target)
+    query = query.order_by(*BALANCE_ORDERS[order])
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def count_over_target(db: Session, from_date: date, to_date: date) -> Tuple[int, int]:
+    """
+    Count days in the range eaten past their target.
+
+    Returns:
+        (days over target, days with both calories eaten and a target)
+    """
+    over, tracked = db.query(
+        func.count(DailyMetrics.id).filter(DailyMetrics.is_over_target),
+        func.count(DailyMetrics.id).filter(
+            DailyMetrics.calories_eaten.isnot(None),
+            DailyMetrics.daily_calorie_target.isnot(None)
+        )
+    ).filter(
+        DailyMetrics.date >= from_date,
+        DailyMetrics.date <= to_date
+    ).one()
+    return over, tracked
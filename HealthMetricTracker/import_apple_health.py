@@ -0,0 +1,205 @@
+"""
+Import steps, active/basal energy and body mass from an Apple Health export into DailyMetrics.
+
+The export.xml is often several GB, so it is parsed incrementally with iterparse and every
+element is cleared once read. Only small per-day aggregates are kept in memory.
+
+Usage:
+    python import_apple_health.py path/to/export.xml [--from 2025-09-01] [--to 2025-12-31] [--dry-run]
+    python import_apple_health.py path/to/export.zip
+"""
+import argparse
+import os
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Optional
+from database import SessionLocal, init_db
+from calorie_helpers import upsert_metrics
+
+STEP_TYPE = "HKQuantityTypeIdentifierStepCount"
+ACTIVE_TYPE = "HKQuantityTypeIdentifierActiveEnergyBurned"
+BASAL_TYPE = "HKQuantityTypeIdentifierBasalEnergyBurned"
+BODY_MASS_TYPE = "HKQuantityTypeIdentifierBodyMass"
+
+# Record type -> DailyMetrics column. Sum types are totalled per day, body mass keeps the last reading.
+SUM_COLUMNS = {
+    STEP_TYPE: "steps",
+    ACTIVE_TYPE: "calories_burned_active",
+    BASAL_TYPE: "calories_burned_basal",
+}
+
+ENERGY_TO_KCAL = {"kcal": 1.0, "Cal": 1.0, "kJ": 1.0 / 4.184}
+MASS_TO_KG = {"kg": 1.0, "lb": 0.45359237, "g": 0.001}
+
+
+class ProgressReader:
+    """File wrapper that counts bytes read and prints progress and throughput."""
+
+    def __init__(self, fileobj, total_bytes: int, interval: float = 2.0):
+        self.fileobj = fileobj
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.bytes_read = 0
+        self.records = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def read(self, size=-1):
+        chunk = self.fileobj.read(size)
+        self.bytes_read += len(chunk)
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+        return chunk
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        mb = self.bytes_read / 1_000_000
+        pct = f"{self.bytes_read / self.total_bytes * 100:5.1f}% " if self.total_bytes else ""
+        print(f"  {pct}{mb:,.0f} MB read, {self.records:,} records "
+              f"({mb / elapsed:,.1f} MB/s, {self.records / elapsed:,.0f} records/s)", file=sys.stderr)
+
+
+def _record_day(start_date: str) -> date:
+    """Day of a record from its startDate, e.g. '2025-09-01 07:12:03 +0100'."""
+    return date.fromisoformat(start_date[:10])
+
+
+def parse_export(source, from_date: Optional[date] = None, to_date: Optional[date] = None) -> Dict[date, dict]:
+    """
+    Stream an export.xml and aggregate records into per-day DailyMetrics values.
+
+    Steps and energy are summed per day and per source; the largest source total is
+    used so that iPhone and Watch counting the same steps aren't added together.
+    Body mass keeps the reading with the latest startDate of each day.
+
+    Returns:
+        Dictionary of date -> column values
+    """
+    per_source = defaultdict(float)  # (day, column, source) -> total
+    weights = {}  # day -> (startDate, kg)
+
+    context = ET.iterparse(source, events=("start", "end"))
+    _, root = next(context)
+
+    for event, elem in context:
+        if event != "end":
+            continue
+        if elem.tag != "Record":
+            if elem.tag in ("Workout", "ActivitySummary", "Correlation", "ClinicalRecord"):
+                root.clear()
+            continue
+
+        if isinstance(source, ProgressReader):
+            source.records += 1
+
+        record_type = elem.get("type")
+        if record_type in SUM_COLUMNS or record_type == BODY_MASS_TYPE:
+            start = elem.get("startDate", "")
+            day = _record_day(start)
+            if (from_date is None or day >= from_date) and (to_date is None or day <= to_date):
+                try:
+                    value = float(elem.get("value"))
+                except (TypeError, ValueError):
+                    value = None
+
+                unit = elem.get("unit")
+                if value is not None and record_type == BODY_MASS_TYPE:
+                    if unit in MASS_TO_KG and start >= weights.get(day, ("", None))[0]:
+                        weights[day] = (start, value * MASS_TO_KG[unit])
+                elif value is not None and record_type == STEP_TYPE:
+                    per_source[(day, "steps", elem.get("sourceName"))] += value
+                elif value is not None and unit in ENERGY_TO_KCAL:
+                    column = SUM_COLUMNS[record_type]
+                    per_source[(day, column, elem.get("sourceName"))] += value * ENERGY_TO_KCAL[unit]
+
+        # Drop the record and everything parsed before it so memory stays flat
+        elem.clear()
+        root.clear()
+
+    days: Dict[date, dict] = defaultdict(dict)
+    for (day, column, _), total in per_source.items():
+        days[day][column] = max(days[day].get(column, 0.0), total)
+    for day, (_, kg) in weights.items():
+        days[day]["weight_kg"] = round(kg, 2)
+
+    for values in days.values():
+        if "steps" in values:
+            values["steps"] = int(round(values["steps"]))
+        for column in ("calories_burned_active", "calories_burned_basal"):
+            if column in values:
+                values[column] = round(values[column], 1)
+        if "calories_burned_active" in values and "calories_burned_basal" in values:
+            values["calories_burned_total"] = round(
+                values["calories_burned_active"] + values["calories_burned_basal"], 1
+            )
+
+    return dict(days)
+
+
+def _open_export(path: str):
+    """Open export.xml directly or from inside an Apple Health export.zip."""
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        member = next(info for info in archive.infolist() if info.filename.endswith("/export.xml")
+                      or info.filename == "export.xml")
+        return archive.open(member), member.file_size
+    return open(path, "rb"), os.path.getsize(path)
+
+
+def import_apple_health(path: str, from_date: Optional[date] = None, to_date: Optional[date] = None,
+                        dry_run: bool = False) -> int:
+    init_db()
+
+    print(f"Reading Apple Health export: {path}")
+    started = time.monotonic()
+    raw, size = _open_export(path)
+    with raw:
+        reader = ProgressReader(raw, size)
+        days = parse_export(reader, from_date, to_date)
+        reader.report()
+
+    elapsed = time.monotonic() - started
+    print(f"Parsed {reader.records:,} records into {len(days)} days in {elapsed:.1f}s")
+
+    if dry_run or not days:
+        return len(days)
+
+    rows = [{"date": day, **values} for day, values in sorted(days.items())]
+
+    db = SessionLocal()
+    try:
+        results = upsert_metrics(db, rows)
+
+        print(f"\nImport complete!")
+        print(f"Days written: {len(rows)} ({sum(r['created'] for r in results)} new, "
+              f"{sum(bool(r['changed']) for r in results)} changed)")
+        print(f"Total time: {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during import: {e}")
+        raise
+    finally:
+        db.close()
+
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import an Apple Health export.xml or export.zip")
+    parser.add_argument("path")
+    parser.add_argument("--from", dest="from_date", type=date.fromisoformat)
+    parser.add_argument("--to", dest="to_date", type=date.fromisoformat)
+    parser.add_argument("--dry-run", action="store_true", help="Parse and report without writing")
+    args = parser.parse_args(argv)
+
+    import_apple_health(args.path, args.from_date, args.to_date, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
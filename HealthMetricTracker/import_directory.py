@@ -0,0 +1,248 @@
+"""
+Import a directory of CSV / JSON exports (e.g. monthly files from a watch or scale) into DailyMetrics.
+
+Files are parsed in parallel in a process pool and normalized to DailyMetrics columns. The
+results are merged per date with a conflict policy and written in one bulk upsert.
+
+Usage:
+    python import_directory.py path/to/exports [--policy latest|non-null] [--workers 4] [--dry-run]
+
+Conflict policies (files are ordered by modification time, then name):
+    latest    - the row from the latest file wins for that date: its non-empty values are
+                written, and its empty values leave whatever is stored (earlier files don't fill them)
+    non-null  - per column, the latest non-empty value from any file wins
+
+Under both policies an empty value never overwrites a stored one.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Callable, Dict, List, Optional
+import pandas as pd
+from database import SessionLocal, init_db
+from calorie_helpers import upsert_metrics
+
+SUPPORTED_EXTENSIONS = (".csv", ".json", ".jsonl", ".ndjson")
+CONFLICT_POLICIES = ("latest", "non-null")
+
+# Normalized source header -> DailyMetrics column
+COLUMN_ALIASES = {
+    "date": "date", "day": "date",
+    "steps": "steps", "step_count": "steps", "stepcount": "steps",
+    "weight_kg": "weight_kg", "weight": "weight_kg", "body_mass_kg": "weight_kg",
+    "calories_burned_total": "calories_burned_total", "total_burned_kcal": "calories_burned_total",
+    "total_kcal": "calories_burned_total", "total_energy_kcal": "calories_burned_total",
+    "calories_burned_active": "calories_burned_active", "active_kcal": "calories_burned_active",
+    "active_energy_kcal": "calories_burned_active",
+    "calories_burned_basal": "calories_burned_basal", "basal_kcal": "calories_burned_basal",
+    "resting_kcal": "calories_burned_basal", "resting_energy_kcal": "calories_burned_basal",
+    "calories_eaten": "calories_eaten", "eaten_kcal": "calories_eaten",
+    "protein_total_g": "protein_total_g", "protein_g": "protein_total_g",
+}
+
+INTEGER_COLUMNS = {"steps"}
+
+
+def normalize_header(name: str) -> str:
+    return str(name).strip().lower().replace(" ", "_").replace("-", "_").replace("(", "").replace(")", "")
+
+
+def _read_frame(path: str) -> pd.DataFrame:
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    if path.endswith((".jsonl", ".ndjson")):
+        return pd.read_json(path, lines=True)
+
+    with open(path) as f:
+        payload = json.load(f)
+    if isinstance(payload, dict):
+        # Accept {"data": [...]} style wrappers around the record list
+        payload = next((v for v in payload.values() if isinstance(v, list)), [payload])
+    return pd.DataFrame(payload)
+
+
+def parse_file(path: str) -> dict:
+    """
+    Parse one export file into normalized per-date rows. Runs inside a worker process.
+
+    Returns:
+        Dictionary with the file path, its rows (ISO date -> column values, None for
+        empty cells), and report fields
+    """
+    started = time.monotonic()
+    result = {"path": path, "mtime": os.path.getmtime(path), "rows": {}, "ignored_columns": [], "error": None}
+
+    try:
+        df = _read_frame(path)
+        mapping = {}
+        for column in df.columns:
+            target = COLUMN_ALIASES.get(normalize_header(column))
+            if target and target not in mapping.values():
+                mapping[column] = target
+            else:
+                result["ignored_columns"].append(str(column))
+
+        if "date" not in mapping.values():
+            raise ValueError("no date column")
+
+        df = df[list(mapping)].rename(columns=mapping)
+        df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
+        df = df[df["date"].notna()]
+
+        for column in df.columns:
+            if column != "date":
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+
+        # Later rows for the same date inside one file replace earlier ones
+        for record in df.to_dict("records"):
+            day = record.pop("date")
+            values = {}
+            for column, value in record.items():
+                if pd.isna(value):
+                    values[column] = None
+                elif column in INTEGER_COLUMNS:
+                    values[column] = int(value)
+                else:
+                    values[column] = float(value)
+            result["rows"][day.isoformat()] = values
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["seconds"] = time.monotonic() - started
+    return result
+
+
+def merge_results(results: List[dict], policy: str) -> Dict[date, dict]:
+    """
+    Merge parsed files per date, oldest file first, applying the conflict policy.
+
+    Adds a 'dates_won' count to every result for the report.
+    """
+    merged: Dict[str, dict] = {}
+    winners: Dict[str, Dict[str, str]] = {}  # date -> column -> winning path
+
+    for result in sorted(results, key=lambda r: (r["mtime"], r["path"])):
+        for day, values in result["rows"].items():
+            # Empty values are dropped under both policies, so they never reach upsert_metrics
+            present = {column: value for column, value in values.items() if value is not None}
+            if policy == "latest":
+                merged[day] = present
+                winners[day] = {column: result["path"] for column in present}
+            else:
+                merged.setdefault(day, {}).update(present)
+                winners.setdefault(day, {}).update({column: result["path"] for column in present})
+
+    for result in results:
+        result["dates_won"] = sum(1 for cols in winners.values() if result["path"] in cols.values())
+
+    return {date.fromisoformat(day): values for day, values in merged.items()}
+
+
+def find_files(directory: str, recursive: bool = False) -> List[str]:
+    if recursive:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+    else:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(SUPPORTED_EXTENSIONS))
+
+
+def print_report(results: List[dict]):
+    print(f"\n{'File':<40} {'Rows':>6} {'Won':>6} {'Range':>23} {'Time':>7}  Notes")
+    for result in sorted(results, key=lambda r: r["path"]):
+        name = os.path.basename(result["path"])[:40]
+        days = sorted(result["rows"])
+        date_range = f"{days[0]}..{days[-1]}" if days else "-"
+        if result["error"]:
+            notes = f"ERROR: {result['error']}"
+        elif result["ignored_columns"]:
+            notes = "ignored: " + ", ".join(result["ignored_columns"])
+        else:
+            notes = ""
+        print(f"{name:<40} {len(days):>6} {result.get('dates_won', 0):>6} {date_range:>23} "
+              f"{result['seconds']:>6.2f}s  {notes}")
+
+
+def import_directory(directory: str, policy: str = "latest", workers: Optional[int] = None,
+                     recursive: bool = False, dry_run: bool = False,
+                     progress: Optional[Callable[[float, str], None]] = None) -> int:
+    """
+    Parse, merge and write every export in a directory.
+    
+    progress, when given, is called with (fraction, message) after each parsed file and
+    before the write; if it raises (a cancelled job), files not yet parsed are dropped.
+    
+    Returns:
+        Number of days merged (written unless dry_run)
+    """
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError(f"Unknown policy '{policy}', expected one of {CONFLICT_POLICIES}")
+
+    init_db()
+    paths = find_files(directory, recursive)
+    print(f"Found {len(paths)} files in {directory}")
+    if not paths:
+        return 0
+
+    started = time.monotonic()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        results = []
+        for result in executor.map(parse_file, paths):
+            results.append(result)
+            if progress:
+                progress(0.8 * len(results) / len(paths), f"Parsed {len(results)} of {len(paths)} files")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    parse_seconds = time.monotonic() - started
+
+    merged = merge_results(results, policy)
+    print_report(results)
+    print(f"\nParsed {len(paths)} files into {len(merged)} days in {parse_seconds:.2f}s "
+          f"({workers or os.cpu_count()} workers, policy: {policy})")
+
+    if dry_run or not merged:
+        return len(merged)
+
+    rows = [{"date": day, **values} for day, values in sorted(merged.items())]
+    if progress:
+        progress(0.8, f"Writing {len(rows)} days")
+
+    db = SessionLocal()
+    try:
+        results = upsert_metrics(db, rows)
+        print(f"\nImport complete!")
+        print(f"Days written: {len(rows)} ({sum(r['created'] for r in results)} new, "
+              f"{sum(bool(r['changed']) for r in results)} changed)")
+        print(f"Total time: {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during import: {e}")
+        raise
+    finally:
+        db.close()
+
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a directory of CSV/JSON daily exports")
+    parser.add_argument("directory")
+    parser.add_argument("--policy", choices=CONFLICT_POLICIES, default="latest")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and report without writing")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        sys.exit(1)
+
+    import_directory(args.directory, args.policy, args.workers, args.recursive, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+CLI for importing a USDA FoodData Central CSV dump into the offline nutrition database.
+
+Usage:
+    python import_foods.py path/to/FoodData_Central_csv.zip
+    python import_foods.py path/to/extracted/dump
+    python import_foods.py --search "greek yogurt"
+
+The dump is streamed file by file and replaces the foods already imported. Only foods
+with an energy value are kept, with their calories and protein per 100 g, brand and
+household portions. --search runs a lookup against the imported foods and times it.
+"""
+import argparse
+import sys
+import time
+from database import SessionLocal, init_db
+from nutrition_helpers import import_foods, search_foods
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a FoodData Central CSV dump")
+    parser.add_argument("path", nargs="?", help="Dump zip file or extracted directory")
+    parser.add_argument("--search", help="Look up foods instead of importing")
+    args = parser.parse_args(argv)
+
+    if not args.path and not args.search:
+        parser.error("give a dump path or --search")
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.search:
+            started = time.perf_counter()
+            foods = search_foods(db, args.search)
+            elapsed = (time.perf_counter() - started) * 1000
+            for food in foods:
+                protein = f"{food['protein_per_100g']:.1f} g" if food['protein_per_100g'] is not None else "-"
+                brand = f" ({food['brand']})" if food['brand'] else ""
+                print(f"{food['fdc_id']:>8}  {food['calories_per_100g']:6.0f} kcal  {protein:>8}  "
+                      f"{food['description']}{brand}")
+            print(f"{len(foods)} foods in {elapsed:.1f} ms")
+            return
+
+        try:
+            result = import_foods(db, args.path, progress=lambda fraction, message: print(f"{fraction:4.0%}  {message}"))
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        print(f"\nImported {result['foods']:,} foods and {result['portions']:,} portions in {result['seconds']}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
+import sys
 import pandas as pd
-from datetime import datetime
-from sqlalchemy.orm import Session
 from database import SessionLocal, init_db
-from models import DailyMetrics
+from models import WeightMode
+from calorie_helpers import upsert_metrics
 
-def import_csv(csv_path: str = "attached_assets/amin_daily_energy_merged_steps_from_sheet_1763460862421.csv"):
+def import_csv(csv_path: str = "attached_assets/amin_daily_energy_merged_steps_from_sheet_1763460862421.csv",
+               from_date: str = "2025-09-01"):
     init_db()
     
     print(f"Reading CSV file: {csv_path}")
@@ -13,68 +14,59 @@ def import_csv(csv_path: str = "attached_assets/amin_daily_energy_merged_steps_f
     print(f"Total rows in CSV: {len(df)}")
     
     df['DATE'] = pd.to_datetime(df['DATE'])
-    df_filtered = df[df['DATE'] >= '2025-09-01'].copy()
+    df_filtered = df[df['DATE'] >= from_date].copy()
     
-    print(f"Rows from 2025-09-01 onwards: {len(df_filtered)}")
+    print(f"Rows from {from_date} onwards: {len(df_filtered)}")
+    
+    def safe_float(val):
+        if pd.isna(val) or val == '':
+            return None
+        try:
+            return float(val)
+        except (ValueError, TypeError):
+            return None
+    
+    def safe_int(val):
+        if pd.isna(val) or val == '':
+            return None
+        try:
+            return int(float(val))
+        except (ValueError, TypeError):
+            return None
+    
+    rows = []
+    for _, row in df_filtered.iterrows():
+        values = {
+            'date': row['DATE'].date(),
+            'steps': safe_int(row['steps']),
+            'weight_kg': safe_float(row['weight_kg']),
+            'calories_burned_total': safe_float(row['total_burned_kcal']),
+            'calories_burned_active': safe_float(row['active_kcal']),
+            'calories_burned_basal': safe_float(row['basal_kcal']),
+            'calories_eaten': safe_float(row['calories_eaten']),
+        }
+        
+        # Optional columns written by export_history.py (absent in the original sheet);
+        # stored values are kept when they're missing
+        optional = {
+            'daily_calorie_target': safe_float(row.get('daily_calorie_target')),
+            'mode': WeightMode(row['mode']) if isinstance(row.get('mode'), str) and row['mode'] else None,
+            'protein_total_g': safe_float(row.get('protein_total_g')),
+            'protein_target_g': safe_float(row.get('protein_target_g')),
+        }
+        values.update({key: value for key, value in optional.items() if value is not None})
+        rows.append(values)
     
     db = SessionLocal()
     
     try:
-        imported_count = 0
-        updated_count = 0
-        
-        for _, row in df_filtered.iterrows():
-            date_value = row['DATE'].date()
-            
-            existing = db.query(DailyMetrics).filter(DailyMetrics.date == date_value).first()
-            
-            def safe_float(val):
-                if pd.isna(val) or val == '':
-                    return None
-                try:
-                    return float(val)
-                except (ValueError, TypeError):
-                    return None
-            
-            def safe_int(val):
-                if pd.isna(val) or val == '':
-                    return None
-                try:
-                    return int(float(val))
-                except (ValueError, TypeError):
-                    return None
-            
-            if existing:
-                existing.steps = safe_int(row['steps'])
-                existing.weight_kg = safe_float(row['weight_kg'])
-                existing.calories_burned_total = safe_float(row['total_burned_kcal'])
-                existing.calories_burned_active = safe_float(row['active_kcal'])
-                existing.calories_burned_basal = safe_float(row['basal_kcal'])
-                existing.calories_eaten = safe_float(row['calories_eaten'])
-                if existing.daily_calorie_target is None:
-                    existing.daily_calorie_target = 3000.0
-                existing.updated_at = datetime.now()
-                updated_count += 1
-            else:
-                new_metric = DailyMetrics(
-                    date=date_value,
-                    steps=safe_int(row['steps']),
-                    weight_kg=safe_float(row['weight_kg']),
-                    calories_burned_total=safe_float(row['total_burned_kcal']),
-                    calories_burned_active=safe_float(row['active_kcal']),
-                    calories_burned_basal=safe_float(row['basal_kcal']),
-                    calories_eaten=safe_float(row['calories_eaten']),
-                    daily_calorie_target=3000.0
-                )
-                db.add(new_metric)
-                imported_count += 1
-        
-        db.commit()
+        results = upsert_metrics(db, rows)
+        imported_count = sum(result['created'] for result in results)
+        updated_count = sum(bool(result['changed']) and not result['created'] for result in results)
         print(f"\nImport complete!")
         print(f"New records created: {imported_count}")
         print(f"Existing records updated: {updated_count}")
-        print(f"Total records processed: {imported_count + updated_count}")
-        
+        print(f"Total records processed: {len(results)}")
     except Exception as e:
         db.rollback()
         print(f"Error during import: {e}")
@@ -83,4 +75,7 @@ def import_csv(csv_path: str = "attached_assets/amin_daily_energy_merged_steps_f
         db.close()
 
 if __name__ == "__main__":
-    import_csv()
+    if len(sys.argv) > 1:
+        import_csv(*sys.argv[1:3])
+    else:
+        import_csv()
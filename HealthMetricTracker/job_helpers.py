@@ -0,0 +1,373 @@
+"""
+Background jobs for heavy maintenance work (target recalculation, imports, exports,
+verification, archiving, VACUUM, change-log pruning and backups), run off the Streamlit
+rerun and API request path.
+
+Jobs are rows in the jobs table, so their status survives restarts and is visible from
+every process. submit_job inserts a queued row and hands its id to this process's
+worker pool. A worker claims the row with a conditional UPDATE (so a job never runs
+twice), runs the handler with its own session and records the result or error.
+The pool has HEALTH_JOB_WORKERS threads (default 1). SQLite has a single writer, and
+handlers commit in small chunks, so interactive writes interleave with a running job
+instead of waiting behind it.
+
+Handlers report progress through JobContext.progress, which raises JobCancelled once
+cancel_job has been called for the job, so cancellation takes effect at the next progress
+report. A timer thread refreshes the job's heartbeat while its handler runs, so
+recover_jobs, run at start-up, re-queues queued jobs and fails only running jobs whose
+process has died.
+
+Heavy modules (numpy, pandas, pyarrow) are imported inside the handlers, keeping this
+module cheap to import from app.py.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import DailyMetrics, Job
+
+JOB_WORKERS = int(os.environ.get("HEALTH_JOB_WORKERS", "1"))
+
+# Export job output files go here
+JOB_OUTPUT_DIR = os.environ.get("HEALTH_JOB_DIR", "./job_output")
+
+# A running job whose heartbeat is older than this belongs to a dead process
+STALE_AFTER = timedelta(minutes=10)
+
+# How often a running job's heartbeat is refreshed, whether or not its handler reports
+# progress (a single VACUUM or export query can outlast STALE_AFTER)
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+
+# Days of targets recalculated per transaction by the recalculate_targets job
+RECALCULATE_CHUNK_DAYS = 120
+
+# Parser processes for the import_directory job; the job runs inside the app or API
+# process, so it stays small instead of taking every CPU from interactive sessions
+IMPORT_WORKERS = 2
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class ServerPath(str):
+    """Type of job parameters naming a file or directory the job reads on the server."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+
+class JobContext:
+    """What a handler gets: its job id, parameters, a session and progress reporting."""
+
+    def __init__(self, job_id: int, params: Dict[str, Any], db: Session):
+        self.job_id = job_id
+        self.params = params
+        self.db = db
+
+    def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        """Record progress (0..1) and a heartbeat; raises JobCancelled if cancellation was requested."""
+        # A separate session, so the handler's open transaction isn't committed here
+        with SessionLocal() as progress_db:
+            progress_db.execute(
+                update(Job).where(Job.id == self.job_id).values(
+                    progress=min(max(fraction, 0.0), 1.0), message=message, heartbeat_at=datetime.now()
+                )
+            )
+            cancel_requested = progress_db.query(Job.cancel_requested).filter(Job.id == self.job_id).scalar()
+            progress_db.commit()
+        if cancel_requested:
+            raise JobCancelled()
+
+
+# ============================================================================
+# Handlers
+# ============================================================================
+
+def _recalculate_targets(ctx: JobContext) -> Dict[str, Any]:
+    from rolling_average_helpers import recalculate_targets_in_range
+
+    first, last = ctx.db.query(func.min(DailyMetrics.date), func.max(DailyMetrics.date)).one()
+    if first is None:
+        return {"days": 0}
+
+    total_days = (last - first).days + 1
+    updated = 0
+    chunk_start = first
+    while chunk_start <= last:
+        chunk_end = min(chunk_start + timedelta(days=RECALCULATE_CHUNK_DAYS - 1), last)
+        updated += recalculate_targets_in_range(ctx.db, chunk_start, chunk_end)
+        ctx.progress(((chunk_end - first).days + 1) / total_days, f"Recalculated through {chunk_end.isoformat()}")
+        chunk_start = chunk_end + timedelta(days=1)
+    return {"days": updated}
+
+
+def _verify_derived(ctx: JobContext) -> Dict[str, Any]:
+    from consistency_helpers import verify_derived_columns, repair_derived_columns
+    from entry_pattern_helpers import rebuild_entry_patterns, verify_entry_patterns
+
+    ctx.progress(0.0, "Verifying derived columns")
+    mismatches = verify_derived_columns(ctx.db)
+    result = {"mismatches": len(mismatches), "repaired": 0}
+    if mismatches and ctx.params.get("repair", True):
+        ctx.progress(0.5, f"Repairing {len(mismatches)} values")
+        result["repaired"] = repair_derived_columns(ctx.db, mismatches)
+
+    ctx.progress(0.8, "Verifying the entry patterns cube")
+    result["pattern_cells"] = verify_entry_patterns(ctx.db)
+    if result["pattern_cells"] and ctx.params.get("repair", True):
+        rebuild_entry_patterns(ctx.db)
+    return result
+
+
+def _archive_entries(ctx: JobContext) -> Dict[str, Any]:
+    from archive_helpers import ARCHIVE_AFTER_DAYS, archive_calorie_entries, compact_database
+
+    report = archive_calorie_entries(
+        ctx.db, ctx.params.get("older_than_days", ARCHIVE_AFTER_DAYS),
+        progress=lambda fraction, message: ctx.progress(fraction * 0.9, message)
+    )
+    result = {"months": len(report), "entries": sum(month["entries"] for month in report), "pages_freed": 0}
+    if report and ctx.params.get("vacuum", True):
+        ctx.progress(0.9, "Compacting the database file")
+        result["pages_freed"] = compact_database(ctx.db)
+    return result
+
+
+def _compact_database(ctx: JobContext) -> Dict[str, Any]:
+    from archive_helpers import compact_database
+
+    ctx.progress(0.0, "Compacting the database file")
+    return {"pages_freed": compact_database(ctx.db)}
+
+
+def _prune_changes(ctx: JobContext) -> Dict[str, Any]:
+    from changelog_helpers import prune_changes
+
+    ctx.progress(0.0, "Pruning the change log")
+    return {"deleted": prune_changes(ctx.db)}
+
+
+def _backup(ctx: JobContext) -> Dict[str, Any]:
+    from backup_helpers import backup_database
+
+    backup = backup_database(label=ctx.params.get("label"), progress=ctx.progress)
+    return {"file": backup["name"], "kilobytes": round(backup["bytes"] / 1024, 1),
+            "seconds": backup["seconds"], "rotated": backup["rotated"]}
+
+
+def _export(ctx: JobContext) -> Dict[str, Any]:
+    from export_helpers import export_data, get_export_filename
+
+    dataset, fmt = ctx.params["dataset"], ctx.params["format"]
+    start_date = date.fromisoformat(ctx.params["start_date"])
+    end_date = date.fromisoformat(ctx.params["end_date"])
+    file_name = get_export_filename(dataset, fmt, start_date, end_date)
+
+    os.makedirs(JOB_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(JOB_OUTPUT_DIR, f"{ctx.job_id}_{file_name}")
+    ctx.progress(0.0, f"Writing {file_name}")
+    with open(path, "wb") as f:
+        rows = export_data(ctx.db, dataset, fmt, start_date, end_date, f)
+    return {"rows": rows, "path": path, "file_name": file_name}
+
+
+def _import_foods(ctx: JobContext) -> Dict[str, Any]:
+    from nutrition_helpers import import_foods
+
+    return import_foods(ctx.db, ctx.params["path"], progress=ctx.progress)
+
+
+def _import_directory(ctx: JobContext) -> Dict[str, Any]:
+    from import_directory import import_directory
+
+    ctx.progress(0.0, f"Importing {ctx.params['directory']}")
+    days = import_directory(ctx.params["directory"], ctx.params.get("policy", "latest"),
+                            workers=IMPORT_WORKERS, recursive=ctx.params.get("recursive", False),
+                            progress=ctx.progress)
+    return {"days": days}
+
+
+# kind -> (handler, description, params), params being name -> (type, required) like
+# the API's request schemas; submit_job rejects unknown and missing ones
+JOB_KINDS: Dict[str, tuple] = {
+    "recalculate_targets": (_recalculate_targets, "Recalculate calorie targets", {}),
+    "verify_derived": (_verify_derived, "Verify and repair derived columns", {"repair": (bool, False)}),
+    "archive_entries": (_archive_entries, "Archive old calorie entries",
+                        {"older_than_days": (int, False), "vacuum": (bool, False)}),
+    "compact_database": (_compact_database, "Compact the database file", {}),
+    "prune_changes": (_prune_changes, "Prune the change log", {}),
+    "backup": (_backup, "Back up the database", {"label": (str, False)}),
+    "export": (_export, "Export data", {"dataset": (str, True), "format": (str, True),
+                                        "start_date": (date, True), "end_date": (date, True)}),
+    "import_directory": (_import_directory, "Import a directory of exports",
+                         {"directory": (ServerPath, True), "policy": (str, False), "recursive": (bool, False)}),
+    "import_foods": (_import_foods, "Import a food database", {"path": (ServerPath, True)}),
+}
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        return _executor
+
+
+def _finish(job_id: int, **values) -> None:
+    with SessionLocal() as db:
+        # Only a running job: one that recover_jobs has already failed keeps that status
+        db.execute(
+            update(Job).where(Job.id == job_id, Job.status == "running").values(finished_at=datetime.now(), **values)
+        )
+        db.commit()
+
+
+def _keep_alive(job_id: int, stop: threading.Event) -> None:
+    """Refresh a running job's heartbeat every HEARTBEAT_INTERVAL until stop is set."""
+    while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+        try:
+            with SessionLocal() as db:
+                db.execute(
+                    update(Job).where(Job.id == job_id, Job.status == "running").values(heartbeat_at=datetime.now())
+                )
+                db.commit()
+        except Exception:
+            pass  # Locked out by a long write; the next beat tries again, well within STALE_AFTER
+
+
+def _run_job(job_id: int) -> None:
+    """Claim a queued job and run its handler to completion, failure or cancellation."""
+    with SessionLocal() as db:
+        now = datetime.now()
+        claimed = db.execute(
+            update(Job).where(Job.id == job_id, Job.status == "queued").values(
+                status="running", started_at=now, heartbeat_at=now
+            )
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return  # Cancelled while queued, or claimed by another process
+
+        job = db.query(Job).filter(Job.id == job_id).one()
+        ctx = JobContext(job_id, json.loads(job.params or "{}"), db)
+        stop_heartbeat = threading.Event()
+        threading.Thread(target=_keep_alive, args=(job_id, stop_heartbeat), daemon=True,
+                         name=f"job-{job_id}-heartbeat").start()
+        try:
+            handler = JOB_KINDS[job.kind][0]
+            result = handler(ctx)
+        except JobCancelled:
+            db.rollback()
+            _finish(job_id, status="cancelled", message="Cancelled")
+        except Exception as e:
+            db.rollback()
+            _finish(job_id, status="failed", error=f"{type(e).__name__}: {e}")
+        else:
+            _finish(job_id, status="succeeded", progress=1.0, message="Done", result=json.dumps(result, default=str))
+        finally:
+            stop_heartbeat.set()
+
+
+def submit_job(db: Session, kind: str, params: Optional[Dict[str, Any]] = None) -> Job:
+    """
+    Queue a job and schedule it on this process's worker pool.
+
+    Args:
+        db: Database session
+        kind: One of JOB_KINDS
+        params: JSON-serializable handler parameters, named in the kind's params schema
+
+    Returns:
+        The queued Job row
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind '{kind}', expected one of {sorted(JOB_KINDS)}")
+    params = params or {}
+    schema = JOB_KINDS[kind][2]
+    unknown = sorted(set(params) - set(schema))
+    missing = sorted(name for name, (_, required) in schema.items() if required and params.get(name) is None)
+    if unknown or missing:
+        raise ValueError(f"Invalid parameters for '{kind}': unknown {unknown}, missing {missing}")
+
+    job = Job(kind=kind, status="queued", params=json.dumps(params, default=str))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _get_executor().submit(_run_job, job.id)
+    return job
+
+
+def cancel_job(db: Session, job_id: int) -> bool:
+    """
+    Cancel a queued job immediately, or ask a running one to stop at its next progress report.
+
+    Returns:
+        True if the job was still active
+    """
+    cancelled = db.execute(
+        update(Job).where(Job.id == job_id, Job.status == "queued").values(
+            status="cancelled", message="Cancelled", finished_at=datetime.now()
+        )
+    ).rowcount
+    requested = db.execute(
+        update(Job).where(Job.id == job_id, Job.status == "running").values(cancel_requested=True)
+    ).rowcount
+    db.commit()
+    return bool(cancelled or requested)
+
+
+def get_job(db: Session, job_id: int) -> Optional[Job]:
+    return db.query(Job).filter(Job.id == job_id).first()
+
+
+def list_jobs(db: Session, limit: int = 10) -> List[Job]:
+    """Most recent jobs first."""
+    return db.query(Job).order_by(Job.id.desc()).limit(limit).all()
+
+
+def has_active_jobs(db: Session) -> bool:
+    return db.query(Job.id).filter(Job.status.in_(ACTIVE_STATUSES)).first() is not None
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    """A job's columns with params and result decoded from JSON."""
+    values = {column.name: getattr(job, column.name) for column in job.__table__.columns}
+    values["params"] = json.loads(job.params) if job.params else {}
+    values["result"] = json.loads(job.result) if job.result else None
+    values["description"] = JOB_KINDS[job.kind][1] if job.kind in JOB_KINDS else job.kind
+    return values
+
+
+def recover_jobs(db: Session) -> int:
+    """
+    Resume jobs left behind by a previous process: fail running jobs with a stale
+    heartbeat and schedule queued ones on this process's pool.
+
+    Returns:
+        Number of queued jobs scheduled
+    """
+    db.execute(
+        update(Job).where(
+            Job.status == "running",
+            func.coalesce(Job.heartbeat_at, Job.started_at) < datetime.now() - STALE_AFTER
+        ).values(status="failed", error="Interrupted: the process running it stopped", finished_at=datetime.now())
+    )
+    db.commit()
+
+    queued = [job_id for (job_id,) in db.query(Job.id).filter(Job.status == "queued").order_by(Job.id)]
+    for job_id in queued:
+        _get_executor().submit(_run_job, job_id)
+    return len(queued)
+
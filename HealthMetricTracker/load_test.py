@@ -0,0 +1,319 @@
+"""
+Concurrent-session load test against a temporary copy of the database.
+
+Each simulated session walks stages 1-6 the way a browser tab does, repeating the
+work app.py does on every rerun (settings, the day's metrics, the daily summary) plus
+each stage's own reads and writes: auto-saves of weight, steps and burn through
+upsert_metric, food entries through add_calorie_entry, the 7-day summary table and a
+History page. Sessions run as threads sharing one engine, which is how Streamlit
+serves concurrent sessions. Use --driver apptest to render app.py itself with
+streamlit.testing.v1.AppTest; AppTest isn't thread-safe, so each of those sessions
+runs in its own process.
+
+For every concurrency level the database is reset from a seeded template, and the
+report shows throughput, p50/p95/p99 latency, error rate, 'database is locked'
+errors and lock waits (write statements slower than --lock-wait-ms, which on a small
+SQLite database means waiting on another connection's write lock; measured for the
+helpers driver only, since AppTest sessions write from their own processes).
+
+Usage:
+    python load_test.py [--sessions 1,2,4,8,16] [--visits 5] [--days 365] [--driver helpers|apptest]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta, time as dt_time
+from typing import Dict, List
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Requests slower than this at p95 mark the end of the usable concurrency range
+DEFAULT_SLO_MS = 500
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def seed_database(days: int) -> None:
+    """Fill the (empty) database with days of synthetic history ending yesterday."""
+    from database import SessionLocal, init_db
+    from calorie_helpers import upsert_metrics
+
+    init_db()
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=days)
+    rows = [{
+        "date": start + timedelta(days=i),
+        "steps": rng.randint(3000, 15000),
+        "weight_kg": round(82 - i * 0.01 + rng.uniform(-0.5, 0.5), 1),
+        "calories_burned_total": round(rng.uniform(2300, 3300)),
+        "calories_eaten": round(rng.uniform(1800, 2900)),
+    } for i in range(days)]
+
+    db = SessionLocal()
+    try:
+        upsert_metrics(db, rows)
+    finally:
+        db.close()
+
+
+class Recorder:
+    """Thread-safe collection of (operation, seconds, error) samples."""
+
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def record(self, operation: str, seconds: float, error: str = None) -> None:
+        with self.lock:
+            self.samples.append((operation, seconds, error))
+
+    def timed(self, operation: str, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(operation, time.perf_counter() - started, classify_error(e))
+            return None
+        self.record(operation, time.perf_counter() - started)
+        return result
+
+
+def classify_error(error: Exception) -> str:
+    return "locked" if "database is locked" in str(error) else type(error).__name__
+
+
+def run_helper_session(session_id: int, visits: int, day: date, recorder: Recorder, think: float) -> None:
+    """One simulated browser tab driving the helpers like app.py's reruns do."""
+    from database import SessionLocal
+    from models import DailyMetrics
+    from calorie_helpers import (
+        add_calorie_entry, get_calorie_entries, get_daily_summaries, get_daily_summary, upsert_metric
+    )
+    from settings_helpers import get_or_create_settings
+    from aggregation_helpers import get_data_version
+    from history_helpers import get_metrics_page
+
+    rng = random.Random(session_id)
+
+    def rerun(stage: int, action=None):
+        # Every rerun opens a session, loads settings, the day's row and the summary
+        db = SessionLocal()
+        try:
+            if action:
+                action(db)
+            get_or_create_settings(db)
+            db.query(DailyMetrics).filter(DailyMetrics.date == day).first()
+            get_daily_summary(db, day)
+            if stage == 4:
+                get_calorie_entries(db, day)
+            elif stage == 5:
+                get_daily_summaries(db, day - timedelta(days=6), day)
+            elif stage == 6:
+                get_metrics_page(db, day - timedelta(days=89), day)
+                get_data_version(db)
+        finally:
+            db.close()
+
+    def step(operation: str, stage: int, action=None):
+        recorder.timed(operation, rerun, stage, action)
+        if think:
+            time.sleep(rng.uniform(0, 2 * think))
+
+    for _ in range(visits):
+        step("stage1", 1)
+        step("stage2", 2)
+        step("autosave", 2, lambda db: upsert_metric(db, {"date": day, "weight_kg": round(rng.uniform(78, 82), 1)}))
+        step("stage3", 3)
+        step("autosave", 3, lambda db: upsert_metric(db, {"date": day, "steps": rng.randint(2000, 20000)}))
+        step("autosave", 3, lambda db: upsert_metric(db, {"date": day, "calories_burned_total": rng.randint(2200, 3400)}))
+        step("stage4", 4)
+        for _ in range(rng.randint(1, 3)):
+            step("add_entry", 4, lambda db: add_calorie_entry(
+                db, day, dt_time(rng.randint(6, 22), rng.randint(0, 59)), "Load test meal",
+                float(rng.randint(100, 900)), protein_g=float(rng.randint(0, 60))
+            ))
+        step("stage5", 5)
+        step("stage6", 6)
+
+
+def run_apptest_session(args) -> List[tuple]:
+    """One simulated tab rendering app.py with AppTest (runs in its own process)."""
+    session_id, visits, think = args
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(session_id)
+    samples = []
+
+    def timed(operation: str, fn):
+        started = time.perf_counter()
+        try:
+            at = fn()
+            errors = [str(e.value) for e in at.exception]
+            error = (classify_error(Exception(errors[0])) if errors else None)
+        except Exception as e:
+            error = classify_error(e)
+        samples.append((operation, time.perf_counter() - started, error))
+        if think:
+            time.sleep(rng.uniform(0, 2 * think))
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    for _ in range(visits):
+        for stage in range(1, 7):
+            at.session_state["stage"] = stage
+            timed(f"stage{stage}", at.run)
+            if stage == 2:
+                timed("autosave", lambda: at.number_input(key="metrics_weight").set_value(
+                    round(rng.uniform(78, 82), 1)).run())
+            elif stage == 3:
+                timed("autosave", lambda: at.number_input(key="metrics_steps").set_value(
+                    rng.randint(2000, 20000)).run())
+                timed("autosave", lambda: at.number_input(key="metrics_burn").set_value(
+                    float(rng.randint(2200, 3400))).run())
+    return samples
+
+
+def install_lock_wait_probe(engine, threshold: float) -> Dict[str, float]:
+    """Count write statements slower than threshold seconds on this engine."""
+    from sqlalchemy import event
+
+    stats = {"lock_waits": 0, "lock_wait_seconds": 0.0}
+    lock = threading.Lock()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["statement_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop("statement_started", time.perf_counter())
+        if elapsed > threshold and statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            with lock:
+                stats["lock_waits"] += 1
+                stats["lock_wait_seconds"] += elapsed
+
+    return stats
+
+
+def summarize(samples: List[tuple], sessions: int, elapsed: float, probe: Dict[str, float]) -> Dict:
+    latencies = sorted(seconds for _, seconds, _ in samples)
+    errors = [error for _, _, error in samples if error]
+    per_operation = defaultdict(list)
+    for operation, seconds, _ in samples:
+        per_operation[operation].append(seconds)
+
+    return {
+        "sessions": sessions,
+        "requests": len(samples),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "error_rate": len(errors) / len(samples) if samples else 0.0,
+        "locked_errors": errors.count("locked"),
+        "other_errors": sorted(set(errors) - {"locked"}),
+        "lock_waits": probe.get("lock_waits", 0),
+        "lock_wait_ms": probe.get("lock_wait_seconds", 0.0) * 1000,
+        "operations": {
+            operation: {"count": len(values), "p95_ms": percentile(sorted(values), 95) * 1000}
+            for operation, values in sorted(per_operation.items())
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test concurrent sessions against a temporary database")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--visits", type=int, default=5, help="Stage 1-6 walkthroughs per session")
+    parser.add_argument("--days", type=int, default=365, help="Days of seeded history")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between requests")
+    parser.add_argument("--lock-wait-ms", type=float, default=50.0, help="Write time counted as a lock wait")
+    parser.add_argument("--slo-ms", type=float, default=DEFAULT_SLO_MS, help="p95 latency budget")
+    parser.add_argument("--driver", choices=("helpers", "apptest"), default="helpers")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.sessions.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="health-load-")
+    db_path = os.path.join(workdir, "health.db")
+    template_path = os.path.join(workdir, "template.db")
+    # Must be set before database.py is imported, here and in AppTest worker processes
+    os.environ["HEALTH_DB_URL"] = f"sqlite:///{db_path}"
+
+    from database import engine
+
+    try:
+        seed_database(args.days)
+        engine.dispose()
+        shutil.copyfile(db_path, template_path)
+        probe = install_lock_wait_probe(engine, args.lock_wait_ms / 1000.0)
+        think = args.think_ms / 1000.0
+        day = date.today()
+        results = []
+
+        print(f"{'sessions':>8} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'errors':>7} {'locked':>7} {'waits':>6}")
+        for sessions in levels:
+            engine.dispose()
+            shutil.copyfile(template_path, db_path)
+            probe.update(lock_waits=0, lock_wait_seconds=0.0)
+
+            started = time.perf_counter()
+            if args.driver == "helpers":
+                recorder = Recorder()
+                threads = [threading.Thread(target=run_helper_session, args=(i, args.visits, day, recorder, think))
+                           for i in range(sessions)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                samples = recorder.samples
+            else:
+                with ProcessPoolExecutor(max_workers=sessions) as pool:
+                    samples = [sample for session in pool.map(
+                        run_apptest_session, [(i, args.visits, think) for i in range(sessions)]
+                    ) for sample in session]
+            elapsed = time.perf_counter() - started
+
+            result = summarize(samples, sessions, elapsed, probe)
+            results.append(result)
+            print(f"{sessions:>8} {result['requests']:>8} {result['throughput_rps']:>8.1f} "
+                  f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                  f"{result['error_rate']:>7.1%} {result['locked_errors']:>7} {result['lock_waits']:>6}")
+            if result["other_errors"]:
+                print(f"         other errors: {', '.join(result['other_errors'])}")
+
+        within = [r["sessions"] for r in results if r["p95_ms"] <= args.slo_ms and r["error_rate"] == 0]
+        if within:
+            print(f"Highest concurrency with p95 <= {args.slo_ms:.0f} ms and no errors: {max(within)} sessions")
+        else:
+            print(f"No level met p95 <= {args.slo_ms:.0f} ms without errors")
+
+        worst = results[-1]
+        print(f"Slowest operations at {worst['sessions']} sessions (p95 ms): " + ", ".join(
+            f"{name} {stats['p95_ms']:.0f}" for name, stats in
+            sorted(worst["operations"].items(), key=lambda item: -item[1]["p95_ms"])[:4]
+        ))
+
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Migration script to add the calorie balance indexes to daily_metrics.
+Run this once to update the database schema.
+
+Creates the expression index on calories_eaten - calories_burned_total and the partial
+index over days eaten past their target. Both match the SQL side of the calorie_balance
+and is_over_target hybrid properties, so there is no column to add or backfill.
+"""
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+from database import engine
+from models import DailyMetrics
+
+BALANCE_INDEXES = ("ix_daily_metrics_calorie_balance", "ix_daily_metrics_over_target_date")
+
+def migrate():
+    with engine.connect() as conn:
+        # IF NOT EXISTS rather than checkfirst, which can't reflect expression indexes
+        for index in DailyMetrics.__table__.indexes:
+            if index.name in BALANCE_INDEXES:
+                print(f"Creating index {index.name}")
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+        # Refresh planner statistics so the new indexes are considered
+        conn.execute(text("ANALYZE daily_metrics"))
+        conn.commit()
+    print("✅ Migration complete")
+
+if __name__ == "__main__":
+    migrate()
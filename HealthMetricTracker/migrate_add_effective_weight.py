@@ -0,0 +1,52 @@
+"""
+Migration script to add the forward-filled effective_weight_kg column to daily_metrics.
+Run this once to update the database schema.
+
+Adds the column and the partial index over weighed days, fills effective_weight_kg
+for the whole history with one UPDATE, then fills every unset protein target from it
+with a second one.
+"""
+from sqlalchemy import func, inspect, text
+from database import SessionLocal, engine
+from models import DailyMetrics
+from aggregation_helpers import refresh_effective_weights
+from calorie_helpers import backfill_protein_targets
+
+def migrate():
+    columns = [column["name"] for column in inspect(engine).get_columns("daily_metrics")]
+
+    with engine.connect() as conn:
+        if 'effective_weight_kg' not in columns:
+            migration = "ALTER TABLE daily_metrics ADD COLUMN effective_weight_kg REAL"
+            print(f"Running: {migration}")
+            conn.execute(text(migration))
+            conn.commit()
+        else:
+            print("effective_weight_kg already exists in daily_metrics")
+
+    for index in DailyMetrics.__table__.indexes:
+        if index.name == "ix_daily_metrics_weighed_date":
+            index.create(engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        first_date, last_date = db.query(func.min(DailyMetrics.date), func.max(DailyMetrics.date)).one()
+        if first_date is None:
+            print("✅ No daily metrics yet, nothing to backfill")
+            return
+
+        updated = refresh_effective_weights(db, first_date, last_date)
+        db.commit()
+        if updated:
+            print(f"Backfilled effective_weight_kg from {updated[0]} to {updated[1]}")
+        else:
+            print("effective_weight_kg already up to date")
+
+        filled = backfill_protein_targets(db)
+        print(f"Filled {filled} unset protein targets")
+        print("✅ Migration complete")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,24 @@
+"""
+Migration script to add the entry_patterns analytics cube.
+Run this once to update the database schema.
+
+Creates the table and fills it from every hot and archived calorie entry; from then
+on the entry write paths keep it up to date (see entry_pattern_helpers).
+"""
+from database import SessionLocal, engine
+from models import EntryPattern
+from entry_pattern_helpers import rebuild_entry_patterns
+
+def migrate():
+    EntryPattern.__table__.create(engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        cells = rebuild_entry_patterns(db)
+        print(f"Filled entry_patterns with {cells} cells")
+        print("✅ Migration complete")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
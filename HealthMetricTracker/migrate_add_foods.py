@@ -0,0 +1,18 @@
+"""
+Migration script to add the offline nutrition database tables.
+Run this once to update the database schema.
+
+Creates foods, food_portions and the foods_fts search index. They start empty; fill
+them with import_foods.py or the "Import a food database" job.
+"""
+from database import engine
+from models import Food, FoodPortion
+
+def migrate():
+    # Creating foods also creates foods_fts (see the after_create DDL in models)
+    Food.__table__.create(engine, checkfirst=True)
+    FoodPortion.__table__.create(engine, checkfirst=True)
+    print("✅ Migration complete")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,16 @@
+"""
+Migration script to add the intraday sample_chunks table.
+Run this once to update the database schema.
+
+The table starts empty; samples arrive through timeseries_helpers.ingest_samples
+(POST /samples in the API).
+"""
+from database import engine
+from models import SampleChunk
+
+def migrate():
+    SampleChunk.__table__.create(engine, checkfirst=True)
+    print("✅ Migration complete")
+
+if __name__ == "__main__":
+    migrate()
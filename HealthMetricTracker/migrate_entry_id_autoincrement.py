@@ -0,0 +1,59 @@
+"""
+Migration script to make calorie_entries ids AUTOINCREMENT on SQLite.
+Run this once to update the database schema.
+
+Without AUTOINCREMENT SQLite reuses the ids of deleted rows, and archiving deletes
+entries, so a new entry could get the id of an archived one and a delete by id could
+remove the wrong entry. SQLite can't alter a primary key, so the table is rebuilt:
+renamed, recreated from the model, copied over and dropped. The id sequence then starts
+after the highest hot or archived id, so archived ids are never handed out again.
+PostgreSQL sequences never reuse ids, so there is nothing to do there.
+"""
+from sqlalchemy import func, inspect, text
+from database import SessionLocal, engine
+from models import CalorieEntry, CalorieEntryArchive
+
+OLD_TABLE = "calorie_entries_old"
+
+def migrate():
+    if engine.dialect.name != "sqlite":
+        print("✅ Not SQLite, ids are never reused; nothing to do")
+        return
+
+    with engine.connect() as conn:
+        table_sql = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'calorie_entries'"
+        )).scalar()
+        if table_sql and "AUTOINCREMENT" in table_sql.upper():
+            print("calorie_entries already uses AUTOINCREMENT")
+        else:
+            columns = ", ".join(column.name for column in CalorieEntry.__table__.columns
+                                if column.name in {c["name"] for c in inspect(conn).get_columns("calorie_entries")})
+            print("Rebuilding calorie_entries with AUTOINCREMENT")
+            conn.execute(text(f"ALTER TABLE calorie_entries RENAME TO {OLD_TABLE}"))
+            # The indexes moved with the renamed table; drop them so the new table can use the names
+            for index in inspect(conn).get_indexes(OLD_TABLE):
+                conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+            CalorieEntry.__table__.create(conn)
+            conn.execute(text(f"INSERT INTO calorie_entries ({columns}) SELECT {columns} FROM {OLD_TABLE}"))
+            conn.execute(text(f"DROP TABLE {OLD_TABLE}"))
+            conn.commit()
+
+    db = SessionLocal()
+    try:
+        highest = max(
+            db.query(func.max(CalorieEntry.id)).scalar() or 0,
+            db.query(func.max(CalorieEntryArchive.max_entry_id)).scalar() or 0,
+            db.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'calorie_entries'")).scalar() or 0
+        )
+        db.execute(text("DELETE FROM sqlite_sequence WHERE name = 'calorie_entries'"))
+        db.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('calorie_entries', :seq)"),
+                   {"seq": highest})
+        db.commit()
+        print(f"New entry ids start after {highest}")
+        print("✅ Migration complete")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,35 @@
+"""
+Migration script to switch a SQLite database file to auto_vacuum=INCREMENTAL.
+Run this once to update the database file.
+
+compact_database (after archiving, or as a background job) returns free pages with
+PRAGMA incremental_vacuum, which only works in this mode. An existing file picks the
+mode up through one full VACUUM, which rewrites the whole file and blocks every other
+writer while it runs, so it's done here rather than by a job. PostgreSQL reclaims space
+with its own VACUUM, so there is nothing to do there.
+"""
+import time
+from database import engine
+
+INCREMENTAL = 2  # PRAGMA auto_vacuum value
+
+def migrate():
+    if engine.dialect.name != "sqlite":
+        print("✅ Not SQLite, nothing to do")
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == INCREMENTAL:
+            print("Database already uses auto_vacuum=INCREMENTAL")
+        else:
+            pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+            print(f"Rewriting {pages} pages with a full VACUUM")
+            started = time.monotonic()
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            print(f"Done in {time.monotonic() - started:.1f}s, "
+                  f"{conn.exec_driver_sql('PRAGMA page_count').scalar()} pages")
+    print("✅ Migration complete")
+
+if __name__ == "__main__":
+    migrate()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, Float, Date, DateTime, Time, String, ForeignKey, Enum
+from sqlalchemy import Column, Integer, Float, Date, DateTime, Time, String, ForeignKey, Enum, LargeBinary, Index, Boolean, Text, DDL, event
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -43,20 +44,56 @@ class DailyMetrics(Base):
     mode = Column(Enum(WeightMode), nullable=True)
     protein_total_g = Column(Float, nullable=True)
     protein_target_g = Column(Float, nullable=True)
+    # This day's weight, or the most recent earlier one (maintained by refresh_effective_weights)
+    effective_weight_kg = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
     
+    # Partial index over weighed days, for "latest weight on or before" lookups; an
+    # expression index on calorie_balance for sorting and ranges by balance; and a
+    # partial index over days eaten past their target, for is_over_target filters
+    __table_args__ = (
+        Index(
+            "ix_daily_metrics_weighed_date", "date",
+            sqlite_where=weight_kg.isnot(None),
+            postgresql_where=weight_kg.isnot(None)
+        ),
+        Index("ix_daily_metrics_calorie_balance", calories_eaten - calories_burned_total),
+        Index(
+            "ix_daily_metrics_over_target_date", "date",
+            sqlite_where=calories_eaten > daily_calorie_target,
+            postgresql_where=calories_eaten > daily_calorie_target
+        ),
+    )
+    
     calorie_entries = relationship("CalorieEntry", back_populates="daily_metric", cascade="all, delete-orphan")
 
-    @property
+    @hybrid_property
     def calorie_balance(self):
         if self.calories_eaten is not None and self.calories_burned_total is not None:
             return self.calories_eaten - self.calories_burned_total
         return None
 
+    @calorie_balance.expression
+    def calorie_balance(cls):
+        # NULL when either side is, like the Python side; same expression as the index
+        return cls.calories_eaten - cls.calories_burned_total
+
+    @hybrid_property
+    def is_over_target(self):
+        return (self.calories_eaten is not None and self.daily_calorie_target is not None
+                and self.calories_eaten > self.daily_calorie_target)
+
+    @is_over_target.expression
+    def is_over_target(cls):
+        # Same condition as ix_daily_metrics_over_target_date, so filters can use it
+        return cls.calories_eaten > cls.daily_calorie_target
+
 
 class CalorieEntry(Base):
     __tablename__ = "calorie_entries"
+    # AUTOINCREMENT so ids of archived (and deleted) entries are never handed to new ones
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False, index=True)
@@ -74,3 +111,134 @@ class CalorieEntry(Base):
     
     daily_metric_date = Column(Date, ForeignKey('daily_metrics.date'), nullable=True)
     daily_metric = relationship("DailyMetrics", back_populates="calorie_entries")
+
+
+class CalorieEntryArchive(Base):
+    """One month of archived calorie entries, stored as compressed JSON (see archive_helpers)."""
+    __tablename__ = "calorie_entry_archives"
+
+    month = Column(Date, primary_key=True)  # first day of the month
+    entry_count = Column(Integer, nullable=False)
+    # Id range of the archived entries, to find the month holding a given entry id
+    min_entry_id = Column(Integer, nullable=False)
+    max_entry_id = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+
+class EntryPattern(Base):
+    """Calorie entry totals for one combination of the pattern dimensions (see entry_pattern_helpers)."""
+    __tablename__ = "entry_patterns"
+
+    # Missing values are stored as -1 (no time) or '' so every dimension can be in the key
+    hour = Column(Integer, primary_key=True)
+    weekday = Column(Integer, primary_key=True)  # 0 = Monday
+    planned_slot = Column(String, primary_key=True)
+    place = Column(String, primary_key=True)
+    star_flag = Column(String, primary_key=True)
+    vl_flag = Column(String, primary_key=True)
+    entry_count = Column(Integer, nullable=False, default=0)
+    calories = Column(Float, nullable=False, default=0.0)
+    protein_g = Column(Float, nullable=False, default=0.0)
+
+
+class Food(Base):
+    """One food from an imported nutrition dataset, with nutrients per 100 g (see nutrition_helpers)."""
+    __tablename__ = "foods"
+
+    fdc_id = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String, nullable=False)
+    brand = Column(String, nullable=True)
+    data_type = Column(String, nullable=True)
+    calories_per_100g = Column(Float, nullable=True)
+    protein_per_100g = Column(Float, nullable=True)
+    # Position in search order before relevance (generic foods first, then shorter
+    # descriptions); also the rowid of the food in foods_fts
+    search_rank = Column(Integer, nullable=True, unique=True, index=True)
+
+    portions = relationship("FoodPortion", cascade="all, delete-orphan")
+
+
+class FoodPortion(Base):
+    """A household portion of a food ('1 cup, chopped', '1 bar') and its weight."""
+    __tablename__ = "food_portions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fdc_id = Column(Integer, ForeignKey('foods.fdc_id'), nullable=False, index=True)
+    description = Column(String, nullable=False)
+    gram_weight = Column(Float, nullable=False)
+
+
+# Full-text index over food descriptions and brands, kept as an external-content FTS5 table
+# keyed by search_rank so the text isn't stored twice; nutrition_helpers builds a new one
+# (under another name, hence the template) with each import
+FOODS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+    "description, brand, content='foods', content_rowid='search_rank', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+event.listen(Food.__table__, "after_create", DDL(
+    FOODS_FTS_DDL.format(name="foods_fts")
+).execute_if(dialect="sqlite"))
+event.listen(Food.__table__, "before_drop", DDL(
+    "DROP TABLE IF EXISTS foods_fts"
+).execute_if(dialect="sqlite"))
+
+
+class SampleChunk(Base):
+    """One day of intraday samples of one series, delta-encoded and compressed (see timeseries_helpers)."""
+    __tablename__ = "sample_chunks"
+    # Clustered on the key: no rowid b-tree next to the primary key index
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    series_id = Column(Integer, primary_key=True, autoincrement=False)  # timeseries_helpers.SERIES
+    epoch_day = Column(Integer, primary_key=True, autoincrement=False)  # days since 1970-01-01
+    sample_count = Column(Integer, nullable=False)
+    value_sum = Column(Float, nullable=False)
+    value_min = Column(Float, nullable=False)
+    value_max = Column(Float, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+
+
+class ChangeLog(Base):
+    """Append-only log of writes to the tracked tables, in commit order (serialized on PostgreSQL, see changelog_helpers)."""
+    __tablename__ = "change_log"
+    # AUTOINCREMENT so sequence numbers are never reused after old rows are pruned
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String, nullable=False, index=True)
+    row_id = Column(Integer, nullable=True)
+    date = Column(Date, nullable=True, index=True)
+    operation = Column(String, nullable=False)
+    changed_columns = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ChangeCheckpoint(Base):
+    """Last change-log sequence number processed by each named consumer."""
+    __tablename__ = "change_checkpoints"
+
+    consumer = Column(String, primary_key=True)
+    seq = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+
+class Job(Base):
+    """A background maintenance job and its progress (see job_helpers)."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    # queued, running, succeeded, failed or cancelled
+    status = Column(String, nullable=False, default="queued", index=True)
+    params = Column(Text, nullable=True)  # JSON
+    progress = Column(Float, nullable=False, default=0.0)
+    message = Column(String, nullable=True)
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,509 @@
+"""
+Offline nutrition database: a streamed import of the USDA FoodData Central CSV dump and
+full-text food search for the food journal.
+
+import_foods reads the dump (the extracted directory or the downloaded zip) with the csv
+module, one row at a time, so memory stays flat however large the files are. Foods go
+into the foods_staging table first. Nutrient amounts from food_nutrient.csv, brands and
+household portions are then written onto them in batched executemany statements,
+committing every batch so interactive writes interleave with a long import. Only
+calories (kcal per 100 g) and protein are kept. On SQLite the new foods (those with an
+energy value, in search order), portions and search index are then built as foods_new,
+food_portions_new and foods_fts_new, again in committed batches, and renamed over the
+live tables in one short transaction at the end. A failed or cancelled import leaves
+the live tables as they were. PostgreSQL replaces them in one transaction, which its
+readers don't wait for.
+
+Search goes through foods_fts, an external-content FTS5 index over description and
+brand (created with the foods table, see models). Every query token is a prefix match.
+Its rowids are each food's search_rank, a static order that puts generic foods before
+branded ones and shorter descriptions first, so FTS5 can return the first
+SEARCH_CANDIDATES matches in rowid order and stop, instead of scoring every food that
+contains "ch" or "apple". Those candidates are ranked by bm25, with the description
+weighted above the brand. When no food matches every token, foods matching any of
+them are returned instead, so a typo in one word still finds something.
+"""
+import csv
+import io
+import os
+import re
+import time
+import zipfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import MetaData, Table, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+from models import FOODS_FTS_DDL, Food, FoodPortion
+
+# FoodData Central nutrient ids
+ENERGY_KCAL = "1008"
+ENERGY_ATWATER = ("2047", "2048")  # Atwater general / specific factors, used by Foundation foods
+PROTEIN = "1003"
+
+# Data types worth searching; sample and acquisition records duplicate these without portions
+FOOD_DATA_TYPES = ("foundation_food", "sr_legacy_food", "survey_fndds_food", "branded_food")
+
+# Rows per executemany batch and transaction during import_foods
+IMPORT_BATCH_ROWS = 5000
+
+# Import progress is reported every this many batches within a file
+PROGRESS_EVERY_BATCHES = 20
+
+SEARCH_LIMIT = 10
+
+# Matches taken in search_rank order and ranked by relevance for each search
+SEARCH_CANDIDATES = 200
+
+# bm25 weights for the description and brand columns of foods_fts
+SEARCH_WEIGHTS = (10.0, 1.0)
+
+_TOKEN = re.compile(r"\w+")
+
+# import_foods fills these and copies them into foods and food_portions when it's done
+_STAGING_TABLES = {
+    "foods_staging": "fdc_id INTEGER PRIMARY KEY, description TEXT NOT NULL, brand TEXT, "
+                     "data_type TEXT, calories_per_100g FLOAT, protein_per_100g FLOAT",
+    "food_portions_staging": "fdc_id INTEGER NOT NULL, description TEXT NOT NULL, gram_weight FLOAT NOT NULL",
+}
+
+_INSERT_FOOD = text(
+    "INSERT INTO foods_staging (fdc_id, description, data_type) VALUES (:fdc_id, :description, :data_type)"
+)
+_INSERT_PORTION = text(
+    "INSERT INTO food_portions_staging (fdc_id, description, gram_weight) "
+    "VALUES (:fdc_id, :description, :gram_weight)"
+)
+_SET_CALORIES = text("UPDATE foods_staging SET calories_per_100g = :amount WHERE fdc_id = :fdc_id")
+# Atwater energy only fills in foods without a kcal value (1008 wins whatever the row order)
+_FILL_CALORIES = text(
+    "UPDATE foods_staging SET calories_per_100g = COALESCE(calories_per_100g, :amount) WHERE fdc_id = :fdc_id"
+)
+_SET_PROTEIN = text("UPDATE foods_staging SET protein_per_100g = :amount WHERE fdc_id = :fdc_id")
+_SET_BRAND = text("UPDATE foods_staging SET brand = :brand WHERE fdc_id = :fdc_id")
+
+# On SQLite the new foods, portions and search index are built as <table>_new and renamed
+# over the live tables at the end; the replaced ones are renamed <table>_old and dropped
+_SWAPPED_TABLES = ("foods", "food_portions", "foods_fts")
+
+# FTS5 merge work (in pages) per transaction when optimizing the new search index
+FTS_MERGE_PAGES = 500
+
+# Pause after each batch while building the new tables, which (unlike staging, which
+# parses CSV between batches) writes back to back; without it other connections
+# waiting on the lock rarely get it between batches
+BUILD_BATCH_PAUSE = 0.02
+
+_COPY_FOOD = text(
+    "INSERT INTO foods_new (fdc_id, description, brand, data_type, calories_per_100g, protein_per_100g, "
+    "search_rank) SELECT fdc_id, description, brand, data_type, calories_per_100g, protein_per_100g, "
+    ":search_rank FROM foods_staging WHERE fdc_id = :fdc_id"
+)
+_COPY_PORTIONS = text(
+    "INSERT INTO food_portions_new (fdc_id, description, gram_weight) "
+    "SELECT fdc_id, description, gram_weight FROM food_portions_staging "
+    "WHERE rowid > :low AND rowid <= :high AND fdc_id IN (SELECT fdc_id FROM foods_new)"
+)
+_INDEX_FOODS = text(
+    "INSERT INTO foods_fts_new (rowid, description, brand) "
+    "SELECT search_rank, description, brand FROM foods_new WHERE search_rank > :low AND search_rank <= :high"
+)
+
+
+# ============================================================================
+# Import
+# ============================================================================
+
+def iter_dataset_rows(path: str, file_name: str) -> Iterator[Dict[str, str]]:
+    """
+    Stream the rows of one CSV file of the dump as dicts.
+
+    Args:
+        path: Extracted dump directory (searched recursively) or the dump's zip file
+        file_name: CSV file name, e.g. 'food.csv'
+
+    Yields nothing when the dump has no such file.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            member = next((name for name in archive.namelist() if os.path.basename(name) == file_name), None)
+            if member is None:
+                return
+            with archive.open(member) as raw:
+                yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8", newline=""))
+        return
+
+    for root, _, names in os.walk(path):
+        if file_name in names:
+            with open(os.path.join(root, file_name), encoding="utf-8", newline="") as f:
+                yield from csv.DictReader(f)
+            return
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _portion_description(row: Dict[str, str], units: Dict[str, str]) -> str:
+    description = (row.get("portion_description") or "").strip()
+    if description and description.lower() != "quantity not specified":
+        return description
+    amount = _float(row.get("amount"))
+    unit = units.get(row.get("measure_unit_id"), "")
+    parts = [f"{amount:g}" if amount else "", "" if unit == "undetermined" else unit, (row.get("modifier") or "").strip()]
+    return " ".join(part for part in parts if part) or "1 portion"
+
+
+class _BatchWriter:
+    """Collects parameter rows per statement and flushes them in batches, one commit per batch."""
+
+    def __init__(self, db: Session, report: Callable[[str], None], pause: float = 0.0):
+        self.db = db
+        self.report = report
+        self.pause = pause
+        self.pending: Dict[Any, List[Dict[str, Any]]] = {}
+        self.rows = 0
+        self.batches = 0
+
+    def add(self, statement, params: Dict[str, Any]) -> None:
+        self.pending.setdefault(statement, []).append(params)
+        self.rows += 1
+        if self.rows % IMPORT_BATCH_ROWS == 0:
+            self.flush()
+
+    def flush(self) -> None:
+        for statement, rows in self.pending.items():
+            if rows:
+                self.db.execute(statement, rows)
+        self.pending = {}
+        self.db.commit()
+        time.sleep(self.pause)
+        self.batches += 1
+        if self.batches % PROGRESS_EVERY_BATCHES == 0:
+            self.report(f"{self.rows:,} rows written")
+
+
+def _drop_import_tables(db: Session) -> None:
+    """Drop the staging, new and replaced tables of this or an interrupted import, one commit each."""
+    for table in (*_STAGING_TABLES, *(f"{table}_new" for table in _SWAPPED_TABLES),
+                  *(f"{table}_old" for table in _SWAPPED_TABLES)):
+        db.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        db.commit()
+
+
+def _model_indexes() -> List[Tuple[Any, str]]:
+    """Each index of foods and food_portions, with the name its copy on the new table gets."""
+    return [(index, f"{index.name}_new") for table in (Food.__table__, FoodPortion.__table__)
+            for index in table.indexes]
+
+
+def _create_index(db: Session, index, name: str, table: str) -> None:
+    columns = ", ".join(column.name for column in index.columns)
+    db.execute(text(f"CREATE {'UNIQUE ' if index.unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    db.commit()
+
+
+def _restore_index_names(db: Session) -> None:
+    """Give the indexes the live tables took over from the new ones their model names back."""
+    live = {name for (name,) in db.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('foods', 'food_portions')"
+    ))}
+    for index, new_name in _model_indexes():
+        if new_name in live:
+            _create_index(db, index, index.name, index.table.name)
+            db.execute(text(f"DROP INDEX {new_name}"))
+            db.commit()
+
+
+def _run_in_chunks(db: Session, statement, last: int, report: Callable[[str], None]) -> None:
+    """Run a statement over the key ranges (low, high] of IMPORT_BATCH_ROWS up to last, one commit each."""
+    for batch, low in enumerate(range(0, last, IMPORT_BATCH_ROWS), 1):
+        db.execute(statement, {"low": low, "high": low + IMPORT_BATCH_ROWS})
+        db.commit()
+        time.sleep(BUILD_BATCH_PAUSE)
+        if batch % PROGRESS_EVERY_BATCHES == 0:
+            report(f"{min(low + IMPORT_BATCH_ROWS, last):,} of {last:,} rows")
+
+
+def _build_new_foods(db: Session, report: Callable[[float, str], None]) -> None:
+    """
+    Build foods_new, food_portions_new and foods_fts_new from the staging tables.
+
+    Every step commits in batches, like the staging itself, so other connections only
+    ever wait for one batch.
+    """
+    metadata = MetaData()
+    Food.__table__.to_metadata(metadata)  # so the new portions' foreign key still names foods
+    new_tables: List[Table] = [Food.__table__.to_metadata(metadata, name="foods_new"),
+                               FoodPortion.__table__.to_metadata(metadata, name="food_portions_new")]
+    for table in new_tables:
+        db.execute(CreateTable(table))
+    db.execute(text(FOODS_FTS_DDL.format(name="foods_fts_new")))
+    db.commit()
+
+    report(0.9, "Ranking foods")
+    ranked = db.execute(text(
+        "SELECT fdc_id FROM foods_staging WHERE calories_per_100g IS NOT NULL "
+        "ORDER BY data_type = 'branded_food', length(description), fdc_id"
+    )).scalars().all()
+    writer = _BatchWriter(db, lambda message: report(0.9, f"Ranking foods: {message}"), BUILD_BATCH_PAUSE)
+    for search_rank, fdc_id in enumerate(ranked, 1):
+        writer.add(_COPY_FOOD, {"fdc_id": fdc_id, "search_rank": search_rank})
+    writer.flush()
+
+    report(0.93, "Copying portions")
+    last_portion = db.execute(text("SELECT max(rowid) FROM food_portions_staging")).scalar() or 0
+    _run_in_chunks(db, _COPY_PORTIONS, last_portion,
+                   lambda message: report(0.93, f"Copying portions: {message}"))
+    for index, new_name in _model_indexes():
+        _create_index(db, index, new_name, f"{index.table.name}_new")
+
+    report(0.96, "Building the search index")
+    _run_in_chunks(db, _INDEX_FOODS, len(ranked),
+                   lambda message: report(0.96, f"Building the search index: {message}"))
+    # The batched equivalent of 'optimize': merge until a round does no work, which FTS5
+    # signals by changing fewer than two rows
+    while True:
+        before = db.execute(text("SELECT total_changes()")).scalar()
+        db.execute(text("INSERT INTO foods_fts_new (foods_fts_new, rank) VALUES ('merge', :pages)"),
+                   {"pages": FTS_MERGE_PAGES})
+        merged = db.execute(text("SELECT total_changes()")).scalar() - before >= 2
+        db.commit()
+        if not merged:
+            break
+        time.sleep(BUILD_BATCH_PAUSE)
+
+
+def _swap_in_new_foods(db: Session) -> None:
+    """Rename the new tables over the live ones in one short transaction, then drop the old ones."""
+    # The sqlite3 module doesn't open a transaction for DDL by itself
+    db.execute(text("BEGIN IMMEDIATE"))
+    # Legacy renames leave foreign keys as written, so the new portions keep pointing at foods
+    db.execute(text("PRAGMA legacy_alter_table = ON"))
+    try:
+        for table in _SWAPPED_TABLES:
+            db.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+        for table in _SWAPPED_TABLES:
+            db.execute(text(f"ALTER TABLE {table}_new RENAME TO {table}"))
+    finally:
+        db.execute(text("PRAGMA legacy_alter_table = OFF"))
+    db.commit()
+    _drop_import_tables(db)
+    _restore_index_names(db)
+
+
+def _swap_in_staged_foods(db: Session) -> None:
+    """Replace foods and food_portions with the staged rows that have calories (doesn't commit)."""
+    db.execute(FoodPortion.__table__.delete())
+    db.execute(Food.__table__.delete())
+    db.execute(text(
+        "INSERT INTO foods (fdc_id, description, brand, data_type, calories_per_100g, protein_per_100g) "
+        "SELECT fdc_id, description, brand, data_type, calories_per_100g, protein_per_100g "
+        "FROM foods_staging WHERE calories_per_100g IS NOT NULL"
+    ))
+    db.execute(text(
+        "INSERT INTO food_portions (fdc_id, description, gram_weight) "
+        "SELECT fdc_id, description, gram_weight FROM food_portions_staging "
+        "WHERE fdc_id IN (SELECT fdc_id FROM foods)"
+    ))
+
+
+def _stage_foods(db: Session, path: str, phase: Callable[[float, str], Callable[[str], None]]) -> None:
+    """Stream the dump's foods, nutrients, brands and portions into the staging tables."""
+    writer = _BatchWriter(db, phase(0.0, "food.csv"))
+    for row in iter_dataset_rows(path, "food.csv"):
+        if row.get("data_type") in FOOD_DATA_TYPES and row.get("description"):
+            writer.add(_INSERT_FOOD, {
+                "fdc_id": int(row["fdc_id"]), "description": row["description"].strip(),
+                "data_type": row["data_type"],
+            })
+    writer.flush()
+
+    writer = _BatchWriter(db, phase(0.15, "branded_food.csv"))
+    for row in iter_dataset_rows(path, "branded_food.csv"):
+        fdc_id = int(row["fdc_id"])
+        brand = (row.get("brand_name") or row.get("brand_owner") or "").strip()
+        if brand:
+            writer.add(_SET_BRAND, {"fdc_id": fdc_id, "brand": brand})
+        serving = _float(row.get("serving_size"))
+        if serving and (row.get("serving_size_unit") or "").lower() in ("g", "grm"):
+            description = (row.get("household_serving_fulltext") or "").strip() or "1 serving"
+            writer.add(_INSERT_PORTION, {"fdc_id": fdc_id, "description": description, "gram_weight": serving})
+    writer.flush()
+
+    writer = _BatchWriter(db, phase(0.3, "food_nutrient.csv"))
+    statements = {ENERGY_KCAL: _SET_CALORIES, PROTEIN: _SET_PROTEIN,
+                  **{nutrient_id: _FILL_CALORIES for nutrient_id in ENERGY_ATWATER}}
+    for row in iter_dataset_rows(path, "food_nutrient.csv"):
+        statement = statements.get(row["nutrient_id"])
+        if statement is not None:
+            amount = _float(row.get("amount"))
+            if amount is not None:
+                writer.add(statement, {"fdc_id": int(row["fdc_id"]), "amount": amount})
+    writer.flush()
+
+    writer = _BatchWriter(db, phase(0.85, "food_portion.csv"))
+    units = {row["id"]: row["name"] for row in iter_dataset_rows(path, "measure_unit.csv")}
+    for row in iter_dataset_rows(path, "food_portion.csv"):
+        gram_weight = _float(row.get("gram_weight"))
+        if gram_weight and gram_weight > 0:
+            writer.add(_INSERT_PORTION, {
+                "fdc_id": int(row["fdc_id"]), "description": _portion_description(row, units),
+                "gram_weight": gram_weight,
+            })
+    writer.flush()
+
+
+def import_foods(db: Session, path: str,
+                 progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, Any]:
+    """
+    Replace the foods and portions with those of a FoodData Central CSV dump.
+
+    Args:
+        db: Database session
+        path: Extracted dump directory or the dump's zip file
+        progress: Called with (fraction done, message) as the import moves through the files
+
+    Returns:
+        Dictionary with the number of 'foods' and 'portions' kept and the elapsed 'seconds'
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"No such file or directory: {path}")
+    if next(iter_dataset_rows(path, "food.csv"), None) is None:
+        raise ValueError(f"No food.csv in {path}")
+
+    started = time.monotonic()
+    is_sqlite = db.get_bind().dialect.name == "sqlite"
+
+    def phase(fraction: float, file_name: str) -> Callable[[str], None]:
+        if progress:
+            progress(fraction, f"Reading {file_name}")
+        return lambda message: progress and progress(fraction, f"Reading {file_name}: {message}")
+
+    def report(fraction: float, message: str) -> None:
+        if progress:
+            progress(fraction, message)
+
+    # Leftovers of an interrupted import are cleaned up; the live tables aren't touched until the end
+    if is_sqlite:
+        _restore_index_names(db)
+    _drop_import_tables(db)
+    for table, columns in _STAGING_TABLES.items():
+        db.execute(text(f"CREATE TABLE {table} ({columns})"))
+    db.commit()
+    try:
+        _stage_foods(db, path, phase)
+        if is_sqlite:
+            _build_new_foods(db, report)
+            report(0.99, "Replacing foods")
+            _swap_in_new_foods(db)
+        else:
+            # PostgreSQL readers aren't blocked by the replacing transaction, so it's done in one
+            report(0.9, "Replacing foods")
+            _swap_in_staged_foods(db)
+            db.commit()
+            _drop_import_tables(db)
+    except BaseException:
+        db.rollback()
+        _drop_import_tables(db)
+        raise
+
+    return {
+        "foods": db.query(Food).count(),
+        "portions": db.query(FoodPortion).count(),
+        "seconds": round(time.monotonic() - started, 1),
+    }
+
+
+# ============================================================================
+# Search
+# ============================================================================
+
+def _match_expression(query: str, any_token: bool = False) -> Optional[str]:
+    """FTS5 query with every token quoted (so user input can't form operators) as a prefix."""
+    tokens = _TOKEN.findall(query.lower())
+    if not tokens:
+        return None
+    return (" OR " if any_token else " ").join(f'"{token}"*' for token in tokens)
+
+
+def _food_dict(row) -> Dict[str, Any]:
+    return {
+        'fdc_id': row.fdc_id,
+        'description': row.description,
+        'brand': row.brand,
+        'data_type': row.data_type,
+        'calories_per_100g': row.calories_per_100g,
+        'protein_per_100g': row.protein_per_100g,
+    }
+
+
+def search_foods(db: Session, query: str, limit: int = SEARCH_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Find foods matching a free-text query, best match first.
+
+    Args:
+        db: Database session
+        query: Words to look for, e.g. 'greek yog' (each word is a prefix)
+        limit: Maximum number of foods
+
+    Returns:
+        Food dicts ('fdc_id', 'description', 'brand', 'data_type',
+        'calories_per_100g', 'protein_per_100g')
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        # No FTS5: substring match on the description, shortest first
+        tokens = _TOKEN.findall(query.lower())
+        if not tokens:
+            return []
+        foods = db.query(Food).filter(*(Food.description.ilike(f"%{token}%") for token in tokens))
+        return [_food_dict(food) for food in foods.order_by(Food.description).limit(limit)]
+
+    statement = text(
+        "SELECT foods.fdc_id, foods.description, foods.brand, foods.data_type, "
+        "foods.calories_per_100g, foods.protein_per_100g FROM ("
+        f"SELECT rowid, bm25(foods_fts, {SEARCH_WEIGHTS[0]}, {SEARCH_WEIGHTS[1]}) AS score FROM foods_fts "
+        "WHERE foods_fts MATCH :match ORDER BY rowid LIMIT :candidates"
+        ") AS hits JOIN foods ON foods.search_rank = hits.rowid "
+        "ORDER BY hits.score, hits.rowid LIMIT :limit"
+    )
+    for any_token in (False, True):
+        match = _match_expression(query, any_token)
+        if match is None:
+            return []
+        rows = db.execute(statement, {"match": match, "candidates": max(SEARCH_CANDIDATES, limit),
+                                      "limit": limit}).all()
+        if rows:
+            return [_food_dict(row) for row in rows]
+    return []
+
+
+def get_food_portions(db: Session, fdc_id: int) -> List[Tuple[str, float]]:
+    """
+    Portions to log a food by: its household portions, then 100 g and single grams.
+
+    Returns:
+        (description, gram weight) pairs
+    """
+    portions = db.query(FoodPortion.description, FoodPortion.gram_weight).filter(
+        FoodPortion.fdc_id == fdc_id
+    ).order_by(FoodPortion.id).all()
+    return [(description, gram_weight) for description, gram_weight in portions] + [("100 g", 100.0), ("g", 1.0)]
+
+
+def scale_food(food: Dict[str, Any], grams: float) -> Tuple[float, Optional[float]]:
+    """
+    Calories and protein of a weight of a food.
+
+    Returns:
+        (calories, protein in g or None when the food has no protein value)
+    """
+    calories = (food['calories_per_100g'] or 0.0) * grams / 100
+    protein = food['protein_per_100g'] * grams / 100 if food['protein_per_100g'] is not None else None
+    return calories, protein
+
+
+def has_foods(db: Session) -> bool:
+    return db.query(Food.fdc_id).first() is not None
@@ -0,0 +1,124 @@
+"""
+Monte Carlo weight projection for every weight goal mode.
+
+Each simulated path draws a daily burn and an intake adherence ratio (eaten / target)
+from the recent history, with replacement. The day's calorie target follows the same
+rule as compute_dynamic_target_from_rolling_avg: the rolling burn average over
+maintenance_window_days (maintenance_calories with fewer than 7 burn days), minus the
+mode's deficit percentage, floored at MIN_CALORIE_TARGET. The day's weight change is
+its calorie balance divided by KCAL_PER_KG.
+
+Burn doesn't depend on the target, so every path, day and mode is computed as one
+NumPy batch: rolling averages are cumulative-sum differences and weights a cumulative
+sum over the day axis, with no Python loop per day or per path. The same draws are
+reused for every mode, so the bands differ only through the targets.
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from models import WeightMode
+from settings_helpers import get_or_create_settings
+from aggregation_helpers import get_recent_weight
+from daily_series import DailySeries
+from rolling_average_helpers import MIN_CALORIE_TARGET, effective_window_days, get_deficit_percent_for_mode
+
+# Energy content of one kg of body weight change
+KCAL_PER_KG = 7700.0
+
+DEFAULT_PATHS = 2000
+
+# Days of history the burn and adherence distributions are drawn from
+HISTORY_DAYS = 90
+
+# Fewer observed days than this and adherence is assumed to be exact (ratio 1.0)
+MIN_ADHERENCE_DAYS = 7
+MIN_BURN_DAYS = 7
+
+PERCENTILES = (10, 50, 90)
+
+
+def project_weight(db: Session, weeks: int = 12, paths: int = DEFAULT_PATHS,
+                   today: Optional[date] = None, seed: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    Simulate weight over the next weeks for every WeightMode.
+
+    Args:
+        db: Database session
+        weeks: Projection horizon in weeks
+        paths: Monte Carlo paths per mode
+        today: Last day of history; the projection starts the day after
+        seed: Random seed, so cached projections are reproducible
+
+    Returns:
+        Dictionary with 'start_date', 'start_weight', 'days', 'paths', 'history_days'
+        and 'modes' mapping each mode value to its 'p10'/'p50'/'p90' weight lists,
+        'final' (the three percentiles on the last day) and 'median_target'; None
+        when no weight has been recorded yet
+    """
+    today = today or date.today()
+    start_weight = get_recent_weight(db, today + timedelta(days=1))
+    if not start_weight:
+        return None
+
+    settings = get_or_create_settings(db)
+    window_days = effective_window_days(settings.maintenance_window_days, MIN_BURN_DAYS)
+    days = weeks * 7
+
+    history_days = max(HISTORY_DAYS, window_days)
+    history = DailySeries.load(db, today - timedelta(days=history_days - 1), today,
+                               ("calories_burned_total", "calories_eaten", "daily_calorie_target"))
+    burn_history = np.array(history.columns["calories_burned_total"])
+    eaten = np.array(history.columns["calories_eaten"])
+    targets = np.array(history.columns["daily_calorie_target"])
+
+    observed_burn = burn_history[~np.isnan(burn_history)]
+    if observed_burn.size == 0:
+        observed_burn = np.array([settings.maintenance_calories])
+    with np.errstate(invalid="ignore"):
+        logged = (eaten > 0) & (targets > 0)
+    adherence = eaten[logged] / targets[logged]
+    if adherence.size < MIN_ADHERENCE_DAYS:
+        adherence = np.ones(1)
+
+    rng = np.random.default_rng(seed)
+    burn = rng.choice(observed_burn, size=(paths, days))
+    ratio = rng.choice(adherence, size=(paths, days))
+
+    # Rolling burn window per projected day: the last window_days - 1 real days, then the draws
+    tail = np.broadcast_to(burn_history[history_days - window_days + 1:], (paths, window_days - 1))
+    full = np.concatenate((tail, burn), axis=1)
+    present = ~np.isnan(full)
+    sums = np.concatenate((np.zeros((paths, 1)), np.cumsum(np.where(present, full, 0.0), axis=1)), axis=1)
+    counts = np.concatenate((np.zeros((paths, 1)), np.cumsum(present, axis=1)), axis=1)
+    ends = np.arange(window_days, window_days + days)
+    window_sum = sums[:, ends] - sums[:, ends - window_days]
+    window_count = counts[:, ends] - counts[:, ends - window_days]
+    rolling = np.where(window_count >= MIN_BURN_DAYS, window_sum / np.maximum(window_count, 1),
+                       settings.maintenance_calories)
+
+    # (modes, paths, days)
+    modes = list(WeightMode)
+    deficits = np.array([get_deficit_percent_for_mode(mode, settings) for mode in modes])
+    mode_targets = np.maximum(rolling[None] * (1.0 - deficits[:, None, None]), MIN_CALORIE_TARGET)
+    balance = mode_targets * ratio[None] - burn[None]
+    weights = start_weight + np.cumsum(balance, axis=2) / KCAL_PER_KG
+
+    bands = np.percentile(weights, PERCENTILES, axis=1)
+    median_targets = np.median(mode_targets, axis=(1, 2))
+
+    result = {
+        'start_date': today + timedelta(days=1),
+        'start_weight': float(start_weight),
+        'days': days,
+        'paths': paths,
+        'history_days': int(observed_burn.size),
+        'modes': {}
+    }
+    for i, mode in enumerate(modes):
+        result['modes'][mode.value] = {
+            **{f"p{p}": bands[j, i].round(2).tolist() for j, p in enumerate(PERCENTILES)},
+            'final': tuple(float(bands[j, i, -1]) for j in range(len(PERCENTILES))),
+            'median_target': float(median_targets[i]),
+        }
+    return result
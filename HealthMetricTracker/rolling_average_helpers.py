@@ -2,12 +2,36 @@
 Helper functions for rolling average burn calculations and dynamic target computation.
 """
 from datetime import date, timedelta
+from typing import Optional
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from models import DailyMetrics, UserSettings, WeightMode
 from settings_helpers import get_or_create_settings
+from daily_series import DailySeries
 
+# Calorie targets never go below this, whatever the burn and deficit
+MIN_CALORIE_TARGET = 1500.0
 
-def get_rolling_burn_average(db: Session, target_date: date, window_days: int = 21, min_days: int = 7) -> float:
+
+def effective_window_days(window_days: int, min_days: int = 7) -> int:
+    """Validate a rolling window length: shorter than min_days falls back to at least 14 days."""
+    if window_days < min_days:
+        return max(min_days, 14)  # Enforce minimum 14 days for statistical reliability
+    return window_days
+
+
+def rolling_burn_from_series(series: DailySeries, target_date: date, window_days: int = 21,
+                             min_days: int = 7) -> Optional[float]:
+    """Rolling burn average from a preloaded series, or None with fewer than min_days of burn data."""
+    window_days = effective_window_days(window_days, min_days)
+    count = series.window_count('calories_burned_total', target_date, window_days)
+    if count < min_days:
+        return None
+    return series.window_sum('calories_burned_total', target_date, window_days) / count
+
+
+def get_rolling_burn_average(db: Session, target_date: date, window_days: int = 21, min_days: int = 7,
+                             series: Optional[DailySeries] = None) -> float:
     """
     Calculate the rolling average of calories_burned_total over the specified window.
     
@@ -16,31 +40,21 @@ def get_rolling_burn_average(db: Session, target_date: date, window_days: int =
         target_date: The date to calculate the average for
         window_days: Number of days to look back (default 21)
         min_days: Minimum number of valid days required (default 7)
+        series: Preloaded DailySeries covering the window (loaded if omitted)
     
     Returns:
         Rolling average burn, or falls back to maintenance_calories if insufficient data
     """
-    # Validate window_days >= min_days
-    if window_days < min_days:
-        window_days = max(min_days, 14)  # Enforce minimum 14 days for statistical reliability
+    if series is None:
+        start_date = target_date - timedelta(days=effective_window_days(window_days, min_days) - 1)
+        series = DailySeries.load(db, start_date, target_date, ('calories_burned_total',))
     
-    start_date = target_date - timedelta(days=window_days - 1)
-    
-    # Query all metrics in the window
-    metrics = db.query(DailyMetrics).filter(
-        DailyMetrics.date >= start_date,
-        DailyMetrics.date <= target_date,
-        DailyMetrics.calories_burned_total.isnot(None)
-    ).all()
-    
-    if len(metrics) < min_days:
+    average = rolling_burn_from_series(series, target_date, window_days, min_days)
+    if average is None:
         # Insufficient data, fall back to settings
         settings = get_or_create_settings(db)
         return settings.maintenance_calories
-    
-    # Calculate average
-    total_burn = sum(m.calories_burned_total for m in metrics)
-    return total_burn / len(metrics)
+    return average
 
 
 def compute_dynamic_target_from_rolling_avg(
@@ -73,7 +87,7 @@ def compute_dynamic_target_from_rolling_avg(
         target = base
     
     # Clamp to minimum 1500 kcal for safety
-    return max(target, 1500.0)
+    return max(target, MIN_CALORIE_TARGET)
 
 
 def recalculate_target_for_date(db: Session, target_date: date) -> None:
@@ -99,22 +113,50 @@ def recalculate_target_for_date(db: Session, target_date: date) -> None:
     db.commit()
 
 
-def recalculate_all_targets(db: Session) -> int:
+def recalculate_targets_in_range(db: Session, start_date: date, end_date: date) -> int:
     """
-    Recalculate daily_calorie_target for all existing daily metrics.
-    Useful when settings change (maintenance_window_days or deficit percentages).
+    Recalculate daily_calorie_target for every stored day from start_date to end_date.
+    
+    The burn history for the whole range plus one window is loaded once as a
+    DailySeries and all targets are written in a single commit, instead of one query
+    and commit per day.
     
     Returns:
         Number of records updated
     """
-    metrics = db.query(DailyMetrics).order_by(DailyMetrics.date).all()
-    count = 0
+    settings = get_or_create_settings(db)
+    window_days = effective_window_days(settings.maintenance_window_days)
+    series = DailySeries.load(db, start_date - timedelta(days=window_days - 1), end_date,
+                              ('calories_burned_total',))
+    
+    metrics = db.query(DailyMetrics).filter(
+        DailyMetrics.date >= start_date,
+        DailyMetrics.date <= end_date
+    ).all()
     
     for metric in metrics:
-        recalculate_target_for_date(db, metric.date)
-        count += 1
+        rolling_burn_avg = rolling_burn_from_series(series, metric.date, window_days)
+        if rolling_burn_avg is None:
+            rolling_burn_avg = settings.maintenance_calories
+        mode = metric.mode or settings.current_mode
+        metric.daily_calorie_target = compute_dynamic_target_from_rolling_avg(rolling_burn_avg, mode, settings)
+    
+    db.commit()
+    return len(metrics)
+
+
+def recalculate_all_targets(db: Session) -> int:
+    """
+    Recalculate daily_calorie_target for all existing daily metrics.
+    Useful when settings change (maintenance_window_days or deficit percentages).
     
-    return count
+    Returns:
+        Number of records updated
+    """
+    first, last = db.query(func.min(DailyMetrics.date), func.max(DailyMetrics.date)).one()
+    if first is None:
+        return 0
+    return recalculate_targets_in_range(db, first, last)
 
 
 def get_deficit_percent_for_mode(mode: WeightMode, settings: UserSettings) -> float:
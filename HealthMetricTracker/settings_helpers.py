@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from models import UserSettings, WeightMode
 from datetime import datetime
+from changelog_helpers import get_latest_seq  # importing also registers the change-log flush listener
 
 def get_or_create_settings(db: Session) -> UserSettings:
     """Get the single user settings record, or create it with defaults if it doesn't exist."""
@@ -118,3 +119,12 @@ def get_mode_display_name(mode: WeightMode) -> str:
         WeightMode.LOSS_AGGRESSIVE: "Aggressive Weight Loss"
     }
     return mode_names.get(mode, str(mode))
+
+def get_settings_version(db: Session) -> int:
+    """
+    Get a cheap token that changes whenever UserSettings changes.
+    
+    The latest change-log sequence number for user_settings, used next to
+    get_data_version in cache keys for views that depend on the settings.
+    """
+    return get_latest_seq(db, [UserSettings.__tablename__])
@@ -0,0 +1,380 @@
+"""
+"Similar days" search: the past days that looked most like a given day, and what
+happened to weight after them.
+
+Each day is a feature vector of steps, total burn, calories eaten, protein, weight mode
+(as a deficit level) and meal timing from its calorie entries (first and last entry
+hour, calorie-weighted mean hour, entry count), over hot and archived entries. The
+vectors are rows of one NumPy matrix indexed by days since the first tracked day, so a
+day's row is found by subtraction. Columns are standardized to zero mean and unit
+variance, and a query is one vectorized pass over every earlier row: the distance is
+the root mean squared difference over the features both days have, so a day missing
+protein or meal times is compared on the rest instead of being dropped. Outcomes are
+effective_weight_kg differences 7 and 14 days after each neighbour.
+
+SimilarDaysIndex is kept in memory (app.py and the API keep one per process, each a
+change-log consumer with its own checkpoint) and refreshed from the change log:
+refresh() recomputes only the rows of dates changed since its last sequence number,
+growing the matrix as days are added, and re-standardizes, which is a single pass over a
+few thousand rows. It rebuilds from scratch on first use, when a change predates the
+first tracked day, when many days changed at once, after a backup restore, or when the
+log may have been pruned past its position.
+"""
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import DailyMetrics, CalorieEntry, ChangeCheckpoint, ChangeLog, WeightMode
+from changelog_helpers import (
+    RESTORE_OPERATION, changed_dates, get_changes, get_checkpoint, get_latest_seq, process_changes,
+    set_checkpoint,
+)
+from archive_helpers import get_archived_rows
+
+FEATURES = ("steps", "calories_burned_total", "calories_eaten", "protein_total_g", "mode",
+            "first_meal_hour", "last_meal_hour", "meal_hour", "entry_count")
+
+FEATURE_LABELS = {
+    "steps": "Steps", "calories_burned_total": "Burned", "calories_eaten": "Eaten",
+    "protein_total_g": "Protein", "mode": "Mode", "first_meal_hour": "First meal",
+    "last_meal_hour": "Last meal", "meal_hour": "Meal time", "entry_count": "Entries",
+}
+
+# Mode as a deficit level, so gentle loss sits between maintenance and standard loss
+MODE_LEVELS = {
+    WeightMode.MAINTENANCE: 0.0, WeightMode.LOSS_GENTLE: 1.0,
+    WeightMode.LOSS_STANDARD: 2.0, WeightMode.LOSS_AGGRESSIVE: 3.0,
+}
+
+SOURCE_TABLES = (DailyMetrics.__tablename__, CalorieEntry.__tablename__)
+
+# Days after a neighbour its weight change is reported for
+OUTCOME_DAYS = (7, 14)
+
+DEFAULT_NEIGHBOURS = 10
+
+# Days compared on fewer shared features than this (or than the query day has) are skipped
+MIN_SHARED_FEATURES = 3
+
+# More changed days than this in one refresh and the whole index is rebuilt instead
+MAX_INCREMENTAL_DAYS = 400
+
+# Changed dates this close together are reloaded as one range
+RUN_GAP_DAYS = 31
+
+CHANGE_BATCH = 1000
+
+_COLUMN = {feature: i for i, feature in enumerate(FEATURES)}
+_METRIC_FEATURES = FEATURES[:_COLUMN["mode"] + 1]
+
+
+def _hour(entry_time) -> float:
+    return entry_time.hour + entry_time.minute / 60
+
+
+def _meal_timing(entries: Sequence[Dict[str, Any]]) -> List[float]:
+    """first_meal_hour, last_meal_hour, meal_hour and entry_count for one day's entries."""
+    timed = [(_hour(entry["time"]), max(entry["calories"] or 0.0, 0.0))
+             for entry in entries if entry["time"] is not None]
+    if not timed:
+        # No entries means meals weren't logged (totals only), not that nothing was eaten
+        return [np.nan, np.nan, np.nan, float(len(entries)) if entries else np.nan]
+    hours = [hour for hour, _ in timed]
+    total = sum(calories for _, calories in timed)
+    mean_hour = (sum(hour * calories for hour, calories in timed) / total if total
+                 else sum(hours) / len(hours))
+    return [min(hours), max(hours), mean_hour, float(len(entries))]
+
+
+def _date_runs(dates: Sequence[date]) -> List[tuple]:
+    """(first, last) ranges covering sorted dates, merging dates up to RUN_GAP_DAYS apart."""
+    runs = []
+    for day in dates:
+        if runs and (day - runs[-1][1]).days <= RUN_GAP_DAYS:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def load_day_features(db: Session, start_date: date, end_date: date) -> Dict[date, tuple]:
+    """
+    Raw feature values and effective weight of every tracked day in a range.
+
+    Args:
+        db: Database session
+        start_date: First day
+        end_date: Last day (inclusive)
+
+    Returns:
+        {date: (feature list in FEATURES order, NaN when missing; effective weight or NaN)}
+        for days with a DailyMetrics row or calorie entries
+    """
+    metrics = {}
+    metric_columns = [getattr(DailyMetrics, feature) for feature in _METRIC_FEATURES]
+    for day, *values, weight in db.query(DailyMetrics.date, *metric_columns, DailyMetrics.effective_weight_kg).filter(
+        DailyMetrics.date >= start_date,
+        DailyMetrics.date <= end_date
+    ):
+        values[-1] = MODE_LEVELS.get(values[-1])
+        metrics[day] = ([np.nan if value is None else float(value) for value in values],
+                        np.nan if weight is None else weight)
+
+    entries = defaultdict(list)
+    for day, entry_time, calories in db.query(CalorieEntry.date, CalorieEntry.time, CalorieEntry.calories).filter(
+        CalorieEntry.date >= start_date,
+        CalorieEntry.date <= end_date
+    ):
+        entries[day].append({"time": entry_time, "calories": calories})
+    for row in get_archived_rows(db, start_date, end_date):
+        entries[row["date"]].append(row)
+
+    missing = ([np.nan] * len(_METRIC_FEATURES), np.nan)
+    days = {}
+    for day in metrics.keys() | entries.keys():
+        values, weight = metrics.get(day, missing)
+        days[day] = (values + _meal_timing(entries.get(day, [])), weight)
+    return days
+
+
+class _RebuildNeeded(Exception):
+    """Raised while collecting changes when rebuilding beats applying them."""
+
+
+class SimilarDaysIndex:
+    """
+    Standardized daily feature matrix with nearest-neighbour queries (thread-safe).
+
+    A long-lived index should pass a consumer name unique to its process (see
+    changelog_helpers.process_consumer): refresh() then pulls changes through
+    process_changes and keeps its position as that consumer's checkpoint, so
+    prune_changes keeps the log it still needs. Without one the index only reads the
+    log, and rebuilds when the log may have been pruned past it.
+    """
+
+    def __init__(self, consumer: Optional[str] = None):
+        self._lock = threading.Lock()
+        self.consumer = consumer
+        self.start: Optional[date] = None
+        self.size = 0  # days in use; the arrays may have spare capacity
+        self.seq = -1  # last change-log sequence number applied, -1 before the first build
+        self._raw = np.empty((0, len(FEATURES)))
+        self._weights = np.empty(0)
+        self._filled_weights = np.empty(0)
+        self._scaled = np.empty((0, len(FEATURES)))
+        self._present = np.empty((0, len(FEATURES)), dtype=bool)
+        self.mean = np.zeros(len(FEATURES))
+        self.scale = np.ones(len(FEATURES))
+
+    def refresh(self, db: Session) -> int:
+        """
+        Apply the changes logged since the last refresh (or build the index on first use).
+
+        Returns:
+            Number of days recomputed
+        """
+        with self._lock:
+            # Position in the whole log, so it compares with checkpoints of any consumer
+            latest = get_latest_seq(db)
+            # A log behind the index means the database was replaced under it
+            if self.seq < 0 or latest < self.seq or self._lost_position(db):
+                return self._rebuild(db, latest)
+            if latest == self.seq or (not self.consumer and get_latest_seq(db, SOURCE_TABLES) <= self.seq):
+                return 0
+
+            dates = set()
+
+            def collect(changes: List[ChangeLog]) -> None:
+                dates.update(changed_dates(changes))
+                restored = any(change.operation == RESTORE_OPERATION for change in changes)
+                if restored or len(dates) > MAX_INCREMENTAL_DAYS:
+                    raise _RebuildNeeded()
+
+            try:
+                if self.consumer:
+                    process_changes(db, self.consumer, collect, SOURCE_TABLES, CHANGE_BATCH)
+                    self.seq = get_checkpoint(db, self.consumer)
+                else:
+                    seq = self.seq
+                    while True:
+                        changes = get_changes(db, seq, CHANGE_BATCH, SOURCE_TABLES)
+                        if not changes:
+                            break
+                        collect(changes)
+                        seq = changes[-1].seq
+                    self.seq = max(seq, latest)
+            except _RebuildNeeded:
+                return self._rebuild(db, get_latest_seq(db))
+
+            if not dates:
+                return 0
+            if self.start is None or min(dates) < self.start:
+                return self._rebuild(db, self.seq)
+            loaded = 0
+            for lo, hi in _date_runs(sorted(dates)):
+                self._load(db, lo, hi)
+                loaded += (hi - lo).days + 1
+            self._standardize()
+            return loaded
+
+    def _lost_position(self, db: Session) -> bool:
+        """Whether changes after self.seq may be gone from the log (or the checkpoint was replaced)."""
+        if self.consumer:
+            # prune_changes drops checkpoints that stopped moving, and a restore rolls them back
+            return get_checkpoint(db, self.consumer) != self.seq
+        # prune_changes only deletes rows at or below the oldest consumer checkpoint
+        oldest = db.query(func.min(ChangeCheckpoint.seq)).scalar()
+        return oldest is not None and oldest > self.seq
+
+    def _rebuild(self, db: Session, seq: int) -> int:
+        first, last = db.query(func.min(DailyMetrics.date), func.max(DailyMetrics.date)).one()
+        first_entry, last_entry = db.query(func.min(CalorieEntry.date), func.max(CalorieEntry.date)).one()
+        if first_entry is not None:
+            first, last = min(first or first_entry, first_entry), max(last or last_entry, last_entry)
+        self.start, self.size, self.seq = first, 0, seq
+        self._raw = np.empty((0, len(FEATURES)))
+        self._weights = np.empty(0)
+        if first is not None:
+            self._load(db, first, last)
+        self._standardize()
+        if self.consumer:
+            set_checkpoint(db, self.consumer, seq)
+        return self.size
+
+    def _reserve(self, size: int) -> None:
+        """Grow the arrays (doubling, NaN-filled) to hold at least size days."""
+        if size <= len(self._raw):
+            return
+        capacity = max(size, 2 * len(self._raw), 366)
+        raw = np.full((capacity, len(FEATURES)), np.nan)
+        weights = np.full(capacity, np.nan)
+        raw[:self.size] = self._raw[:self.size]
+        weights[:self.size] = self._weights[:self.size]
+        self._raw, self._weights = raw, weights
+
+    def _load(self, db: Session, start_date: date, end_date: date) -> None:
+        """Recompute the rows of every day in a range (days without data become all-NaN)."""
+        lo, hi = (start_date - self.start).days, (end_date - self.start).days
+        self._reserve(hi + 1)
+        self._raw[lo:hi + 1] = np.nan
+        self._weights[lo:hi + 1] = np.nan
+        for day, (values, weight) in load_day_features(db, start_date, end_date).items():
+            self._raw[(day - self.start).days] = values
+            self._weights[(day - self.start).days] = weight
+        self.size = max(self.size, hi + 1)
+
+    def _standardize(self) -> None:
+        raw = self._raw[:self.size]
+        self._present = ~np.isnan(raw)
+        counts = self._present.sum(axis=0)
+        filled = np.where(self._present, raw, 0.0)
+        mean = filled.sum(axis=0) / np.maximum(counts, 1)
+        deviations = np.where(self._present, raw - mean, 0.0)
+        std = np.sqrt((deviations ** 2).sum(axis=0) / np.maximum(counts, 1))
+        self.mean, self.scale = mean, np.where(std > 0, std, 1.0)
+        self._scaled = deviations / self.scale
+
+        # Carry weights over days without a row, like effective_weight_kg does across rows
+        weights = self._weights[:self.size]
+        last_known = np.maximum.accumulate(np.where(np.isnan(weights), 0, np.arange(self.size)))
+        self._filled_weights = weights[last_known]
+
+    def _values(self, row: int) -> Dict[str, Any]:
+        values = {}
+        for feature, value in zip(FEATURES, self._raw[row]):
+            if np.isnan(value):
+                values[feature] = None
+            elif feature == "mode":
+                values[feature] = next(mode.value for mode, level in MODE_LEVELS.items() if level == value)
+            else:
+                values[feature] = float(value)
+        return values
+
+    def _weight_changes(self, row: int) -> Dict[int, Optional[float]]:
+        changes = {}
+        for days in OUTCOME_DAYS:
+            later = row + days
+            change = self._filled_weights[later] - self._filled_weights[row] if later < self.size else np.nan
+            changes[days] = None if np.isnan(change) else float(change)
+        return changes
+
+    def query(self, day: date, k: int = DEFAULT_NEIGHBOURS,
+              features: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        The k earlier days nearest to a day, as of the last refresh.
+
+        Args:
+            day: Day to match
+            k: Number of neighbours
+            features: Only compare these FEATURES (default all)
+
+        Returns:
+            Dict with 'date', 'values' (raw features), 'matched_on', 'neighbours' (nearest
+            first, each with 'date', 'distance', 'values', 'weight_kg' and 'weight_change'
+            by OUTCOME_DAYS) and 'weight_change' ({days: {'median', 'days'}} over the
+            neighbours with a known outcome), or None when the day has too little data
+        """
+        for feature in features or ():
+            if feature not in _COLUMN:
+                raise ValueError(f"Unknown feature '{feature}', expected one of {FEATURES}")
+
+        with self._lock:
+            if self.start is None:
+                return None
+            row = (day - self.start).days
+            if not 0 <= row < self.size:
+                return None
+            selected = np.zeros(len(FEATURES), dtype=bool)
+            selected[[_COLUMN[feature] for feature in features or FEATURES]] = True
+            wanted = self._present[row] & selected
+            required = min(MIN_SHARED_FEATURES, int(selected.sum()))
+            if wanted.sum() < required:
+                return None
+
+            # One pass over every earlier day: squared differences over the shared features
+            shared = self._present[:row] & wanted
+            counts = shared.sum(axis=1)
+            squared = np.where(shared, self._scaled[:row] - self._scaled[row], 0.0) ** 2
+            distances = np.sqrt(squared.sum(axis=1) / np.maximum(counts, 1))
+            distances[counts < required] = np.inf
+
+            k = min(k, int(np.isfinite(distances).sum()))
+            nearest = np.argpartition(distances, k - 1)[:k] if k else np.empty(0, dtype=int)
+            nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+
+            neighbours = [{
+                'date': self.start + timedelta(days=int(i)),
+                'distance': float(distances[i]),
+                'values': self._values(i),
+                'weight_kg': None if np.isnan(self._filled_weights[i]) else float(self._filled_weights[i]),
+                'weight_change': self._weight_changes(i),
+            } for i in nearest]
+
+            outcomes = {}
+            for days in OUTCOME_DAYS:
+                known = [n['weight_change'][days] for n in neighbours if n['weight_change'][days] is not None]
+                outcomes[days] = {'median': float(np.median(known)) if known else None, 'days': len(known)}
+
+            return {
+                'date': day,
+                'values': self._values(row),
+                'matched_on': [feature for feature in FEATURES if wanted[_COLUMN[feature]]],
+                'neighbours': neighbours,
+                'weight_change': outcomes,
+            }
+
+
+def find_similar_days(db: Session, day: date, k: int = DEFAULT_NEIGHBOURS,
+                      features: Optional[Sequence[str]] = None,
+                      index: Optional[SimilarDaysIndex] = None) -> Optional[Dict[str, Any]]:
+    """
+    Refresh an index (a new one by default) and query it; see SimilarDaysIndex.query.
+
+    Pass a long-lived index so repeated queries only pay for the days changed in between.
+    """
+    index = index or SimilarDaysIndex()
+    index.refresh(db)
+    return index.query(day, k, features)
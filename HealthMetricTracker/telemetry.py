@@ -0,0 +1,219 @@
+"""
+In-process metrics registry with Prometheus text-format output.
+
+Counters and histograms are plain Python objects guarded by a lock, so recording a
+value costs about a microsecond. Each process keeps its own registry: the JSON API
+serves it at GET /metrics, and the Streamlit app writes it to the file named by
+HEALTH_METRICS_FILE every 15 seconds for the node_exporter textfile collector or any
+scraper that reads files.
+
+Database activity is recorded with engine events: rows written per table, 'database
+is locked' errors, and write lock waits. SQLite takes the write lock at the first
+write of a transaction and waits there (up to busy_timeout) while another connection
+holds it, so the duration of that statement is recorded as the transaction's lock
+wait. Helper latency is recorded with the @timed decorator.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from database import engine
+
+METRICS_FILE = os.environ.get("HEALTH_METRICS_FILE")
+
+# Seconds; covers fast helper calls up to slow first renders
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0.0)]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "health_api_request_duration_seconds", "JSON API request latency.", ("handler", "method", "status"))
+RERUN_DURATION = Histogram(
+    "health_app_rerun_duration_seconds", "Streamlit script rerun latency per stage.", ("stage",))
+FRAGMENT_DURATION = Histogram(
+    "health_app_fragment_duration_seconds", "Streamlit fragment run latency (full and partial reruns).",
+    ("fragment",))
+HELPER_DURATION = Histogram(
+    "health_helper_duration_seconds", "Latency of instrumented helper calls.", ("helper",))
+DB_LOCK_ERRORS = Counter(
+    "health_db_lock_errors_total", "Statements that failed with 'database is locked'.")
+DB_LOCK_WAIT = Histogram(
+    "health_db_write_lock_wait_seconds",
+    "Duration of each transaction's first write, which includes waiting for the write lock.")
+ROWS_WRITTEN = Counter(
+    "health_db_rows_written_total", "Rows inserted, updated or deleted.", ("table", "operation"))
+CACHE_REQUESTS = Counter(
+    "health_cache_requests_total", "Cached lookups, hit or miss.", ("cache",))
+CACHE_MISSES = Counter(
+    "health_cache_misses_total", "Cached lookups that had to compute the value.", ("cache",))
+
+REGISTRY = [REQUEST_DURATION, RERUN_DURATION, FRAGMENT_DURATION, HELPER_DURATION, DB_LOCK_ERRORS, DB_LOCK_WAIT,
+            ROWS_WRITTEN,
+            CACHE_REQUESTS, CACHE_MISSES]
+
+
+def render_metrics() -> str:
+    """Every registered metric in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+def timed(helper: str):
+    """Decorator recording a helper's call latency in HELPER_DURATION."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                HELPER_DURATION.observe(time.perf_counter() - started, helper=helper)
+        return wrapper
+    return decorator
+
+
+def _written_table(statement: str) -> Optional[Tuple[str, str]]:
+    """(table, operation) for INSERT/UPDATE/DELETE statements, None otherwise."""
+    words = statement.lstrip()[:80].split(None, 4)
+    if not words:
+        return None
+    operation = words[0].upper()
+    if operation == "INSERT" and len(words) > 2:
+        return words[2].strip('"'), "insert"
+    if operation == "UPDATE" and len(words) > 1:
+        return words[1].strip('"'), "update"
+    if operation == "DELETE" and len(words) > 2:
+        return words[2].strip('"'), "delete"
+    return None
+
+
+@event.listens_for(engine, "begin")
+def _reset_write_lock(conn):
+    conn.info.pop("holds_write_lock", None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_started"] = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _count_rows_written(conn, cursor, statement, parameters, context, executemany):
+    written = _written_table(statement)
+    if not written:
+        return
+    started = conn.info.pop("statement_started", None)
+    if started is not None and not conn.info.get("holds_write_lock"):
+        # The transaction's first write: the lock is taken (or waited for) here
+        conn.info["holds_write_lock"] = True
+        DB_LOCK_WAIT.observe(time.perf_counter() - started)
+    if cursor.rowcount and cursor.rowcount > 0:
+        ROWS_WRITTEN.inc(cursor.rowcount, table=written[0], operation=written[1])
+
+
+@event.listens_for(engine, "handle_error")
+def _count_lock_errors(context):
+    if "database is locked" in str(context.original_exception):
+        DB_LOCK_ERRORS.inc()
+
+
+def write_metrics_file(path: str) -> None:
+    """Write the registry to path atomically (write a temp file, then rename)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+def start_file_exporter(path: Optional[str] = METRICS_FILE, interval: float = 15.0) -> Optional[threading.Thread]:
+    """Rewrite the metrics file every interval seconds on a daemon thread (no-op without a path)."""
+    if not path:
+        return None
+
+    def run():
+        while True:
+            try:
+                write_metrics_file(path)
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-file-exporter", daemon=True)
+    thread.start()
+    return thread
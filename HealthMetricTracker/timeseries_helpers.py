@@ -0,0 +1,317 @@
+"""
+Intraday samples (minute-level steps, heart rate and energy from trackers) stored as
+one compressed chunk per series and day, with a rollup into DailyMetrics.
+
+sample_chunks is a WITHOUT ROWID table clustered on (series_id, epoch_day), so a day's
+chunk is one b-tree lookup and a range of days is contiguous on disk. A chunk holds the
+day's samples as seconds since midnight and values quantized to integers by the
+series' scale, both delta-encoded and zlib-compressed. Regular minute samples turn
+into runs of identical deltas, so a year of minute data is a few MB. Each chunk also
+keeps the count, sum, minimum and maximum of its values, so rollups and summaries
+never decompress it.
+
+ingest_samples groups samples by series and day, merges them into the stored chunks
+(a sample at the same second replaces the stored one), and writes GROUP_COMMIT_DAYS
+days at a time. Each group's chunk upsert and the rollup of its days into steps,
+calories_burned_active and calories_burned_basal go through upsert_metrics and commit
+together. calories_burned_total is set when both energy series are present, as in
+the Apple Health import.
+"""
+import sys
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from models import SampleChunk
+from calorie_helpers import upsert_metrics
+
+# Series name -> (series_id, scale, DailyMetrics rollup column). Values are stored as
+# round(value * scale), so heart rate keeps 0.1 bpm and energy 1 cal.
+SERIES = {
+    "steps": (1, 1, "steps"),
+    "heart_rate": (2, 10, None),
+    "active_kcal": (3, 1000, "calories_burned_active"),
+    "basal_kcal": (4, 1000, "calories_burned_basal"),
+}
+
+SERIES_NAMES = {series_id: name for name, (series_id, _, _) in SERIES.items()}
+
+EPOCH = date(1970, 1, 1)
+
+# Days of chunks written and rolled up per transaction by ingest_samples
+GROUP_COMMIT_DAYS = 31
+
+COMPRESSION_LEVEL = 6
+
+# Bound on quantized values, so deltas between two of them fit the int32 payload
+MAX_QUANTIZED = 2 ** 30
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def to_epoch_day(day: date) -> int:
+    return (day - EPOCH).days
+
+
+def from_epoch_day(epoch_day: int) -> date:
+    return EPOCH + timedelta(days=epoch_day)
+
+
+def _split_timestamp(timestamp: Any) -> Tuple[date, int]:
+    """(local date, seconds since midnight) of epoch seconds, an ISO string or a datetime."""
+    if isinstance(timestamp, (int, float)):
+        moment = datetime.fromtimestamp(timestamp)
+    elif isinstance(timestamp, str):
+        moment = datetime.fromisoformat(timestamp)
+    elif isinstance(timestamp, datetime):
+        moment = timestamp
+    else:
+        raise ValueError(f"Invalid sample timestamp {timestamp!r}")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.date(), moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+class _DaySplitter:
+    """
+    _split_timestamp returning the epoch day, with a fast path for epoch seconds: the
+    local midnight bounds of the last day seen are kept, so a day of samples costs one
+    datetime conversion. Days with a DST change take the slow path for every sample.
+    """
+
+    def __init__(self):
+        self.start = self.end = None
+        self.epoch_day = None
+
+    def __call__(self, timestamp: Any) -> Tuple[int, int]:
+        numeric = isinstance(timestamp, (int, float))
+        if numeric and self.start is not None and self.start <= timestamp < self.end:
+            return self.epoch_day, int(timestamp - self.start)
+
+        day, second = _split_timestamp(timestamp)
+        if numeric:
+            start = datetime.combine(day, time.min).timestamp()
+            end = datetime.combine(day + timedelta(days=1), time.min).timestamp()
+            if end - start == 86400:
+                self.start, self.end, self.epoch_day = start, end, to_epoch_day(day)
+        return to_epoch_day(day), second
+
+
+def _to_bytes(values: array) -> bytes:
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode, data)
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def _deltas(values: List[int]) -> List[int]:
+    return [values[0]] + [b - a for a, b in zip(values, values[1:])]
+
+
+def encode_chunk(seconds: List[int], values: List[int]) -> bytes:
+    """
+    Compress a day's samples.
+
+    Args:
+        seconds: Seconds since midnight, ascending
+        values: Quantized integer values, one per second
+
+    Returns:
+        zlib payload of the sample count and the delta-encoded seconds and values
+    """
+    header = array("I", [len(seconds)])
+    body = _to_bytes(header) + _to_bytes(array("i", _deltas(seconds))) + _to_bytes(array("i", _deltas(values)))
+    return zlib.compress(body, COMPRESSION_LEVEL)
+
+
+def decode_chunk(payload: bytes) -> Tuple[List[int], List[int]]:
+    """(seconds, quantized values) of a chunk payload."""
+    body = zlib.decompress(payload)
+    count = _from_bytes("I", body[:4])[0]
+    seconds = _from_bytes("i", body[4:4 + 4 * count])
+    values = _from_bytes("i", body[4 + 4 * count:])
+    return list(accumulate(seconds)), list(accumulate(values))
+
+
+def _insert(db: Session):
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(SampleChunk)
+    return stmt.on_conflict_do_update(
+        index_elements=[SampleChunk.series_id, SampleChunk.epoch_day],
+        set_={column: stmt.excluded[column]
+              for column in ("sample_count", "value_sum", "value_min", "value_max", "payload")}
+    )
+
+
+def _chunk_row(series_id: int, epoch_day: int, samples: Dict[int, int], scale: int) -> Dict[str, Any]:
+    seconds = sorted(samples)
+    values = [samples[second] for second in seconds]
+    return {
+        "series_id": series_id,
+        "epoch_day": epoch_day,
+        "sample_count": len(seconds),
+        "value_sum": sum(values) / scale,
+        "value_min": min(values) / scale,
+        "value_max": max(values) / scale,
+        "payload": encode_chunk(seconds, values),
+    }
+
+
+def _rollup_rows(db: Session, epoch_days: List[int]) -> List[Dict[str, Any]]:
+    """DailyMetrics rows for upsert_metrics from the stored chunk sums of the given days."""
+    rollup_ids = {series_id: column for series_id, _, column in SERIES.values() if column}
+    days: Dict[int, Dict[str, Any]] = defaultdict(dict)
+    for series_id, epoch_day, value_sum in db.query(
+        SampleChunk.series_id, SampleChunk.epoch_day, SampleChunk.value_sum
+    ).filter(
+        SampleChunk.series_id.in_(rollup_ids),
+        SampleChunk.epoch_day.in_(epoch_days)
+    ):
+        days[epoch_day][rollup_ids[series_id]] = value_sum
+
+    rows = []
+    for epoch_day, values in sorted(days.items()):
+        if "steps" in values:
+            values["steps"] = int(round(values["steps"]))
+        for column in ("calories_burned_active", "calories_burned_basal"):
+            if column in values:
+                values[column] = round(values[column], 1)
+        if "calories_burned_active" in values and "calories_burned_basal" in values:
+            values["calories_burned_total"] = round(
+                values["calories_burned_active"] + values["calories_burned_basal"], 1
+            )
+        rows.append({"date": from_epoch_day(epoch_day), **values})
+    return rows
+
+
+def ingest_samples(db: Session, samples: Dict[str, Iterable[Tuple[Any, float]]],
+                   rollup: bool = True) -> Dict[str, Any]:
+    """
+    Store intraday samples and roll the affected days up into DailyMetrics.
+
+    Args:
+        db: Database session
+        samples: Series name (one of SERIES) -> (timestamp, value) pairs; timestamps are
+            epoch seconds, ISO strings or datetimes, converted to local time
+        rollup: Update steps and burned calories of the affected days
+
+    Returns:
+        Dictionary with the number of 'samples' read, 'chunks' written, 'days' affected
+        and compressed 'bytes' written
+
+    Raises:
+        ValueError: On an unknown series, a bad timestamp or a non-numeric or out of
+            range value; nothing is written then
+    """
+    unknown = set(samples) - set(SERIES)
+    if unknown:
+        raise ValueError(f"Unknown series {sorted(unknown)}, expected some of {sorted(SERIES)}")
+
+    # (series_id, epoch_day) -> second -> quantized value; later samples win
+    incoming: Dict[Tuple[int, int], Dict[int, int]] = defaultdict(dict)
+    count = 0
+    for name, pairs in samples.items():
+        series_id, scale, _ = SERIES[name]
+        split = _DaySplitter()
+        for timestamp, value in pairs:
+            epoch_day, second = split(timestamp)
+            try:
+                quantized = round(value * scale)
+            except (TypeError, ValueError, OverflowError):
+                quantized = None
+            if quantized is None or not -MAX_QUANTIZED <= quantized <= MAX_QUANTIZED:
+                raise ValueError(f"Invalid {name} value {value!r}")
+            incoming[(series_id, epoch_day)][second] = quantized
+            count += 1
+
+    result = {"samples": count, "chunks": 0, "days": 0, "bytes": 0}
+    epoch_days = sorted({epoch_day for _, epoch_day in incoming})
+    upsert = _insert(db)
+    for i in range(0, len(epoch_days), GROUP_COMMIT_DAYS):
+        group = epoch_days[i:i + GROUP_COMMIT_DAYS]
+        keys = [key for key in incoming if group[0] <= key[1] <= group[-1]]
+        stored = {
+            (chunk.series_id, chunk.epoch_day): chunk.payload
+            for chunk in db.query(SampleChunk.series_id, SampleChunk.epoch_day, SampleChunk.payload).filter(
+                SampleChunk.series_id.in_({series_id for series_id, _ in keys}),
+                SampleChunk.epoch_day.between(group[0], group[-1])
+            )
+        }
+
+        rows = []
+        for series_id, epoch_day in keys:
+            merged = incoming.pop((series_id, epoch_day))
+            if (series_id, epoch_day) in stored:
+                merged = {**dict(zip(*decode_chunk(stored[(series_id, epoch_day)]))), **merged}
+            rows.append(_chunk_row(series_id, epoch_day, merged, SERIES[SERIES_NAMES[series_id]][1]))
+        db.execute(upsert, rows)
+
+        if rollup:
+            upsert_metrics(db, _rollup_rows(db, group))
+        db.commit()
+
+        result["chunks"] += len(rows)
+        result["days"] += len(group)
+        result["bytes"] += sum(len(row["payload"]) for row in rows)
+    return result
+
+
+def get_samples(db: Session, series: str, start_date: date,
+                end_date: Optional[date] = None) -> List[Tuple[datetime, float]]:
+    """
+    Decode the samples of one series over a range of days.
+
+    Returns:
+        (local datetime, value) pairs in time order
+    """
+    if series not in SERIES:
+        raise ValueError(f"Unknown series '{series}', expected one of {sorted(SERIES)}")
+    series_id, scale, _ = SERIES[series]
+    chunks = db.query(SampleChunk.epoch_day, SampleChunk.payload).filter(
+        SampleChunk.series_id == series_id,
+        SampleChunk.epoch_day.between(to_epoch_day(start_date), to_epoch_day(end_date or start_date))
+    ).order_by(SampleChunk.epoch_day)
+
+    samples = []
+    for epoch_day, payload in chunks:
+        midnight = datetime.combine(from_epoch_day(epoch_day), time.min)
+        seconds, values = decode_chunk(payload)
+        samples.extend((midnight + timedelta(seconds=second), value / scale)
+                       for second, value in zip(seconds, values))
+    return samples
+
+
+def get_daily_sample_stats(db: Session, series: str, start_date: date,
+                           end_date: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Per-day count, sum, mean, minimum and maximum of one series, without decoding chunks.
+
+    Returns:
+        One dict per day that has samples, in date order
+    """
+    if series not in SERIES:
+        raise ValueError(f"Unknown series '{series}', expected one of {sorted(SERIES)}")
+    chunks = db.query(SampleChunk).filter(
+        SampleChunk.series_id == SERIES[series][0],
+        SampleChunk.epoch_day.between(to_epoch_day(start_date), to_epoch_day(end_date or start_date))
+    ).order_by(SampleChunk.epoch_day)
+    return [{
+        'date': from_epoch_day(chunk.epoch_day),
+        'samples': chunk.sample_count,
+        'sum': chunk.value_sum,
+        'mean': chunk.value_sum / chunk.sample_count,
+        'min': chunk.value_min,
+        'max': chunk.value_max,
+    } for chunk in chunks]
@@ -0,0 +1,55 @@
+"""
+CLI for checking (and optionally repairing) the derived DailyMetrics columns and the
+entry patterns cube.
+
+Usage:
+    python verify_derived.py [--repair] [--show 20]
+
+Exits with status 1 when mismatches are found and --repair is not given.
+"""
+import argparse
+import sys
+import time
+from collections import Counter
+from database import SessionLocal, init_db
+from consistency_helpers import verify_derived_columns, repair_derived_columns
+from entry_pattern_helpers import rebuild_entry_patterns, verify_entry_patterns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify derived DailyMetrics columns against their sources")
+    parser.add_argument("--repair", action="store_true", help="Write the expected values in one transaction")
+    parser.add_argument("--show", type=int, default=20, help="Number of mismatches to print")
+    args = parser.parse_args(argv)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        mismatches = verify_derived_columns(db)
+        elapsed = time.perf_counter() - started
+
+        print(f"Checked derived columns in {elapsed * 1000:.0f} ms: {len(mismatches)} mismatches")
+        for column, count in sorted(Counter(m["column"] for m in mismatches).items()):
+            print(f"  {column:22s} {count}")
+        for mismatch in mismatches[:args.show]:
+            print(f"  {mismatch['date']}  {mismatch['column']:22s} stored={mismatch['stored']!r}  "
+                  f"expected={mismatch['expected']!r}")
+
+        pattern_cells = verify_entry_patterns(db)
+        print(f"Entry patterns cube: {pattern_cells} mismatched cells")
+
+        if args.repair:
+            if mismatches:
+                written = repair_derived_columns(db, mismatches)
+                print(f"Repaired {written} values")
+            if pattern_cells:
+                print(f"Rebuilt the entry patterns cube ({rebuild_entry_patterns(db)} cells)")
+        elif mismatches or pattern_cells:
+            sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Start-up warm-up for cold autoscale instances.
+
+warm_up() runs once per process (app.py wraps it in st.cache_resource): it creates the
+schema, opens the first pooled connection and loads the settings row, then imports the
+heavy charting modules on a background thread shortly after, so the History stage
+doesn't pay for them on first use and the first render doesn't compete with them.
+It also starts the metrics file exporter (see telemetry) and the backup scheduler (see
+backup_helpers), and resumes queued background jobs (see job_helpers).
+"""
+import importlib
+import threading
+from sqlalchemy import text
+from database import SessionLocal, engine, init_db
+from settings_helpers import get_or_create_settings
+from job_helpers import recover_jobs
+from backup_helpers import start_backup_scheduler
+from changelog_helpers import start_prune_scheduler
+from telemetry import start_file_exporter
+
+# Only needed by the History stage; imported lazily there
+DEFERRED_MODULES = ("numpy", "plotly.graph_objects", "plotly.io")
+
+
+def preload_modules(modules=DEFERRED_MODULES, delay: float = 2.0) -> threading.Timer:
+    """Import modules on a daemon timer thread once the first render has had time to finish."""
+    def load():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+
+    timer = threading.Timer(delay, load)
+    timer.name = "warmup-imports"
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def warm_up(preload: bool = True) -> None:
+    """Create tables, open a pooled connection and create the settings row if needed."""
+    init_db()
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    db = SessionLocal()
+    try:
+        get_or_create_settings(db)
+        # Pick up background jobs a previous process queued or left running
+        recover_jobs(db)
+    finally:
+        db.close()
+
+    if preload:
+        preload_modules()
+    
+    # Writes the metrics registry to HEALTH_METRICS_FILE when it is set
+    start_file_exporter()
+    
+    # Queues backup jobs every HEALTH_BACKUP_INTERVAL_HOURS when it is set
+    start_backup_scheduler()
+
+    # Queues change-log pruning every HEALTH_PRUNE_INTERVAL_HOURS (default 24)
+    start_prune_scheduler()
+
+
+if __name__ == "__main__":
+    warm_up(preload=False)
+    print("Warm-up complete")